@@ -0,0 +1,547 @@
+"""Benchmarks for the x.py API.
+
+Generate a synthetic network and replay a mixed read/write workload
+against it with the Flask test client:
+
+    python bench.py run --stations 5000 --bookings 100000 --ops 20000
+    python bench.py run --stations 5000 --save-baseline bench_baseline.json
+    python bench.py run --stations 5000 --baseline bench_baseline.json
+
+or only write the generated data, e.g. to load into a dev server:
+
+    python bench.py generate --stations 100000 --bookings 1000000 -o data/railways.json
+
+Networks are reproducible from --seed. Each run loads the data in a fresh
+child process so that load time and peak RSS belong to the app alone.
+"""
+import argparse
+import heapq
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+try:
+    import resource
+except ImportError:  # no getrusage on Windows: peak RSS is not reported there
+    resource = None
+
+# Kept in step with FARE_CONFIG and SEAT_CAPACITY in x.py
+TRAIN_TYPES = {  # type -> (fare multiplier, speed range in km/h)
+    'Rajdhani Express': (1.6, (110, 130)),
+    'Shatabdi Express': (1.6, (100, 130)),
+    'Duronto Express': (1.6, (100, 120)),
+    'Garib Rath Express': (1.3, (80, 100)),
+    'Sampark Kranti Express': (1.3, (80, 100)),
+    'Superfast Express': (1.2, (75, 95)),
+    'Jan Shatabdi Express': (1.1, (70, 90)),
+    'Intercity Express': (1.0, (60, 80)),
+    'Mail Express': (1.0, (55, 75)),
+    'Passenger Special': (0.8, (35, 55))
+}
+CLASS_FARE_PER_KM = {
+    'sleeper': 0.6,
+    '3ac': 1.5,
+    '2ac': 2.2,
+    '1ac': 4.0,
+    'chair car': 1.8,
+    'executive chair car': 3.0
+}
+NAME_PARTS = (
+    ('Ram', 'Shiv', 'Hari', 'Chandra', 'Raj', 'Kishan', 'Sultan', 'Bhim', 'Lakshmi', 'Devi',
+     'Nava', 'Anand', 'Sita', 'Gopal', 'Kali', 'Moti', 'Sona', 'Bala', 'Jai', 'Indra'),
+    ('pur', 'nagar', 'abad', 'ganj', 'garh', 'kot', 'wadi', 'palli', 'puram', 'bagh')
+)
+LAT_RANGE = (8.0, 33.0)
+LON_RANGE = (68.0, 97.0)
+BOOKING_DAYS = 60  # bookings are spread over this many days from --start-date
+
+DEFAULT_MIX = 'search=50,book=20,cancel=8,closure=8,trains_add=2,get_count=12'
+BASELINE_METRICS = ('p50_ms', 'p99_ms')
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# --------------------------
+# Network Generator
+# --------------------------
+
+def station_code(n):
+    """Four-letter station code for the n-th station (AAAA, AAAB, ...)"""
+    letters = []
+    for _ in range(4):
+        n, r = divmod(n, 26)
+        letters.append(chr(65 + r))
+    code = ''.join(reversed(letters))
+    return code if n == 0 else f"{code}{n}"
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * 6371.0 * math.asin(math.sqrt(min(1.0, a)))
+
+def format_clock(minutes):
+    minutes = int(round(minutes)) % (24 * 60)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def generate_network(stations=1000, trains=None, bookings=0, seed=1, start_date='2025-06-01'):
+    """Build a railways.json document with the given number of records.
+
+    Stations grow outwards from a few hubs, each new one placed 20-80 km
+    from an existing station and linked to it, so the network is
+    connected; a grid lookup then adds a link or two to nearby stations
+    to close loops. Trains are random walks over the tracks with timings
+    derived from distance and speed, and bookings pick a train, segment,
+    class and day uniformly. The same arguments give the same document.
+    """
+    rng = random.Random(seed)
+    trains = max(1, stations // 5) if trains is None else trains
+    cell = 0.25  # degrees per grid cell for neighbour lookup
+    grid = {}
+    coords = []
+    station_list = []
+    tracks = []
+    adjacency = [[] for _ in range(stations)]
+    linked = set()
+
+    def cell_of(lat, lon):
+        return int(lat // cell), int(lon // cell)
+
+    def link(a, b):
+        if a == b or (min(a, b), max(a, b)) in linked:
+            return
+        linked.add((min(a, b), max(a, b)))
+        distance = haversine_km(*coords[a], *coords[b]) * rng.uniform(1.05, 1.3)
+        tracks.append({
+            'source': station_list[a]['id'],
+            'destination': station_list[b]['id'],
+            'distance': round(distance, 1),
+            'bidirectional': True,
+            'capacity': rng.choice((10, 15, 20, 25, 30)),
+            'weight': round(distance)
+        })
+        adjacency[a].append((b, distance))
+        adjacency[b].append((a, distance))
+
+    hubs = max(1, min(stations, stations // 2000 + 3))
+    for n in range(stations):
+        if n < hubs:
+            lat, lon = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+            parent = n - 1 if n else None
+        else:
+            for _ in range(8):  # prefer spots that are not crowded yet
+                parent = rng.randrange(n)
+                bearing = rng.uniform(0, 2 * math.pi)
+                step = rng.uniform(20, 80) / 111.0
+                lat = min(max(coords[parent][0] + step * math.sin(bearing), LAT_RANGE[0]), LAT_RANGE[1])
+                lon = min(max(coords[parent][1] + step * math.cos(bearing), LON_RANGE[0]), LON_RANGE[1])
+                if len(grid.get(cell_of(lat, lon), ())) < 4:
+                    break
+        coords.append((lat, lon))
+        station_list.append({
+            'id': station_code(n),
+            'name': f"{rng.choice(NAME_PARTS[0])}{rng.choice(NAME_PARTS[1])} {station_code(n)}",
+            'latitude': round(lat, 4),
+            'longitude': round(lon, 4)
+        })
+        if parent is not None:
+            link(n, parent)
+        gx, gy = cell_of(lat, lon)
+        extra = rng.randint(0, 2)
+        if extra:
+            near = [m for dx in (-1, 0, 1) for dy in (-1, 0, 1) for m in grid.get((gx + dx, gy + dy), ())]
+            for m in heapq.nsmallest(extra, near, key=lambda m: (coords[m][0] - lat) ** 2 + (coords[m][1] - lon) ** 2):
+                link(n, m)
+        grid.setdefault((gx, gy), []).append(n)
+
+    train_list = []
+    for t in range(trains):
+        route = [rng.randrange(stations)]
+        seen = {route[0]}
+        distances = [0.0]
+        for _ in range(rng.randint(4, 30) - 1):
+            options = [(m, d) for m, d in adjacency[route[-1]] if m not in seen]
+            if not options:
+                break
+            m, d = rng.choice(options)
+            route.append(m)
+            seen.add(m)
+            distances.append(distances[-1] + d)
+        if len(route) < 2:
+            continue
+        kind = rng.choice(list(TRAIN_TYPES))
+        speed = rng.randint(*TRAIN_TYPES[kind][1])
+        departure = rng.randrange(24 * 60)
+        timings = [format_clock(departure + distance / speed * 60 + 2 * stop)
+                   for stop, distance in enumerate(distances)]
+        ids = [station_list[m]['id'] for m in route]
+        train_list.append({
+            'id': str(10000 + t),
+            'name': f"{ids[0]} - {ids[-1]} {kind}",
+            'speed': speed,
+            'route': ids,
+            'timings': timings,
+            'type': kind,
+            '_distances': distances  # dropped below; used to price bookings
+        })
+
+    first_day = date.fromisoformat(start_date)
+    booking_list = []
+    for b in range(bookings if train_list else 0):
+        train = rng.choice(train_list)
+        i = rng.randrange(len(train['route']) - 1)
+        j = rng.randrange(i + 1, len(train['route']))
+        class_type = rng.choice(list(CLASS_FARE_PER_KM))
+        count = rng.choice((1, 1, 1, 2, 2, 3, 4))
+        distance = train['_distances'][j] - train['_distances'][i]
+        fare = distance * CLASS_FARE_PER_KM[class_type] * TRAIN_TYPES[train['type']][0] * count
+        booking_list.append({
+            'bookingId': f"BN{b:09d}",
+            'trainId': train['id'],
+            'trainName': train['name'],
+            'from': train['route'][i],
+            'to': train['route'][j],
+            'date': (first_day + timedelta(days=rng.randrange(BOOKING_DAYS))).isoformat(),
+            'class': class_type,
+            'quota': 'general',
+            'fare': f"{fare:.2f}",
+            'departureTime': train['timings'][i],
+            'arrivalTime': train['timings'][j],
+            'status': 'confirmed' if rng.random() < 0.9 else 'cancelled',
+            'passengerCount': count,
+            'passengerDetails': {'name': f"passenger{b}", 'age': str(rng.randint(5, 85)),
+                                 'gender': rng.choice(('male', 'female'))}
+        })
+    for train in train_list:
+        del train['_distances']
+
+    return {
+        'stations': station_list,
+        'tracks': tracks,
+        'trains': train_list,
+        'bookings': booking_list,
+        'track_closures': [],
+        'station_closures': []
+    }
+
+# --------------------------
+# Workload
+# --------------------------
+
+def parse_mix(text):
+    """Parse 'op=weight,...' into {op: weight}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in OPERATIONS:
+            raise ValueError(f"unknown operation {name.strip()!r}, expected one of {', '.join(OPERATIONS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+class Workload:
+    """Seeded stream of requests against the loaded network.
+
+    Each operation picks its arguments from the data the app holds and
+    returns (method, url, json body); responses feed back through
+    ``done`` so later cancels and closure removals target records the
+    workload created itself.
+    """
+
+    def __init__(self, data, seed, start_date):
+        self.rng = random.Random(seed)
+        self.trains = [t for t in data['trains'] if len(t.get('route', [])) >= 2]
+        self.stations = [s['id'] for s in data['stations']]
+        self.tracks = [(t['source'], t['destination']) for t in data['tracks']]
+        self.adjacency = {}
+        for source, destination in self.tracks:
+            self.adjacency.setdefault(source, []).append(destination)
+            self.adjacency.setdefault(destination, []).append(source)
+        self.bookings = [b['bookingId'] for b in data['bookings']]
+        self.closures = []
+        self.first_day = date.fromisoformat(start_date)
+        self.serial = 0
+
+    def day(self):
+        return (self.first_day + timedelta(days=self.rng.randrange(BOOKING_DAYS))).isoformat()
+
+    def search(self):
+        train = self.rng.choice(self.trains)
+        i = self.rng.randrange(len(train['route']) - 1)
+        j = self.rng.randrange(i + 1, len(train['route']))
+        return 'GET', f"/api/search?from={train['route'][i]}&to={train['route'][j]}&date={self.day()}", None
+
+    def book(self):
+        train = self.rng.choice(self.trains)
+        i = self.rng.randrange(len(train['route']) - 1)
+        j = self.rng.randrange(i + 1, len(train['route']))
+        self.serial += 1
+        return 'POST', '/api/bookings', {
+            'bookingId': f"BW{self.serial:09d}",
+            'trainId': train['id'],
+            'trainName': train.get('name'),
+            'date': self.day(),
+            'from': train['route'][i],
+            'to': train['route'][j],
+            'class': self.rng.choice(list(CLASS_FARE_PER_KM)),
+            'quota': 'general',
+            'passengerCount': self.rng.choice((1, 1, 2, 3)),
+            'passengerDetails': {'name': f"bench{self.serial}", 'age': '30', 'gender': 'female'}
+        }
+
+    def cancel(self):
+        if not self.bookings:
+            return self.book()
+        index = self.rng.randrange(len(self.bookings))
+        self.bookings[index], self.bookings[-1] = self.bookings[-1], self.bookings[index]
+        return 'DELETE', f"/api/bookings/{self.bookings.pop()}", None
+
+    def closure(self):
+        if self.closures and self.rng.random() < 0.5:
+            kind, closure_id = self.closures.pop(self.rng.randrange(len(self.closures)))
+            return 'DELETE', f"/api/{kind}-closures/{closure_id}", None
+        if self.tracks and self.rng.random() < 0.5:
+            source, destination = self.rng.choice(self.tracks)
+            return 'POST', '/api/add-track-closure', {
+                'source': source, 'destination': destination, 'reason': 'bench', 'duration': 1
+            }
+        return 'POST', '/api/add-station-closure', {
+            'stationId': self.rng.choice(self.stations), 'reason': 'bench', 'duration': 1
+        }
+
+    def trains_add(self):
+        route = [self.rng.choice(self.stations)]
+        while len(route) < 10:
+            options = [s for s in self.adjacency.get(route[-1], ()) if s not in route]
+            if not options:
+                break
+            route.append(self.rng.choice(options))
+        self.serial += 1
+        return 'POST', '/api/trains-add', {
+            'id': f"BT{self.serial}",
+            'name': f"Bench {self.serial}",
+            'speed': 80,
+            'type': 'Intercity Express',
+            'route': route,
+            'timings': [format_clock(480 + 45 * n) for n in range(len(route))]
+        }
+
+    def get_count(self):
+        return 'GET', '/api/get_count', None
+
+    def done(self, operation, status, body):
+        """Remember what a successful write created"""
+        if status != 200 or not isinstance(body, dict):
+            return
+        if operation == 'book' and body.get('message') == 'Booking successful':
+            self.bookings.append(body['bookingId'])
+        elif operation == 'closure' and 'closure' in body:
+            self.closures.append((body['closure']['type'], body['closure']['id']))
+
+OPERATIONS = ('search', 'book', 'cancel', 'closure', 'trains_add', 'get_count')
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))]
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def replay(args):
+    """Load x.py from the current directory and run the workload (child process)"""
+    started = time.perf_counter()
+    import x
+    data = x.store.get()
+    load_seconds = time.perf_counter() - started
+    load_rss = peak_rss()
+
+    workload = Workload(data, args.seed, args.start_date)
+    mix = parse_mix(args.mix)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    client = x.app.test_client()
+    latencies = {name: [] for name in names}
+    errors = dict.fromkeys(names, 0)
+
+    total = 0.0
+    for n in range(args.warmup + args.ops):
+        name = workload.rng.choices(names, weights)[0]
+        method, url, body = getattr(workload, name)()
+        begin = time.perf_counter()
+        response = client.open(url, method=method, json=body)
+        response.get_data()
+        elapsed = time.perf_counter() - begin
+        workload.done(name, response.status_code, response.get_json(silent=True) if method != 'GET' else None)
+        if n < args.warmup:
+            continue
+        total += elapsed
+        latencies[name].append(elapsed)
+        if response.status_code >= 400:
+            errors[name] += 1
+
+    operations = {}
+    for name in names:
+        values = sorted(latencies[name])
+        if not values:
+            continue
+        operations[name] = {
+            'count': len(values),
+            'errors': errors[name],
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'mean_ms': sum(values) / len(values) * 1000
+        }
+    return {
+        'config': {k: getattr(args, k) for k in ('stations', 'trains', 'bookings', 'seed', 'ops', 'mix', 'storage')},
+        'load_seconds': load_seconds,
+        'load_rss_bytes': load_rss,
+        'peak_rss_bytes': peak_rss(),
+        'throughput_ops': args.ops / total if total else None,
+        'operations': operations
+    }
+
+# --------------------------
+# Reporting
+# --------------------------
+
+def format_bytes(n):
+    return '-' if n is None else f"{n / 2 ** 20:.1f} MB"
+
+def compare(result, baseline, tolerance):
+    """Lines comparing a result with a baseline, and whether anything regressed"""
+    lines = []
+    regressed = False
+    for name, stats in result['operations'].items():
+        before = baseline.get('operations', {}).get(name)
+        if not before:
+            continue
+        for metric in BASELINE_METRICS:
+            change = stats[metric] / before[metric] - 1 if before[metric] else 0.0
+            flag = ''
+            if change > tolerance:
+                flag = '  REGRESSION'
+                regressed = True
+            lines.append(f"  {name:<12} {metric:<7} {before[metric]:9.3f} -> {stats[metric]:9.3f} ms ({change:+.1%}){flag}")
+    if result['throughput_ops'] and baseline.get('throughput_ops'):
+        change = result['throughput_ops'] / baseline['throughput_ops'] - 1
+        flag = ''
+        if -change > tolerance:
+            flag = '  REGRESSION'
+            regressed = True
+        lines.append(f"  {'throughput':<20} {baseline['throughput_ops']:9.1f} -> {result['throughput_ops']:9.1f} ops/s ({change:+.1%}){flag}")
+    if baseline.get('config') != result['config']:
+        lines.append("  note: baseline was recorded with a different configuration")
+    return lines, regressed
+
+def report(result):
+    config = result['config']
+    lines = [
+        f"network: {config['stations']} stations, {config['trains']} trains, {config['bookings']} bookings "
+        f"(seed {config['seed']}, {config['storage']} storage)",
+        f"load: {result['load_seconds']:.2f}s, RSS after load {format_bytes(result['load_rss_bytes'])}, "
+        f"peak RSS {format_bytes(result['peak_rss_bytes'])}",
+        f"throughput: {result['throughput_ops'] or 0:.1f} ops/s over {config['ops']} operations",
+        f"  {'operation':<12} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}"
+    ]
+    for name, stats in result['operations'].items():
+        lines.append(f"  {name:<12} {stats['count']:>7} {stats['errors']:>7} {stats['p50_ms']:>9.3f} "
+                     f"{stats['p99_ms']:>9.3f} {stats['mean_ms']:>9.3f}")
+    return lines
+
+# --------------------------
+# Command Line
+# --------------------------
+
+def run(args):
+    """Generate the network into a scratch directory and replay it in a child process"""
+    workdir = tempfile.mkdtemp(prefix='railbench-')
+    try:
+        os.makedirs(os.path.join(workdir, 'data'))
+        network = generate_network(args.stations, args.trains, args.bookings, args.seed, args.start_date)
+        args.trains = len(network['trains'])
+        with open(os.path.join(workdir, 'data', 'railways.json'), 'w') as f:
+            json.dump(network, f)
+        del network
+
+        result_file = os.path.join(workdir, 'result.json')
+        env = dict(os.environ, RAILWAY_STORAGE=args.storage, PYTHONPATH=HERE)
+        command = [sys.executable, os.path.abspath(__file__), 'replay', '--result', result_file]
+        for name in ('stations', 'trains', 'bookings', 'seed', 'ops', 'warmup', 'mix', 'storage', 'start_date'):
+            command += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+        if args.storage == 'sqlite':
+            subprocess.run([sys.executable, os.path.join(HERE, 'x.py'), 'migrate'],
+                           cwd=workdir, env=env, check=True, stdout=subprocess.DEVNULL)
+        subprocess.run(command, cwd=workdir, env=env, check=True, stdout=subprocess.DEVNULL)
+        with open(result_file) as f:
+            result = json.load(f)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print('\n'.join(report(result)))
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"baseline saved to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            lines, regressed = compare(result, json.load(f), args.tolerance)
+        print(f"compared with {args.baseline} (tolerance {args.tolerance:.0%}):")
+        print('\n'.join(lines))
+        return 1 if regressed else 0
+    return 0
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the x.py API on a synthetic network")
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate = commands.add_parser('generate', help="write a synthetic railways.json")
+    runner = commands.add_parser('run', help="generate a network and replay a workload against it")
+    child = commands.add_parser('replay')  # internal: the measured child process of 'run'
+    for sub in (generate, runner, child):
+        sub.add_argument('--stations', type=int, default=1000)
+        sub.add_argument('--trains', type=int, default=None, help="default: one per five stations")
+        sub.add_argument('--bookings', type=int, default=10000)
+        sub.add_argument('--seed', type=int, default=1)
+        sub.add_argument('--start-date', default='2025-06-01', help="first day bookings are spread over")
+    generate.add_argument('-o', '--output', default='-', help="file to write, '-' for stdout")
+    for sub in (runner, child):
+        sub.add_argument('--ops', type=int, default=5000, help="measured operations")
+        sub.add_argument('--warmup', type=int, default=200, help="operations run before measuring")
+        sub.add_argument('--mix', default=DEFAULT_MIX, help=f"operation weights (default {DEFAULT_MIX})")
+        sub.add_argument('--storage', choices=('json', 'sqlite'), default='json')
+    runner.add_argument('--baseline', help="compare with a result saved by --save-baseline")
+    runner.add_argument('--save-baseline', help="save this result as a baseline")
+    runner.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed slowdown before a metric counts as a regression (default 0.2)")
+    child.add_argument('--result', required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        network = generate_network(args.stations, args.trains, args.bookings, args.seed, args.start_date)
+        if args.output == '-':
+            json.dump(network, sys.stdout)
+        else:
+            with open(args.output, 'w') as f:
+                json.dump(network, f, indent=2)
+        return 0
+    if args.command == 'replay':
+        parse_mix(args.mix)
+        result = replay(args)
+        with open(args.result, 'w') as f:
+            json.dump(result, f)
+        return 0
+    parse_mix(args.mix)
+    return run(args)
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,18 @@
+# gunicorn settings for wsgi:app
+#
+# Every worker keeps its own in-memory copy of data/railways.json. Workers
+# coordinate writes through an flock on data/railways.lock and catch up
+# with each other's journal entries before serving, so any number of
+# workers and threads can share one data directory.
+import multiprocessing
+import os
+
+bind = os.environ.get('RAILWAY_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('RAILWAY_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('RAILWAY_THREADS', 8))
+worker_class = 'gthread'
+timeout = 60
+
+# Load the app in each worker rather than the master, so no worker
+# inherits the master's open journal handle or background threads.
+preload_app = False
@@ -1,52 +1,10 @@
 // Global data variable
 let trainData = {
-    stations: [],
-    tracks: [],
-    trains: []
+    stations: []
 };
 
-// Fare calculation parameters
-const fareConfig = {
-
-    baseFarePerKm: {
-        'sleeper': 0.6,
-        '3ac': 1.5,
-        '2ac': 2.2,
-        '1ac': 4.0,
-        'chair car': 1.8,
-        'executive chair car': 3.0
-    },
-    quotaMultipliers: {
-        'general': 1.0,
-        'tatkal': 1.3,
-        'premium tatkal': 1.5,
-        'ladies': 0.75,
-        'senior citizen': 0.5
-    },
-
-    trainMultipliers: {
-        'default': 1.0, // fallback multiplier
-
-        // Premium high-speed trains
-        'Rajdhani Express': 1.6,
-        'Shatabdi Express': 1.6,
-        'Duronto Express': 1.6,
-
-        // Semi-premium/long-distance fast trains
-        'Garib Rath Express': 1.3,
-        'Sampark Kranti Express': 1.3,
-        'Superfast Express': 1.2,
-        'Jan Shatabdi Express': 1.1,
-        'Intercity Express': 1.0,
-
-        // Regular express/mail trains
-        'Mail Express': 1.0,
-
-        // Slow trains
-        'Passenger Special': 0.8
-    }
-
-};
+// Latest search results from the server, keyed by train id
+let searchResults = {};
 
 // DOM Content Loaded
 document.addEventListener('DOMContentLoaded', function () {
@@ -69,15 +27,15 @@ function swap() {
     to.value = temp;
 }
 
-// Load train data from server
+// Load station list from server (trains are searched server-side)
 function loadTrainData() {
-    fetch('http://localhost:5000/api/data')
+    fetch('http://localhost:5000/api/stations')
         .then(res => {
             if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
             return res.json();
         })
-        .then(data => {
-            trainData = data;
+        .then(stations => {
+            trainData.stations = stations;
             populateStationDropdowns();
         })
         .catch(err => {
@@ -122,15 +80,9 @@ function setupEventListeners() {
                 const from = document.getElementById('from').value;
                 const to = document.getElementById('to').value;
                 const date = document.getElementById('date').value;
-                const classType = document.getElementById('class').value;
-                const quota = document.getElementById('quota').value;
 
                 if (from && to && date) {
-                    let results = findAvailableTrains(from, to);
-                    results = this.dataset.sort === 'fare' ?
-                        sortByFare(results, classType, quota) :
-                        sortByTime(results);
-                    displayResults(results, date, classType, quota);
+                    searchTrains();
                 }
             }
         });
@@ -180,15 +132,13 @@ async function handleModalSubmit(e) {
         const classType = form.dataset.classType;
         const quota = form.dataset.quota;
 
-        const train = trainData.trains.find(t => t.id === trainId);
+        const train = searchResults[trainId];
         const from = document.getElementById('from').value;
         const to = document.getElementById('to').value;
         const fromStation = trainData.stations.find(s => s.id === from);
         const toStation = trainData.stations.find(s => s.id === to);
 
-        const distance = calculateDistance(train.route, from, to);
-        const farePerPerson = calculateFare(distance, classType, quota, train.type, train.speed);
-        const totalFare = farePerPerson * passengerCount;
+        const totalFare = train.fare * passengerCount;
 
         const bookingData = {
             bookingId: generateBookingId(),
@@ -202,8 +152,8 @@ async function handleModalSubmit(e) {
             class: classType,
             quota,
             fare: totalFare.toFixed(2),
-            departureTime: train.timings[train.route.indexOf(from)],
-            arrivalTime: train.timings[train.route.indexOf(to)],
+            departureTime: train.departureTime,
+            arrivalTime: train.arrivalTime,
             bookingTime: new Date().toISOString(),
             status: 'confirmed',
             passengerCount: parseInt(passengerCount),
@@ -262,7 +212,7 @@ async function handleModalSubmit(e) {
 }
 
 window.bookTicket = function (trainId, date, classType, quota) {
-    const train = trainData.trains.find(t => t.id === trainId);
+    const train = searchResults[trainId];
     if (!train) {
         showCaptureModal("Train not found", "error");
 
@@ -275,12 +225,11 @@ window.bookTicket = function (trainId, date, classType, quota) {
     const fromStation = trainData.stations.find(s => s.id === from);
     const toStation = trainData.stations.find(s => s.id === to);
 
-    const distance = calculateDistance(train.route, from, to);
-    const fare = calculateFare(distance, classType, quota, train.type, train.speed);
+    const fare = train.fare;
 
     document.getElementById('modal-train-name').textContent = `${train.name} (${train.id})`;
     document.getElementById('modal-train-timings').textContent =
-        `Dep: ${train.timings[train.route.indexOf(from)]} (${fromStation.name}) → Arr: ${train.timings[train.route.indexOf(to)]} (${toStation.name})`;
+        `Dep: ${train.departureTime} (${fromStation.name}) → Arr: ${train.arrivalTime} (${toStation.name})`;
     document.getElementById('modal-train-class').textContent =
         `Class: ${classType} | Quota: ${quota.charAt(0).toUpperCase() + quota.slice(1)}`;
     document.getElementById('modal-train-fare').textContent = `Approx. Fare: ₹${fare.toFixed(2)} per person`;
@@ -454,72 +403,22 @@ function searchTrains() {
         return;
     }
 
-    const fromStation = trainData.stations.find(s => s.id === from);
-    const toStation = trainData.stations.find(s => s.id === to);
-
-    if (!fromStation || !toStation) {
-        showError("Invalid station selection");
-        return;
-    }
-
-    let results = findAvailableTrains(from, to);
-    results = sortBy === 'fare' ?
-        sortByFare(results, classType, quota) :
-        sortByTime(results);
-
-    displayResults(results, date, classType, quota);
-}
-
-function findAvailableTrains(source, destination) {
-    const availableTrains = trainData.trains.filter(train => {
-        const sourceIndex = train.route.indexOf(source);
-        const destIndex = train.route.indexOf(destination);
-
-        if (sourceIndex === -1 || destIndex === -1 || sourceIndex >= destIndex) {
-            return false;
-        }
-
-        for (let i = sourceIndex; i < destIndex; i++) {
-            const track = findTrack(train.route[i], train.route[i + 1]);
-            if (!track) return false;
-        }
-
-        return true;
-    });
-
-    return availableTrains.map(train => {
-        const sourceIndex = train.route.indexOf(source);
-        const destIndex = train.route.indexOf(destination);
-
-        let totalDistance = 0;
-        for (let i = sourceIndex; i < destIndex; i++) {
-            const track = findTrack(train.route[i], train.route[i + 1]);
-            totalDistance += track.distance;
-        }
-
-        const [depH, depM] = train.timings[sourceIndex].split(':').map(Number);
-        const [arrH, arrM] = train.timings[destIndex].split(':').map(Number);
-        let durationMinutes = (arrH * 60 + arrM) - (depH * 60 + depM);
-        if (durationMinutes < 0) durationMinutes += 1440;
-
-        return {
-            id: train.id,
-            name: train.name,
-            type: train.type || 'Express',
-            speed: train.speed || 80,
-            departureTime: train.timings[sourceIndex],
-            arrivalTime: train.timings[destIndex],
-            duration: formatDuration(durationMinutes),
-            durationMinutes: durationMinutes,
-            distance: totalDistance,
-            route: train.route.slice(sourceIndex, destIndex + 1),
-            routeStations: train.route.slice(sourceIndex, destIndex + 1).map(stationId => {
-                const station = trainData.stations.find(s => s.id === stationId);
-                return station ? station.name : stationId;
-            }),
-            timings: train.timings.slice(sourceIndex, destIndex + 1)
-        };
-    });
+    const params = new URLSearchParams({ from, to, date, class: classType, quota, sort: sortBy });
+    fetch(`http://localhost:5000/api/search?${params}`)
+        .then(async res => {
+            const body = await res.json();
+            if (!res.ok) throw new Error(body.message || `HTTP error! status: ${res.status}`);
+            return body;
+        })
+        .then(results => {
+            searchResults = {};
+            results.forEach(train => { searchResults[train.id] = train; });
+            displayResults(results, date, classType, quota);
+        })
+        .catch(err => {
+            console.error("Error searching trains:", err);
+            showError(err.message || "Error searching trains. Please try again.");
+        });
 }
 
 function formatDuration(minutes) {
@@ -528,35 +427,6 @@ function formatDuration(minutes) {
     return `${hours}h ${mins}m`;
 }
 
-function sortByFare(trains, classType, quota) {
-    return [...trains].sort((a, b) => {
-        const fareA = calculateFare(a.distance, classType, quota, a.type, a.speed);
-        const fareB = calculateFare(b.distance, classType, quota, b.type, b.speed);
-        return fareA - fareB;
-    });
-}
-
-function sortByTime(trains) {
-    return [...trains].sort((a, b) => a.durationMinutes - b.durationMinutes);
-}
-
-function findTrack(source, destination) {
-    return trainData.tracks.find(track =>
-        (track.source === source && track.destination === destination) ||
-        (track.bidirectional && track.source === destination && track.destination === source)
-    );
-}
-
-function calculateFare(distance, classType, quota, trainType) {
-    const baseFare = fareConfig.baseFarePerKm[classType];
-    const trainFactor = fareConfig.trainMultipliers[trainType] || fareConfig.trainMultipliers.default;
-    const quotaFactor = fareConfig.quotaMultipliers[quota];
-
-    let fare = distance * baseFare * trainFactor * quotaFactor;
-    return fare;
-}
-
-
 function displayResults(trains, date, classType, quota) {
     const resultsContainer = document.getElementById('results');
     resultsContainer.innerHTML = '';
@@ -572,7 +442,7 @@ function displayResults(trains, date, classType, quota) {
     }
 
     trains.forEach(train => {
-        const fare = calculateFare(train.distance, classType, quota, train.type, train.speed);
+        const fare = train.fare;
         const routeSummary = train.routeStations.map((station, index) =>
             `${station} (${train.timings[index]})`
         ).join(' → ');
@@ -622,12 +492,15 @@ function displayResults(trains, date, classType, quota) {
     });
 }
 
+const BOOKINGS_PAGE_SIZE = 50;
+let bookedTickets = [];
+let bookingsCursor = null;
+
 async function viewBookedTickets() {
+    bookedTickets = [];
+    bookingsCursor = null;
     try {
-        const response = await fetch('http://localhost:5000/api/bookings');
-        if (!response.ok) throw new Error('Failed to fetch bookings');
-        const bookings = await response.json();
-        displayBookings(bookings);
+        await loadMoreBookings();
         showCaptureModal(`Booked tickets are ...`, "success");
     } catch (error) {
         console.error('Error fetching bookings:', error);
@@ -637,6 +510,31 @@ async function viewBookedTickets() {
     }
 }
 
+// Fetch the next page of bookings and re-render the list with a "Load more" button if needed
+async function loadMoreBookings() {
+    const params = new URLSearchParams({ limit: BOOKINGS_PAGE_SIZE });
+    if (bookingsCursor) params.set('cursor', bookingsCursor);
+    const response = await fetch(`http://localhost:5000/api/bookings?${params}`);
+    if (!response.ok) throw new Error('Failed to fetch bookings');
+    const page = await response.json();
+    bookedTickets = bookedTickets.concat(page.bookings);
+    bookingsCursor = page.nextCursor;
+    displayBookings(bookedTickets);
+
+    if (bookingsCursor) {
+        const moreBtn = document.createElement('button');
+        moreBtn.className = 'btn btn-primary mt-3';
+        moreBtn.innerHTML = '<i class="fas fa-chevron-down mr-2"></i> Load more';
+        moreBtn.addEventListener('click', () => {
+            loadMoreBookings().catch(error => {
+                console.error('Error fetching bookings:', error);
+                showCaptureModal("Failed to load bookings. Please try again.", "error");
+            });
+        });
+        document.querySelector('#results .bookings-list').appendChild(moreBtn);
+    }
+}
+
 function displayBookings(bookings) {
     const resultsContainer = document.getElementById('results');
     resultsContainer.innerHTML = '';
@@ -715,19 +613,6 @@ function displayBookings(bookings) {
     resultsContainer.appendChild(bookingsList);
 }
 
-function calculateDistance(route, from, to) {
-    const fromIndex = route.indexOf(from);
-    const toIndex = route.indexOf(to);
-    let distance = 0;
-
-    for (let i = fromIndex; i < toIndex; i++) {
-        const track = findTrack(route[i], route[i + 1]);
-        if (track) distance += track.distance;
-    }
-
-    return distance;
-}
-
 function generateBookingId() {
     return 'B' + Math.random().toString(36).substr(2, 8).toUpperCase();
 }
@@ -30,6 +30,7 @@ let graph = {
 
 // Global variables
 let currentEditingTrainId = null;
+let dataVersion = null;  // version token of the data we hold, for /api/changes
 let currentWidth = 750;
 let formSubmitted = false;
 // let currentMST = [];
@@ -175,7 +176,27 @@ function setupTabSwitching() {
     });
 }
 
-function loadData() {
+// Key of a record within its collection, matching the server's change feed
+function recordKey(collection, record) {
+    if (collection === 'tracks') return `${record.source}\u0000${record.destination}`;
+    if (collection === 'bookings') return record.bookingId;
+    return record.id;
+}
+
+function applyChanges(changes) {
+    Object.entries(changes).forEach(([collection, delta]) => {
+        const records = new Map((data[collection] || []).map(r => [recordKey(collection, r), r]));
+        delta.deleted.forEach(key => {
+            records.delete(Array.isArray(key) ? key.join('\u0000') : key);
+        });
+        delta.inserted.concat(delta.updated).forEach(record => {
+            records.set(recordKey(collection, record), record);
+        });
+        data[collection] = Array.from(records.values());
+    });
+}
+
+function fetchAllData() {
     return fetch('http://localhost:5000/api/data')
         .then(res => {
             if (!res.ok) {
@@ -185,6 +206,31 @@ function loadData() {
         })
         .then(backendData => {
             data = backendData;
+            dataVersion = backendData.version;
+        });
+}
+
+// Fetch only what changed since the last load, falling back to the full data
+function fetchDataChanges() {
+    return fetch(`http://localhost:5000/api/changes?since=${encodeURIComponent(dataVersion)}`)
+        .then(res => {
+            if (!res.ok) {
+                throw new Error(`HTTP error! status: ${res.status}`);
+            }
+            return res.json();
+        })
+        .then(feed => {
+            if (feed.reset) {
+                return fetchAllData();
+            }
+            applyChanges(feed.changes);
+            dataVersion = feed.version;
+        });
+}
+
+function loadData() {
+    return (dataVersion ? fetchDataChanges() : fetchAllData())
+        .then(() => {
             buildGraph();
             render();
             updateDropdowns();
@@ -1151,44 +1197,30 @@ function calculateMST() {
     resultContainer.innerHTML = '';
     clearHighlights();
 
-    // Prim's algorithm
-    const mst = [];
-    const visited = new Set();
-    const edges = [];
-    let totalWeight = 0;
-    const startStation = data.stations[0];
-    visited.add(startStation.id);
-
-    while (visited.size < data.stations.length) {
-        edges.length = 0;
-        visited.forEach(u => {
-            graph.adjacencyList[u]?.forEach(edge => {
-                if (!visited.has(edge.destination)) {
-                    edges.push({
-                        u,
-                        v: edge.destination,
-                        weight: edge.distance,
-                        trackId: edge.trackId
-                    });
-                }
-            });
+    fetch('http://localhost:5000/api/mst')
+        .then(response => response.json())
+        .then(result => {
+            if (result.status !== 'success') {
+                showAlert(resultContainer, result.message || "Could not calculate MST.");
+                return;
+            }
+            if (!result.connected) {
+                showAlert(resultContainer, "Network is disconnected. Cannot create spanning tree.");
+                return;
+            }
+            const mst = result.edges.map(edge => ({
+                u: edge.source,
+                v: edge.destination,
+                weight: edge.distance
+            }));
+            currentMST = mst;
+            showMSTResult(mst, result.totalWeight);
+            highlightMST();
+        })
+        .catch(error => {
+            console.error('Error calculating MST:', error);
+            showAlert(resultContainer, "Could not calculate MST.");
         });
-
-        if (edges.length === 0) break;
-        edges.sort((a, b) => a.weight - b.weight);
-        const minEdge = edges[0];
-        mst.push(minEdge);
-        visited.add(minEdge.v);
-        totalWeight += minEdge.weight;
-    }
-
-    if (visited.size === data.stations.length) {
-        currentMST = mst;
-        showMSTResult(mst, totalWeight);
-        highlightMST();
-    } else {
-        showAlert(resultContainer, "Network is disconnected. Cannot create spanning tree.");
-    }
 }
 
 
@@ -0,0 +1,75 @@
+import copy
+import json
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def railway(tmp_path_factory):
+    """The app module, running against a private copy of data/railways.json"""
+    workdir = tmp_path_factory.mktemp('railway')
+    shutil.copytree(os.path.join(ROOT, 'data'), workdir / 'data',
+                    ignore=shutil.ignore_patterns('railways.journal', 'railways.lock', 'railways.db*',
+                                                  'timetable.bin', 'profiles', 'jobs'))
+    cwd = os.getcwd()
+    os.chdir(workdir)  # x.py keeps its data paths relative to the working directory
+    try:
+        import x
+        x.store.get()
+        yield x
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def client(railway):
+    return railway.app.test_client()
+
+
+@pytest.fixture
+def train(railway):
+    """A train with at least three stops that can be priced end to end"""
+    index = railway.store.index
+    return next(
+        t for t in railway.store.get()['trains']
+        if len(t.get('route', [])) >= 3
+        and not railway.fare_engine.quote(index, t, t['route'][0], t['route'][-1], '1ac', 'general')[2]
+    )
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def backend(request, railway, tmp_path):
+    """(open a repository, path of the lock file) over a private copy of the data"""
+    json_path = str(tmp_path / 'railways.json')
+    with open(json_path, 'w') as f:
+        json.dump(copy.deepcopy(railway.store.get()), f)
+    if request.param == 'json':
+        def open_repo():
+            return railway.JsonRepository(json_path, railway.Journal(json_path + '.journal', 'always'))
+    else:
+        db_path = str(tmp_path / 'railways.db')
+        railway.migrate(json_path, db_path)
+
+        def open_repo():
+            return railway.SqliteRepository(db_path, 'always')
+    return open_repo, str(tmp_path / 'railways.lock')
+
+
+@pytest.fixture
+def stores(railway, backend, monkeypatch):
+    """Two stores on the same repository, like two workers; requests go to the first"""
+    open_repo, lock_path = backend
+    first = railway.NetworkStore(open_repo(), lock_path)
+    second = railway.NetworkStore(open_repo(), lock_path)
+    first.get()
+    second.get()
+    monkeypatch.setattr(railway, 'store', first)
+    yield first, second
+    first.repo.close()
+    second.repo.close()
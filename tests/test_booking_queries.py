@@ -0,0 +1,143 @@
+import csv
+import io
+import json
+import random
+
+import pytest
+
+DATES = ['2036-01-01', '2036-01-02', '2036-01-03', '2036-01-04', '2036-01-05']
+PASSENGER = {'passenger': 'query tester'}
+
+
+@pytest.fixture
+def booked(client, train):
+    """Ten bookings for one passenger: a confirmed 1ac and a waitlisted 2ac one per date"""
+    ids = []
+    for i, date in enumerate(DATES):
+        for status, class_type in (('confirmed', '1ac'), ('waitlisted', '2ac')):
+            booking = {'bookingId': f"QRY{len(ids):02d}", 'trainId': train['id'], 'date': date,
+                       'from': train['route'][0], 'to': train['route'][-1], 'class': class_type, 'status': status,
+                       'passengerDetails': {'name': '  Query Tester ', 'age': 30 + i, 'gender': 'F'}}
+            assert client.post('/api/bookings', json=booking).status_code == 200
+            ids.append(booking['bookingId'])
+    yield ids
+    for booking_id in ids:
+        assert client.delete(f"/api/bookings/{booking_id}").status_code == 200
+
+
+def query(client, **args):
+    response = client.get('/api/bookings', query_string=dict(PASSENGER, **args))
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_filters_combine(client, train, booked):
+    assert [b['bookingId'] for b in query(client)['bookings']] == booked
+    waitlisted = query(client, status='waitlisted')
+    assert [b['bookingId'] for b in waitlisted['bookings']] == booked[1::2]
+    assert waitlisted['nextCursor'] is None
+    assert [b['bookingId'] for b in query(client, date=DATES[2], **{'class': '1ac'})['bookings']] == ['QRY04']
+    assert query(client, trainId=train['id'], status='cancelled')['bookings'] == []
+    assert query(client, passenger='nobody by that name')['bookings'] == []
+
+
+@pytest.mark.parametrize('bounds, dates', [
+    ({'dateFrom': '2036-01-02', 'dateTo': '2036-01-04'}, DATES[1:4]),
+    ({'dateFrom': '2036-01-04'}, DATES[3:]),
+    ({'dateTo': '2036-01-01'}, DATES[:1]),
+    ({'dateFrom': '2036-01-06'}, []),
+])
+def test_date_range(client, booked, bounds, dates):
+    bookings = query(client, **bounds)['bookings']
+    assert [b['bookingId'] for b in bookings] == [b for b in booked if int(b[3:]) // 2 in map(DATES.index, dates)]
+    assert {b['date'] for b in bookings} == set(dates)
+
+
+def test_cursor_walks_every_page_once(client, booked):
+    pages = []
+    cursor = None
+    while True:
+        page = query(client, limit=3, **({'cursor': cursor} if cursor else {}))
+        pages.append([b['bookingId'] for b in page['bookings']])
+        cursor = page['nextCursor']
+        if cursor is None:
+            break
+        assert cursor == pages[-1][-1]
+    assert pages == [booked[0:3], booked[3:6], booked[6:9], booked[9:]]
+    # A cursor is just the last id seen, so a page can also start from any id
+    assert [b['bookingId'] for b in query(client, cursor='QRY07', status='confirmed')['bookings']] == ['QRY08']
+
+
+@pytest.mark.parametrize('args, message', [
+    ({'limit': 0}, 'limit'), ({'limit': 'ten'}, 'limit'), ({'dateFrom': '05/01/2036'}, 'dateFrom'),
+    ({'dateTo': '2036-13-01'}, 'dateTo'),
+])
+def test_bad_query_arguments_are_rejected(client, args, message):
+    response = client.get('/api/bookings', query_string=args)
+    assert response.status_code == 400
+    assert message in response.get_json()['error']
+
+
+def test_ndjson_export_matches_the_query(client, booked):
+    response = client.get('/api/bookings/export', query_string=dict(PASSENGER, status='confirmed'))
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=bookings.ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines == query(client, status='confirmed')['bookings']
+    assert [b['bookingId'] for b in lines] == booked[0::2]
+
+
+def test_csv_export_flattens_passenger_details(client, railway, booked, monkeypatch):
+    monkeypatch.setattr(railway, 'BOOKING_STREAM_CHUNK', 4)  # several read-lock holds for ten rows
+    response = client.get('/api/bookings/export', query_string=dict(PASSENGER, format='csv'))
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['bookingId'] for row in rows] == booked
+    assert rows[2]['passengerName'] == '  Query Tester '
+    assert rows[2]['passengerAge'] == '31'
+    assert rows[2]['class'] == '1ac' and rows[3]['status'] == 'waitlisted'
+    assert client.get('/api/bookings/export', query_string={'format': 'xml'}).status_code == 400
+
+
+def test_plain_list_is_still_every_booking(client, railway, booked):
+    response = client.get('/api/bookings')
+    assert response.mimetype == 'application/json'
+    assert [b['bookingId'] for b in response.get_json()] == [b['bookingId'] for b in railway.store.get()['bookings']]
+
+
+def test_unnamed_bookings_are_found_without_a_passenger_posting(client, railway, train):
+    booking = {'bookingId': 'QRY-ANON', 'trainId': train['id'], 'date': '2036-02-01', 'from': train['route'][0],
+               'to': train['route'][-1], 'class': '1ac'}
+    assert client.post('/api/bookings', json=booking).status_code == 200
+    index = railway.store.index
+    assert '' not in index.booking_postings['passenger']
+    found = client.get('/api/bookings', query_string={'date': '2036-02-01', 'status': 'confirmed'}).get_json()
+    assert [b['bookingId'] for b in found['bookings']] == ['QRY-ANON']
+    assert client.delete('/api/bookings/QRY-ANON').status_code == 200
+    assert '2036-02-01' not in index.booking_postings['date']
+    assert '2036-02-01' not in index.booking_dates
+
+
+def test_sorted_ids_split_and_drain_chunks(railway, monkeypatch):
+    monkeypatch.setattr(railway, 'SORTED_IDS_CHUNK', 4)
+    ids = railway.SortedIds()
+    expected = set()
+    rng = random.Random(14)
+    for _ in range(2000):
+        item = f"B{rng.randrange(300):03d}"
+        if rng.random() < 0.6:
+            ids.add(item)
+            expected.add(item)
+        else:
+            ids.discard(item)
+            expected.discard(item)
+    assert len(ids) == len(expected)
+    assert list(ids.after()) == sorted(expected)
+    assert all(len(chunk) <= 8 for chunk in ids._chunks) and len(ids._chunks) > 1
+    for after in ('A', 'B150', 'B1505', 'B299', 'C'):
+        assert list(ids.after(after)) == sorted(i for i in expected if i > after)
+    for item in list(expected):
+        ids.discard(item)
+    assert list(ids.after()) == [] and ids._chunks == []
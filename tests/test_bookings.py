@@ -0,0 +1,167 @@
+import itertools
+import threading
+
+import pytest
+
+_ids = itertools.count(1)
+
+
+def book(client, train, date, **fields):
+    booking = {
+        'bookingId': f"TEST{next(_ids)}",
+        'trainId': train['id'],
+        'date': date,
+        'from': train['route'][0],
+        'to': train['route'][-1],
+        'class': '1ac',
+    }
+    booking.update(fields)
+    return client.post('/api/bookings', json=booking)
+
+
+def available(client, train, date, source=None, destination=None):
+    query = {'trainId': train['id'], 'date': date, 'class': '1ac'}
+    if source:
+        query.update({'from': source, 'to': destination})
+    response = client.get('/api/availability', query_string=query)
+    assert response.status_code == 200
+    return response.get_json()['available']
+
+
+def test_confirmed_booking_takes_and_cancel_returns_seats(client, train):
+    date = '2031-01-01'
+    before = available(client, train, date)
+    response = book(client, train, date, passengerCount=3)
+    assert response.status_code == 200
+    assert available(client, train, date) == before - 3
+    assert client.delete(f"/api/bookings/{response.get_json()['bookingId']}").status_code == 200
+    assert available(client, train, date) == before
+
+
+@pytest.mark.parametrize('status', ['waitlisted', 'pending'])
+def test_unconfirmed_booking_holds_no_seats(client, train, status):
+    date = '2031-01-02'
+    before = available(client, train, date)
+    response = book(client, train, date, passengerCount=5, status=status)
+    assert response.status_code == 200
+    assert available(client, train, date) == before
+    assert client.delete(f"/api/bookings/{response.get_json()['bookingId']}").status_code == 200
+    assert available(client, train, date) == before
+
+
+def test_unconfirmed_booking_is_not_merged_into_confirmed(client, railway, train):
+    date = '2031-01-03'
+    confirmed = book(client, train, date).get_json()['bookingId']
+    waitlisted = book(client, train, date, status='waitlisted', passengerCount=2).get_json()['bookingId']
+    assert waitlisted != confirmed
+    assert railway.store.index.bookings[confirmed]['passengerCount'] == 1
+
+
+def test_full_train_is_rejected_and_rejection_holds_nothing(client, railway, train):
+    date = '2031-01-04'
+    capacity = railway.store.inventory.capacity(train, '1ac')
+    assert book(client, train, date, passengerCount=capacity).status_code == 200
+    assert book(client, train, date, passengerCount=1).status_code == 409
+    assert available(client, train, date) == 0
+
+
+def test_seats_are_counted_per_segment(client, train):
+    date = '2031-01-05'
+    first, middle, last = train['route'][0], train['route'][1], train['route'][-1]
+    before = available(client, train, date, middle, last)
+    assert book(client, train, date, to=middle, passengerCount=4).status_code == 200
+    assert available(client, train, date, middle, last) == before
+    assert available(client, train, date, first, last) == before - 4
+
+
+def test_duplicate_booking_id_returns_its_seats(client, train):
+    date = '2031-01-06'
+    booking_id = book(client, train, date).get_json()['bookingId']
+    before = available(client, train, date)
+    response = book(client, train, date, bookingId=booking_id, **{'from': train['route'][1]})
+    assert response.status_code == 400
+    assert available(client, train, date) == before
+
+
+@pytest.mark.parametrize('stored', [{'fare': 'n/a'}, {'fare': None}, {'passengerCount': '2'}])
+def test_malformed_stored_booking_is_not_merged_into(client, railway, train, stored):
+    date = '2031-01-11'
+    legacy = {'bookingId': f"LEGACY{next(_ids)}", 'trainId': train['id'], 'date': date, 'from': train['route'][0],
+              'to': train['route'][-1], 'class': '1ac', 'status': 'confirmed', 'passengerCount': 1, 'fare': '10.00'}
+    legacy.update(stored)
+    railway.store.index.insert('bookings', legacy)
+    before = dict(legacy)
+    try:
+        response = book(client, train, date, passengerCount=2)
+        assert response.status_code == 200
+        assert response.get_json()['bookingId'] != legacy['bookingId']
+        assert legacy == before
+    finally:
+        railway.store.index.delete('bookings', legacy)
+
+
+@pytest.mark.parametrize('count', ['two', None, 0, -1, [2]])
+def test_invalid_passenger_count_is_rejected(client, train, count):
+    response = book(client, train, '2031-01-07', passengerCount=count)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_client_fare_must_match_server_fare(client, train):
+    response = book(client, train, '2031-01-08', fare='0.01')
+    assert response.status_code == 400
+    expected = response.get_json()['expectedFare']
+    assert book(client, train, '2031-01-08', fare=expected).status_code == 200
+
+
+def test_fare_quotes_share_the_read_lock(client, railway, train):
+    quote = {'trainId': train['id'], 'from': train['route'][0], 'to': train['route'][-1], 'class': '1ac'}
+    responses = []
+    worker = threading.Thread(target=lambda: responses.append(client.post('/api/fares', json={'quotes': [quote]})))
+    with railway.store.reading():
+        # A write request would wait for this reader to finish
+        worker.start()
+        worker.join(timeout=5)
+        assert not worker.is_alive()
+    assert responses[0].status_code == 200
+    assert responses[0].get_json()['fares'][0]['status'] == 'success'
+
+
+def slots_match_list(railway):
+    index = railway.store.index
+    bookings = railway.store.get()['bookings']
+    return (index.lists['bookings'] is bookings
+            and {id(b): i for i, b in enumerate(bookings)} == index.slots['bookings']
+            and {b['bookingId'] for b in bookings} == set(index.bookings))
+
+
+def test_cancel_keeps_the_booking_list_and_slots(client, railway, train):
+    bookings = railway.store.get()['bookings']
+    ids = [book(client, train, '2031-01-09').get_json()['bookingId'] for _ in range(2)]
+    ids += [book(client, train, '2031-01-09', to=train['route'][1]).get_json()['bookingId']]
+    for booking_id in (ids[0], ids[-1]):
+        assert client.delete(f"/api/bookings/{booking_id}").status_code == 200
+        assert railway.store.get()['bookings'] is bookings
+        assert booking_id not in {b['bookingId'] for b in bookings}
+        assert slots_match_list(railway)
+    assert client.get(f"/api/get_booking/{ids[0]}").status_code == 404
+
+
+def test_replayed_booking_events_keep_the_list_and_slots(railway, train):
+    store = railway.store
+    record = {'bookingId': 'REPLAY1', 'trainId': train['id'], 'date': '2031-01-10', 'from': train['route'][0],
+              'to': train['route'][1], 'class': '1ac', 'status': 'confirmed', 'passengerCount': 2}
+    segment = store.inventory.segment(train, record['from'], record['to'])
+    before = store.inventory.available(train, record['date'], '1ac', *segment)
+    with store.writing():
+        store._apply_live({'op': 'put', 'collection': 'bookings', 'record': dict(record)}, store.position())
+        store._apply_live({'op': 'put', 'collection': 'bookings', 'record': dict(record, passengerCount=3)},
+                          store.position())
+    assert store.index.bookings['REPLAY1']['passengerCount'] == 3
+    assert store.inventory.available(train, record['date'], '1ac', *segment) == before - 3
+    assert slots_match_list(railway)
+    with store.writing():
+        store._apply_live({'op': 'delete', 'collection': 'bookings', 'key': 'REPLAY1'}, store.position())
+    assert 'REPLAY1' not in store.index.bookings
+    assert store.inventory.available(train, record['date'], '1ac', *segment) == before
+    assert slots_match_list(railway)
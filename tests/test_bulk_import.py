@@ -0,0 +1,144 @@
+import json
+
+import pytest
+
+
+def ndjson(*records):
+    return '\n'.join(record if isinstance(record, str) else json.dumps(record) for record in records) + '\n'
+
+
+def station(station_id, **fields):
+    return dict({'collection': 'stations', 'id': station_id, 'name': station_id.title(), 'latitude': 10.0,
+                 'longitude': 70.0}, **fields)
+
+
+def summary(report):
+    return [(e['line'], e['type'], e['key'], e['message']) for e in report['errors']]
+
+
+def test_each_bad_line_is_reported_and_the_rest_imported(client, stores):
+    first, second = stores
+    body = ndjson(
+        station('BULK1'),
+        station('BULK2', longitude=70.5),
+        '',
+        'not json',
+        '[1, 2]',
+        {'collection': 'buses', 'id': 'BUS1'},
+        {'collection': 'stations', 'id': 'BULK3', 'name': 'No position'},
+        station('BULK1'),
+        {'collection': 'tracks', 'source': 'BULK1', 'destination': 'BULK2', 'distance': 5, 'capacity': 3,
+         'bidirectional': True},
+        {'collection': 'tracks', 'source': 'BULK1', 'destination': 'NOWHERE', 'distance': 5, 'capacity': 3},
+        {'collection': 'trains', 'id': 'BULKT', 'name': 'Bulk', 'speed': 60, 'type': 'local',
+         'route': ['BULK2', 'BULK1'], 'timings': ['06:00', '06:10']},
+        {'collection': 'trains', 'id': 'BULKU', 'name': 'Bulk', 'speed': 60, 'type': 'local',
+         'route': ['BULK2', 'DEL'], 'timings': ['06:00', '09:00']},
+        {'collection': 'trains', 'id': 'BULKT', 'name': 'Again', 'speed': 60, 'type': 'local',
+         'route': ['BULK1', 'BULK2'], 'timings': ['07:00', '07:10']},
+    )
+    report = client.post('/api/bulk-import', data=body).get_json()
+    assert report['status'] == 'partial'
+    assert report['imported'] == {'stations': 2, 'tracks': 1, 'trains': 1}
+    assert report['errorCount'] == 8
+    assert summary(report) == [
+        (4, None, None, 'Invalid JSON'),
+        (5, None, None, 'Each line must be a JSON object'),
+        (6, 'buses', None, 'Unknown record type, expected one of stations, tracks, trains'),
+        (7, 'stations', 'BULK3', 'Missing required fields: latitude, longitude'),
+        (8, 'stations', 'BULK1', 'Station ID already exists'),
+        (10, 'tracks', ['BULK1', 'NOWHERE'], 'Source or destination station not found'),
+        (12, 'trains', 'BULKU', 'No direct track between BULK2 and DEL'),
+        (13, 'trains', 'BULKT', 'Train ID BULKT already exists'),
+    ]
+    track = first.index.get_track('BULK1', 'BULK2')
+    assert track['weight'] == 5 and track['bidirectional'] is True
+    assert first.index.trains['BULKT']['name'] == 'Bulk'
+    with second.writing():
+        assert {'BULK1', 'BULK2'} <= set(second.index.stations)
+        assert 'BULKT' in second.index.trains and 'BULKU' not in second.index.trains
+
+
+def test_later_batches_build_on_earlier_ones(client, railway, stores, monkeypatch):
+    monkeypatch.setattr(railway, 'BULK_IMPORT_BATCH', 2)
+    body = ndjson(
+        station('CHAIN1'), station('CHAIN2', latitude=10.5),
+        {'collection': 'tracks', 'source': 'CHAIN1', 'destination': 'CHAIN2', 'distance': 8, 'capacity': 2},
+        {'collection': 'trains', 'id': 'CHAINT', 'name': 'Chain', 'speed': 50, 'type': 'local',
+         'route': ['CHAIN1', 'CHAIN2'], 'timings': ['10:00', '10:20']},
+        {'collection': 'trains', 'id': 'CHAINR', 'name': 'Reverse', 'speed': 50, 'type': 'local',
+         'route': ['CHAIN2', 'CHAIN1'], 'timings': ['11:00', '11:20']},
+    )
+    report = client.post('/api/bulk-import', data=body).get_json()
+    assert report['batches'] == 3
+    assert report['imported'] == {'stations': 2, 'tracks': 1, 'trains': 1}
+    assert summary(report) == [(5, 'trains', 'CHAINR', 'No direct track between CHAIN2 and CHAIN1')]
+
+
+def test_csv_rows_take_the_type_parameter(client, stores):
+    first, _ = stores
+    stations = ('id,name,latitude,longitude\n'
+                'CSV1,First,11.0,71.0\n'
+                'CSV2,Second,11.5,71.5\n'
+                'CSV3,Third,north,71.0\n')
+    report = client.post('/api/bulk-import', query_string={'format': 'csv', 'type': 'stations'},
+                         data=stations).get_json()
+    assert report['imported']['stations'] == 2
+    assert [(e['line'], e['message'].split(':')[0]) for e in report['errors']] == [(4, 'Invalid value')]
+    assert first.index.stations['CSV1']['latitude'] == 11.0
+
+    # A text/csv body can also mix types through a collection column
+    mixed = ('collection,id,name,speed,type,route,timings,source,destination,distance,capacity,bidirectional\n'
+             'tracks,,,,,,,CSV1,CSV2,12.5,4,yes\n'
+             'trains,CSVT,Csv,70,express,CSV2;CSV1,08:00;08:15,,,,,\n')
+    report = client.post('/api/bulk-import', data=mixed, content_type='text/csv').get_json()
+    assert report == {'status': 'success', 'imported': {'stations': 0, 'tracks': 1, 'trains': 1},
+                      'batches': 1, 'errorCount': 0, 'errors': []}
+    assert first.index.get_track('CSV1', 'CSV2')['capacity'] == 4
+    assert first.index.trains['CSVT']['route'] == ['CSV2', 'CSV1']
+    assert first.index.trains['CSVT']['timings'] == ['08:00', '08:15']
+
+
+def test_unknown_type_parameter_is_rejected(client):
+    response = client.post('/api/bulk-import', query_string={'type': 'buses'}, data=ndjson(station('NOPE')))
+    assert response.status_code == 400
+    assert response.get_json()['status'] == 'error'
+
+
+@pytest.mark.parametrize('record, message', [
+    ({'collection': 'trains', 'id': 'ODDT', 'name': 'Odd', 'speed': 1, 'type': 'local',
+      'route': [['DEL'], 'MAS'], 'timings': []}, 'route must be a list of station ids'),
+    ({'collection': 'trains', 'id': 'ODDT', 'name': 'Odd', 'speed': 1, 'type': 'local', 'route': 'DEL',
+      'timings': []}, 'route must be a list of station ids'),
+    ({'collection': 'trains', 'id': 7, 'name': 'Odd', 'speed': 1, 'type': 'local', 'route': ['DEL'],
+      'timings': []}, 'id must be strings'),
+    ({'collection': 'tracks', 'source': ['DEL'], 'destination': 'MAS', 'distance': 1, 'capacity': 1},
+     'source and destination must be strings'),
+    ({'collection': 'stations', 'id': ['ODD'], 'name': 'Odd', 'latitude': 1.0, 'longitude': 1.0},
+     'id must be strings'),
+])
+def test_malformed_keys_are_errors_not_failures(client, stores, record, message):
+    report = client.post('/api/bulk-import', data=ndjson(station('ODDOK'), record)).get_json()
+    assert report['imported'][record['collection']] == int(record['collection'] == 'stations')
+    assert [(e['line'], e['message']) for e in report['errors']] == [(2, message)]
+
+
+def test_import_command(railway, stores, tmp_path, capsys):
+    first, _ = stores
+    path = tmp_path / 'stations.ndjson'
+    path.write_text(ndjson({'id': 'CLI1', 'name': 'Cli', 'latitude': 12.0, 'longitude': 72.0},
+                           {'id': 'CLI2', 'name': 'Cli'}))
+    railway.main(['import', str(path), 'stations'])
+    report = json.loads(capsys.readouterr().out)
+    assert report['imported']['stations'] == 1
+    assert summary(report) == [(2, 'stations', 'CLI2', 'Missing required fields: latitude, longitude')]
+    assert 'CLI1' in first.index.stations
+
+    path = tmp_path / 'tracks.csv'
+    path.write_text('source,destination,distance,capacity\nCLI1,DEL,40,6\n')
+    railway.main(['import', str(path), 'tracks'])
+    assert json.loads(capsys.readouterr().out)['imported']['tracks'] == 1
+    assert first.index.get_track('CLI1', 'DEL')['distance'] == 40.0
+
+    railway.main(['import'])
+    assert capsys.readouterr().out.startswith('usage: python x.py import')
@@ -0,0 +1,92 @@
+import pytest
+
+
+@pytest.fixture
+def serve(railway, monkeypatch):
+    """Route the following requests to one of the stores, like a load balancer picking a worker"""
+    def use(store):
+        monkeypatch.setattr(railway, 'store', store)
+    return use
+
+
+def data_etag(client):
+    response = client.get('/api/data')
+    assert response.status_code == 200
+    return response.headers['ETag'], response.get_json()['version']
+
+
+def test_every_worker_gives_the_same_version_the_same_tokens(client, stores, serve):
+    first, second = stores
+    etag, version = data_etag(client)
+    serve(second)
+    assert data_etag(client) == (etag, version)
+    response = client.get('/api/data', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    changes = client.get('/api/changes', query_string={'since': version}).get_json()
+    assert changes == {'status': 'success', 'version': version, 'reset': False, 'changes': {}}
+
+
+def test_changes_written_by_one_worker_are_served_by_another(client, stores, serve, train):
+    first, second = stores
+    etag, version = data_etag(client)
+    station = {'id': 'DELTA1', 'name': 'Delta', 'latitude': 15.0, 'longitude': 75.0}
+    gone = {'id': 'DELTA2', 'name': 'Gone', 'latitude': 15.5, 'longitude': 75.5}
+    for record in (station, gone):
+        assert client.post('/api/add-station', json=record).status_code == 200
+    assert client.delete('/api/stations/DELTA2').status_code == 200
+    booking = {'bookingId': 'DELTA-B', 'trainId': train['id'], 'date': '2035-05-05', 'from': train['route'][0],
+               'to': train['route'][-1], 'class': '1ac'}
+    assert client.post('/api/bookings', json=booking).status_code == 200
+    new_etag, new_version = data_etag(client)
+    assert new_version != version
+
+    serve(second)
+    response = client.get('/api/data', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == new_etag
+    assert client.get('/api/data', headers={'If-None-Match': new_etag}).status_code == 304
+
+    result = client.get('/api/changes', query_string={'since': version}).get_json()
+    assert result['reset'] is False
+    assert result['version'] == new_version
+    changes = result['changes']
+    assert changes['stations'] == {'inserted': [station], 'updated': [], 'deleted': []}  # DELTA2 came and went
+    assert [b['bookingId'] for b in changes['bookings']['inserted']] == ['DELTA-B']
+    assert client.get('/api/changes', query_string={'since': new_version}).get_json()['changes'] == {}
+
+    # The second worker's own writes are stamped the same way for the first
+    assert client.delete('/api/bookings/DELTA-B').status_code == 200
+    latest = client.get('/api/changes', query_string={'since': new_version}).get_json()
+    serve(first)
+    assert client.get('/api/changes', query_string={'since': new_version}).get_json() == latest
+    assert latest['changes'] == {'bookings': {'inserted': [], 'updated': [], 'deleted': ['DELTA-B']}}
+
+
+@pytest.mark.parametrize('since', [None, '', 'garbage', 'abc-12', 'abc-x'])
+def test_unknown_tokens_get_a_reset(client, stores, since):
+    query = {} if since is None else {'since': since}
+    result = client.get('/api/changes', query_string=query).get_json()
+    assert result['reset'] is True and 'changes' not in result
+
+
+def test_tokens_from_before_a_wholesale_rewrite_get_a_reset(client, stores, serve):
+    first, second = stores
+    _, version = data_etag(client)
+    first.save()
+    assert client.get('/api/changes', query_string={'since': version}).get_json()['reset'] is True
+    current = client.get('/api/changes').get_json()['version']
+    assert current != version
+    serve(second)
+    assert client.get('/api/changes', query_string={'since': version}).get_json()['reset'] is True
+    assert client.get('/api/changes', query_string={'since': current}).get_json()['reset'] is False
+
+
+def test_tokens_past_the_retained_window_get_a_reset(client, railway, stores, monkeypatch):
+    first, _ = stores
+    _, version = data_etag(client)
+    monkeypatch.setattr(first.changes, 'limit', 2)
+    for i in range(3):
+        station = {'id': f"WINDOW{i}", 'name': 'Window', 'latitude': 16.0, 'longitude': 76.0 + i}
+        assert client.post('/api/add-station', json=station).status_code == 200
+    assert client.get('/api/changes', query_string={'since': version}).get_json()['reset'] is True
@@ -0,0 +1,54 @@
+from datetime import datetime
+
+
+def station_closure(station_id, start, hours):
+    return {'id': f"stclos_{station_id}_{start}", 'stationId': station_id, 'type': 'station',
+            'reason': 'test', 'duration': hours, 'startTime': datetime.fromtimestamp(start).isoformat()}
+
+
+# Far enough ahead that the wall clock never overtakes the index's clock
+T0 = datetime(2040, 1, 1).timestamp()
+HOUR = 3600
+
+
+def test_scheduled_closure_starts_and_expires(railway):
+    closures = railway.ClosureIndex()
+    closure = station_closure('DEL', T0 + HOUR, 2)
+    closures.add(closure)
+    closures.advance(T0)
+    assert not closures.is_station_closed('DEL')
+    assert closures.is_station_closed('DEL', at=T0 + 2 * HOUR)
+    closures.advance(T0 + HOUR)
+    assert closures.is_station_closed('DEL')
+    closures.advance(T0 + 3 * HOUR)
+    assert not closures.is_station_closed('DEL')
+    assert closures.pop_expired(T0 + 3 * HOUR) == [closure]
+
+
+def test_removed_closure_leaves_no_stale_start(railway):
+    closures = railway.ClosureIndex()
+    closure = station_closure('DEL', T0 + HOUR, 1)
+    closures.add(closure)
+    closures.remove(closure)
+    # Re-adding the same object with a later start must not be woken by the old heap entry
+    closure['startTime'] = datetime.fromtimestamp(T0 + 5 * HOUR).isoformat()
+    closures.add(closure)
+    closures.advance(T0 + 2 * HOUR)
+    assert not closures.is_station_closed('DEL')
+    closures.advance(T0 + 5 * HOUR)
+    assert closures.is_station_closed('DEL')
+    assert closures.counts['station'] == 1
+
+
+def test_removed_active_closure_does_not_reopen_others(railway):
+    closures = railway.ClosureIndex()
+    first = station_closure('DEL', T0, 4)
+    second = station_closure('DEL', T0 + HOUR, 4)
+    closures.add(first)
+    closures.add(second)
+    closures.advance(T0 + 2 * HOUR)
+    closures.remove(first)
+    assert closures.is_station_closed('DEL')
+    closures.advance(T0 + 6 * HOUR)
+    assert not closures.is_station_closed('DEL')
+    assert closures.counts['station'] == 0
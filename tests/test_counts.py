@@ -0,0 +1,69 @@
+from collections import Counter
+from decimal import Decimal
+
+
+def recount(railway):
+    """The get_count figures computed from scratch over the stored lists"""
+    data = railway.store.get()
+    visible = {kind: railway.store.closures.visible(data[kind]) for kind in ('station_closures', 'track_closures')}
+    trips = Counter()
+    passengers = Counter()
+    revenue = Counter()
+    for booking in data['bookings']:
+        trip = (booking.get('trainId'), booking.get('date'))
+        trips[trip] += 1
+        passengers[trip] += int(booking.get('passengerCount', 1))
+        if booking.get('status') == 'confirmed' and railway.fare_amount(booking.get('fare', 0)) is not None:
+            revenue[booking.get('class')] += railway.fare_amount(booking.get('fare', 0))
+    return {
+        'total_trains': len(data['trains']),
+        'total_stations': len(data['stations']),
+        'total_tracks': len(data['tracks']),
+        'total_bookings': len(data['bookings']),
+        'total_station_closures': len(visible['station_closures']),
+        'total_track_closures': len(visible['track_closures']),
+        'bookings_by_trip': {trip: (trips[trip], passengers[trip]) for trip in trips},
+        'revenue_by_class': {k: float(Decimal(v).quantize(railway.FARE_QUANTUM)) for k, v in revenue.items() if v},
+    }
+
+
+def get_counts(client):
+    result = client.get('/api/get_count', query_string={'details': '1'}).get_json()
+    result['bookings_by_trip'] = {(t['trainId'], t['date']): (t['bookings'], t['passengers'])
+                                  for t in result['bookings_by_trip']}
+    result['revenue_by_class'] = {k: v for k, v in result['revenue_by_class'].items() if v}
+    return result
+
+
+def test_counts_follow_every_kind_of_change(client, railway, train):
+    expected = recount(railway)
+    counts = get_counts(client)
+    assert {k: counts[k] for k in expected} == expected
+    plain = client.get('/api/get_count').get_json()
+    assert 'bookings_by_trip' not in plain and plain['total_trains'] == expected['total_trains']
+
+    date = '2034-04-04'
+    booking = {'trainId': train['id'], 'date': date, 'from': train['route'][0], 'to': train['route'][-1]}
+    for i, (cls, count) in enumerate([('1ac', 2), ('2ac', 3), ('sleeper', 1)]):
+        response = client.post('/api/bookings', json=dict(booking, bookingId=f"COUNT{i}", passengerCount=count,
+                                                         **{'class': cls}))
+        assert response.status_code == 200
+    station = {'id': 'COUNTST', 'name': 'Count', 'latitude': 13.0, 'longitude': 78.0}
+    assert client.post('/api/add-station', json=station).status_code == 200
+    closure = {'stationId': 'COUNTST', 'reason': 'count', 'duration': 1}
+    closure_id = client.post('/api/add-station-closure', json=closure).get_json()['closure']['id']
+
+    counts = get_counts(client)
+    assert counts['bookings_by_trip'][(train['id'], date)] == (3, 6)
+    assert counts['total_stations'] == expected['total_stations'] + 1
+    assert counts['total_station_closures'] == expected['total_station_closures'] + 1
+    assert counts['active_closures_by_station']['COUNTST'] == 1
+    assert {k: counts[k] for k in expected} == recount(railway)
+
+    assert client.delete('/api/bookings/COUNT1').status_code == 200
+    assert client.delete(f"/api/station-closures/{closure_id}").status_code == 200
+    assert client.delete('/api/stations/COUNTST').status_code == 200
+    counts = get_counts(client)
+    assert counts['bookings_by_trip'][(train['id'], date)] == (2, 3)
+    assert 'COUNTST' not in counts['active_closures_by_station']
+    assert {k: counts[k] for k in expected} == recount(railway)
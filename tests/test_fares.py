@@ -0,0 +1,56 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+import pytest
+
+
+def expected_fare(railway, train, source, destination, class_type, quota):
+    """Fare straight from FARE_CONFIG, summing track distances along the route"""
+    route = train['route']
+    i, j = route.index(source), route.index(destination)
+    km = sum(Decimal(str(railway.store.index.find_track(a, b)['distance'])) for a, b in zip(route[i:j], route[i + 1:j + 1]))
+    config = railway.FARE_CONFIG
+    factor = config['trainMultipliers'].get(train.get('type'), config['trainMultipliers']['default'])
+    fare = km * Decimal(str(config['baseFarePerKm'][class_type])) * Decimal(str(factor)) \
+        * Decimal(str(config['quotaMultipliers'][quota]))
+    return fare.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def quote(client, **query):
+    response = client.post('/api/fares', json={'quotes': [query]})
+    assert response.status_code == 200
+    return response.get_json()['fares'][0]
+
+
+@pytest.mark.parametrize('class_type', ['sleeper', '3ac', '1ac'])
+@pytest.mark.parametrize('quota', ['general', 'tatkal', 'senior citizen'])
+def test_quotes_match_the_fare_config(client, railway, train, class_type, quota):
+    route = train['route']
+    for source, destination in [(route[0], route[-1]), (route[0], route[1]), (route[1], route[-1])]:
+        line = quote(client, trainId=train['id'], **{'from': source, 'to': destination, 'class': class_type},
+                     quota=quota, passengerCount=3)
+        assert line['status'] == 'success'
+        per_person = expected_fare(railway, train, source, destination, class_type, quota)
+        assert Decimal(line['farePerPerson']) == per_person
+        assert Decimal(line['fare']) == per_person * 3
+
+
+def test_search_fares_match_quotes(client, train):
+    source, destination = train['route'][0], train['route'][-1]
+    results = client.get('/api/search', query_string={'from': source, 'to': destination, 'class': '3ac'}).get_json()
+    found = next(r for r in results if r['id'] == train['id'])
+    line = quote(client, trainId=train['id'], **{'from': source, 'to': destination, 'class': '3ac'})
+    assert Decimal(str(found['fare'])) == Decimal(line['fare'])
+
+
+@pytest.mark.parametrize('query, message', [
+    ({'trainId': 'NO-SUCH-TRAIN'}, 'Train not found'),
+    ({'class': 'cattle'}, 'Invalid class'),
+    ({'quota': 'friends'}, 'Invalid quota'),
+    ({'passengerCount': 'two'}, 'Invalid passenger count'),
+])
+def test_bad_quotes_fail_one_line_at_a_time(client, train, query, message):
+    good = {'trainId': train['id'], 'from': train['route'][0], 'to': train['route'][-1], 'class': '1ac'}
+    response = client.post('/api/fares', json={'quotes': [dict(good, **query), good]})
+    first, second = response.get_json()['fares']
+    assert first['status'] == 'error' and first['message'] == message
+    assert second['status'] == 'success'
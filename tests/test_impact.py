@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+STATIONS = {'J1': (19.0, 73.0), 'J2': (19.1, 73.1), 'J3': (19.2, 73.2), 'J4': (19.3, 73.3), 'J5': (19.15, 73.4)}
+TRACKS = [('J1', 'J2', 10), ('J2', 'J3', 10), ('J3', 'J4', 10), ('J2', 'J5', 12), ('J5', 'J4', 12)]
+TRAINS = {
+    'JDAY': ['08:00', '09:00', '10:00', '11:00'],
+    'JNIGHT': ['22:00', '23:00', '00:30', '01:30'],  # reaches J3 the day after it departs
+}
+
+
+@pytest.fixture
+def line(client, stores):
+    """J1-J2-J3-J4 with a bypass J2-J5-J4, a day train and an overnight one along the line"""
+    for station_id, (latitude, longitude) in STATIONS.items():
+        station = {'id': station_id, 'name': station_id, 'latitude': latitude, 'longitude': longitude}
+        assert client.post('/api/add-station', json=station).status_code == 200
+    for source, destination, distance in TRACKS:
+        track = {'source': source, 'destination': destination, 'distance': distance, 'capacity': 4,
+                 'bidirectional': True}
+        assert client.post('/api/add-track', json=track).status_code == 200
+    for train_id, timings in TRAINS.items():
+        train = {'id': train_id, 'name': train_id.title(), 'speed': 60, 'type': 'express',
+                 'route': ['J1', 'J2', 'J3', 'J4'], 'timings': timings}
+        assert client.post('/api/trains-add', json=train).status_code == 200
+    short = {'id': 'JSHORT', 'name': 'Short', 'speed': 60, 'type': 'express', 'route': ['J1', 'J2'],
+             'timings': ['23:30', '00:10']}
+    assert client.post('/api/trains-add', json=short).status_code == 200
+    return stores
+
+
+def book(client, booking_id, train_id, date, source, destination):
+    booking = {'bookingId': booking_id, 'trainId': train_id, 'date': date, 'from': source, 'to': destination,
+               'class': '1ac'}
+    response = client.post('/api/bookings', json=booking)
+    assert response.get_json().get('bookingId') == booking_id, response.get_json()
+
+
+def finished(client, job_id):
+    deadline = time.monotonic() + 10
+    while True:
+        job = client.get(f"/api/jobs/{job_id}").get_json()
+        if job['state'] in ('done', 'failed') or time.monotonic() > deadline:
+            return job
+        time.sleep(0.01)
+
+
+def close_station(client, station_id, start, hours):
+    closure = {'stationId': station_id, 'reason': 'works', 'duration': hours, 'startTime': start}
+    response = client.post('/api/add-station-closure', json=closure)
+    assert response.status_code == 200
+    job = finished(client, response.get_json()['impactJob'])
+    assert job['state'] == 'done', job
+    return job['result']
+
+
+def test_station_closure_impact_follows_each_train_past_midnight(client, line):
+    book(client, 'JB-DAY', 'JDAY', '2040-03-10', 'J1', 'J4')
+    book(client, 'JB-DAY-BEFORE', 'JDAY', '2040-03-09', 'J1', 'J4')
+    book(client, 'JB-DAY-TO', 'JDAY', '2040-03-10', 'J1', 'J3')
+    book(client, 'JB-NIGHT-BEFORE', 'JNIGHT', '2040-03-09', 'J1', 'J4')
+    book(client, 'JB-NIGHT-FROM', 'JNIGHT', '2040-03-09', 'J3', 'J4')
+    book(client, 'JB-NIGHT-SAME', 'JNIGHT', '2040-03-10', 'J1', 'J4')
+    book(client, 'JB-NIGHT-SHORT', 'JNIGHT', '2040-03-09', 'J1', 'J2')
+
+    result = close_station(client, 'J3', '2040-03-10T00:00:00', 23)
+    assert result['dates'] == ['2040-03-10', '2040-03-10']
+    assert result['targets'] == ['J3']
+    assert [t['trainId'] for t in result['trains']] == ['JDAY', 'JNIGHT']  # JSHORT never reaches J3
+    segment = {'from': 'J2', 'to': 'J4', 'replaces': ['J2', 'J3', 'J4'], 'distance': 20.0, 'status': 'rerouted',
+               'detour': ['J2', 'J5', 'J4'], 'detourDistance': 24.0, 'extraDistance': 4.0}
+    assert all(t['status'] == 'rerouted' and t['segments'] == [segment] for t in result['trains'])
+
+    # The overnight train departing on the 9th is at J3 on the 10th; the one departing on the 10th is not
+    impacts = {b['bookingId']: b['impact'] for b in result['bookings']}
+    assert impacts == {'JB-DAY': 'rerouted', 'JB-DAY-TO': 'station_closed',
+                       'JB-NIGHT-BEFORE': 'rerouted', 'JB-NIGHT-FROM': 'station_closed'}
+    assert result['affectedBookings'] == 4 and result['bookingsTruncated'] is False
+    booking = next(b for b in result['bookings'] if b['bookingId'] == 'JB-NIGHT-BEFORE')
+    assert booking == {'bookingId': 'JB-NIGHT-BEFORE', 'trainId': 'JNIGHT', 'date': '2040-03-09', 'from': 'J1',
+                       'to': 'J4', 'class': '1ac', 'passengerCount': 1, 'impact': 'rerouted'}
+
+
+def test_track_closure_without_a_detour(client, line):
+    book(client, 'JT-NIGHT', 'JNIGHT', '2040-04-01', 'J1', 'J2')
+    book(client, 'JT-PAST', 'JNIGHT', '2040-04-01', 'J2', 'J4')
+    closure = {'source': 'J1', 'destination': 'J2', 'reason': 'works', 'duration': 2,
+               'startTime': '2040-04-01T22:30:00'}
+    response = client.post('/api/add-track-closure', json=closure)
+    assert response.status_code == 200
+    job = finished(client, response.get_json()['impactJob'])
+    result = job['result']
+    assert result['targets'] == [['J1', 'J2']]
+    assert [(t['trainId'], t['status']) for t in result['trains']] == [('JDAY', 'disrupted'),
+                                                                       ('JNIGHT', 'disrupted'),
+                                                                       ('JSHORT', 'disrupted')]
+    assert result['trains'][0]['segments'][0]['status'] == 'no_detour'
+    assert [(b['bookingId'], b['impact']) for b in result['bookings']] == [('JT-NIGHT', 'no_detour')]
+
+
+def test_job_lookup_errors(client):
+    assert client.get('/api/jobs/impact_nothing_here').status_code == 404
+    response = client.get('/api/jobs/..%2Fsecrets')
+    assert response.status_code in (400, 404)
+    assert client.get('/api/jobs/not.a.job').status_code == 400
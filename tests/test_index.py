@@ -0,0 +1,62 @@
+import pytest
+
+
+def slots_match_lists(railway):
+    index = railway.store.index
+    data = railway.store.get()
+    for name in railway.INDEXED_COLLECTIONS:
+        assert index.lists[name] is data[name]
+        assert {id(r): i for i, r in enumerate(data[name])} == index.slots[name]
+    assert {s['id'] for s in data['stations']} == set(index.stations)
+    assert {t['id'] for t in data['trains']} == set(index.trains)
+    assert len(data['tracks']) == index.track_count
+
+
+def test_deletes_move_the_last_record_into_the_gap(client, railway):
+    data = railway.store.get()
+    stations = [{'id': f"IDX{i}", 'name': f"Index {i}", 'latitude': 12.0 + i, 'longitude': 75.0} for i in range(3)]
+    for station in stations:
+        assert client.post('/api/add-station', json=station).status_code == 200
+    track = {'source': 'IDX0', 'destination': 'IDX1', 'distance': 10, 'capacity': 4, 'bidirectional': True}
+    assert client.post('/api/add-track', json=track).status_code == 200
+    train = {'id': 'IDX-TRAIN', 'name': 'Index', 'speed': 80, 'type': 'express',
+             'route': ['IDX0', 'IDX1'], 'timings': ['08:00', '09:00']}
+    assert client.post('/api/trains-add', json=train).status_code == 200
+    slots_match_lists(railway)
+
+    first = data['stations'].index(railway.store.index.stations['IDX0'])
+    last = data['stations'][-1]
+    assert client.delete('/api/trains/IDX-TRAIN').status_code == 200
+    assert client.delete('/api/tracks/IDX0/IDX1').status_code == 200
+    assert client.delete('/api/stations/IDX0').status_code == 200
+    assert data['stations'][first] is last
+    assert 'IDX0' not in {s['id'] for s in data['stations']}
+    assert railway.store.index.get_track('IDX0', 'IDX1') is None
+    slots_match_lists(railway)
+    for station in stations[1:]:
+        assert client.delete(f"/api/stations/{station['id']}").status_code == 200
+    slots_match_lists(railway)
+
+
+@pytest.mark.parametrize('collection, record, key', [
+    ('stations', {'id': 'IDXLIVE', 'name': 'Live', 'latitude': 11.0, 'longitude': 76.0}, 'IDXLIVE'),
+    ('tracks', {'source': 'DEL', 'destination': 'IDXLIVE', 'distance': 5, 'capacity': 2}, ['DEL', 'IDXLIVE']),
+])
+def test_replayed_events_update_lists_through_the_index(railway, collection, record, key):
+    store = railway.store
+    with store.writing():
+        store._apply_live({'op': 'put', 'collection': 'stations',
+                           'record': {'id': 'IDXLIVE', 'name': 'Live', 'latitude': 11.0, 'longitude': 76.0}},
+                          store.position())
+        store._apply_live({'op': 'put', 'collection': collection, 'record': dict(record)}, store.position())
+        store._apply_live({'op': 'put', 'collection': collection, 'record': dict(record, name='Updated')},
+                          store.position())
+    matches = store.index.lookup(collection, railway.event_key({'op': 'delete', 'collection': collection, 'key': key}))
+    assert [r.get('name') for r in matches] == ['Updated']
+    slots_match_lists(railway)
+    with store.writing():
+        for name, event_key in ((collection, key), ('stations', 'IDXLIVE')):
+            store._apply_live({'op': 'delete', 'collection': name, 'key': event_key}, store.position())
+    assert 'IDXLIVE' not in store.index.stations
+    assert store.index.get_track('DEL', 'IDXLIVE') is None
+    slots_match_lists(railway)
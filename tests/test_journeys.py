@@ -0,0 +1,82 @@
+from datetime import datetime
+
+import pytest
+
+DATE = '2031-05-05'
+
+
+def minutes_after(stamp):
+    return int((datetime.fromisoformat(stamp) - datetime.fromisoformat(DATE)).total_seconds() // 60)
+
+
+def earliest_arrivals(railway, source, target, departure, rounds, min_transfer):
+    """Earliest arrival at ``target`` using at most 1..rounds trains, by trying every boarding"""
+    timetable = railway.get_timetable()
+    stop_station, stop_train, stop_minutes, stop_missing, train_offsets, _, _ = timetable.lists()
+    source_n, target_n = timetable.station_index[source], timetable.station_index[target]
+    arrival = {source_n: departure}
+    results = []
+    for _ in range(rounds):
+        current = dict(arrival)
+        for train in range(len(timetable.trains)):
+            start, end = train_offsets[train], train_offsets[train + 1]
+            for board in range(start, end):
+                ready = arrival.get(stop_station[board])
+                if ready is None or stop_minutes[board] == railway.TIMING_UNKNOWN:
+                    continue
+                if stop_station[board] != source_n:
+                    ready += min_transfer
+                day = -((stop_minutes[board] - ready) // 1440)
+                for alight in range(board + 1, end):
+                    if stop_minutes[alight] == railway.TIMING_UNKNOWN or stop_missing[alight] != stop_missing[board]:
+                        break
+                    arrive = stop_minutes[alight] + 1440 * day
+                    station = stop_station[alight]
+                    if arrive < current.get(station, float('inf')):
+                        current[station] = arrive
+        arrival = current
+        results.append(arrival.get(target_n))
+    return results
+
+
+@pytest.mark.parametrize('source, destination, time', [
+    ('DEL', 'MAS', '00:00'), ('HWH', 'SBC', '09:30'), ('LKO', 'ADI', '18:00'), ('MAS', 'DEL', '23:30'),
+])
+def test_journeys_are_earliest_for_each_transfer_count(client, railway, source, destination, time):
+    query = {'from': source, 'to': destination, 'date': DATE, 'time': time, 'maxTransfers': 2}
+    result = client.get('/api/journeys', query_string=query).get_json()
+    assert result['status'] == 'success'
+    departure = railway.parse_minutes(time)
+    expected = earliest_arrivals(railway, source, destination, departure, 3, railway.MIN_TRANSFER_MINUTES)
+    for transfers, best in enumerate(expected):
+        found = [minutes_after(j['arrival']) for j in result['journeys'] if j['transfers'] <= transfers]
+        assert (min(found) if found else None) == best
+
+
+def test_journey_legs_connect(client, railway):
+    query = {'from': 'DEL', 'to': 'MAS', 'date': DATE, 'time': '06:00', 'maxTransfers': 3}
+    journeys = client.get('/api/journeys', query_string=query).get_json()['journeys']
+    assert journeys
+    trains = railway.store.index.trains
+    for journey in journeys:
+        legs = journey['legs']
+        assert legs[0]['from'] == 'DEL' and legs[-1]['to'] == 'MAS'
+        assert journey['transfers'] == len(legs) - 1
+        assert minutes_after(legs[0]['departure']) >= railway.parse_minutes('06:00')
+        for leg in legs:
+            route = trains[leg['trainId']]['route']
+            board = route.index(leg['from'])
+            assert leg['to'] in route[board + 1:]
+            assert leg['durationMinutes'] == minutes_after(leg['arrival']) - minutes_after(leg['departure']) > 0
+        for before, after in zip(legs, legs[1:]):
+            assert before['to'] == after['from']
+            assert minutes_after(after['departure']) - minutes_after(before['arrival']) >= railway.MIN_TRANSFER_MINUTES
+    arrivals = [minutes_after(j['arrival']) for j in journeys]
+    assert arrivals == sorted(arrivals, reverse=True)
+
+
+def test_journeys_reject_bad_queries(client):
+    assert client.get('/api/journeys?from=DEL').status_code == 400
+    assert client.get('/api/journeys?from=DEL&to=NOWHERE').status_code == 400
+    assert client.get('/api/journeys?from=DEL&to=MAS&maxTransfers=-1').status_code == 400
+    assert client.get('/api/journeys?from=DEL&to=MAS&time=soon').status_code == 400
@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+
+def test_writer_waits_for_readers_and_blocks_new_ones(railway):
+    lock = railway.RWLock()
+    events = []
+    lock.acquire_read()
+
+    def write():
+        with lock.write():
+            events.append('write')
+
+    def read():
+        with lock.read():
+            events.append('read')
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    while not lock._waiting_writers:
+        time.sleep(0.001)
+    reader = threading.Thread(target=read)
+    reader.start()
+    reader.join(timeout=0.1)
+    assert events == []  # the waiting writer holds off the new reader
+    lock.release_read()
+    writer.join(timeout=5)
+    reader.join(timeout=5)
+    assert events == ['write', 'read']
+
+
+def test_writer_may_reenter_and_read(railway):
+    lock = railway.RWLock()
+    with lock.write() as outermost:
+        assert outermost
+        with lock.write() as nested:
+            assert not nested
+        with lock.read():
+            pass
+    with lock.read():
+        pass  # fully released
+
+
+def test_write_request_waits_for_a_reader(client, railway):
+    station = {'id': 'LOCKWAIT', 'name': 'Lock', 'latitude': 14.0, 'longitude': 74.0}
+    responses = []
+    worker = threading.Thread(target=lambda: responses.append(client.post('/api/add-station', json=station)))
+    with railway.store.reading():
+        worker.start()
+        worker.join(timeout=0.2)
+        assert worker.is_alive()
+        assert 'LOCKWAIT' not in railway.store.index.stations
+    worker.join(timeout=5)
+    assert responses[0].status_code == 200
+    assert client.delete('/api/stations/LOCKWAIT').status_code == 200
+
+
+def test_file_lock_excludes_other_processes(railway, tmp_path):
+    if railway.fcntl is None:
+        pytest.skip('no flock on this platform')
+    path = str(tmp_path / 'railways.lock')
+    holder = (f"import fcntl, os, sys, time; fd = os.open({path!r}, os.O_RDWR | os.O_CREAT); "
+              "fcntl.flock(fd, fcntl.LOCK_EX); print('locked', flush=True); time.sleep(0.3)")
+    child = subprocess.Popen([sys.executable, '-c', holder], stdout=subprocess.PIPE, text=True)
+    try:
+        assert child.stdout.readline().strip() == 'locked'
+        started = time.monotonic()
+        with railway.FileLock(path):
+            waited = time.monotonic() - started
+        assert waited > 0.1
+    finally:
+        child.wait(timeout=5)
+    assert os.path.exists(path)
@@ -0,0 +1,12 @@
+def test_requests_are_counted(client):
+    assert client.get('/api/stations').status_code == 200
+    text = client.get('/api/_metrics').get_data(as_text=True)
+    assert 'route="/api/stations"' in text
+
+
+def test_profile_header_is_ignored_unless_profiling_is_enabled(client, railway, monkeypatch):
+    assert not railway.PROFILING
+    assert 'X-Profile-Id' not in client.get('/api/stations', headers={railway.PROFILE_HEADER: '1'}).headers
+    monkeypatch.setattr(railway, 'PROFILING', True)
+    response = client.get('/api/stations', headers={railway.PROFILE_HEADER: '1'})
+    assert 'X-Profile-Id' in response.headers
@@ -0,0 +1,90 @@
+import math
+
+
+def brute_force_forest(railway):
+    """Total weight and component count of the open network, by plain Kruskal"""
+    index = railway.store.index
+    closed_stations = railway.store.closures.closed_stations()
+    closed_edges = railway.store.closures.closed_edges()
+    stations = [s for s in index.stations if s not in closed_stations]
+    weights = {}
+    for track in railway.store.get()['tracks']:
+        a, b = track['source'], track['destination']
+        if a in closed_stations or b in closed_stations or a not in index.stations or b not in index.stations:
+            continue
+        directions = [(a, b)] + ([(b, a)] if track.get('bidirectional', False) else [])
+        if all(d in closed_edges for d in directions):
+            continue
+        key = tuple(sorted((a, b)))
+        weights[key] = min(weights.get(key, math.inf), float(track['distance']))
+    parent = {s: s for s in stations}
+
+    def find(s):
+        while parent[s] != s:
+            parent[s] = parent[parent[s]]
+            s = parent[s]
+        return s
+
+    total, links = 0.0, 0
+    for key in sorted(weights, key=lambda k: (weights[k], k)):
+        a, b = find(key[0]), find(key[1])
+        if a != b:
+            parent[a] = b
+            total += weights[key]
+            links += 1
+    return round(total, 6), len(stations) - links
+
+
+def check_mst(client, railway):
+    result = client.get('/api/mst').get_json()
+    total, components = brute_force_forest(railway)
+    assert result['totalWeight'] == total
+    assert result['components'] == components
+    assert result['connected'] == (components <= 1)
+    assert len(result['edges']) == len(railway.store.index.stations) - len(railway.store.closures.closed_stations()) - components
+    return result
+
+
+def test_mst_matches_kruskal(client, railway):
+    check_mst(client, railway)
+
+
+def test_mst_counts_added_and_removed_stations(client, railway):
+    before = check_mst(client, railway)
+    station = {'id': 'MSTISO', 'name': 'Isolated', 'latitude': 10.0, 'longitude': 70.0}
+    assert client.post('/api/add-station', json=station).status_code == 200
+    after = check_mst(client, railway)
+    assert after['components'] == before['components'] + 1
+    assert not after['connected']
+    assert client.delete('/api/stations/MSTISO').status_code == 200
+    assert check_mst(client, railway)['components'] == before['components']
+
+
+def test_mst_follows_track_changes_and_closures(client, railway):
+    check_mst(client, railway)
+    station = {'id': 'MSTNEW', 'name': 'Spur', 'latitude': 28.7, 'longitude': 77.3}
+    assert client.post('/api/add-station', json=station).status_code == 200
+    track = {'source': 'DEL', 'destination': 'MSTNEW', 'distance': 12.5, 'capacity': 10, 'bidirectional': True}
+    assert client.post('/api/add-track', json=track).status_code == 200
+    check_mst(client, railway)
+
+    # A cheap shortcut between two existing stations replaces the heaviest edge on its cycle
+    first, second = sorted(railway.store.index.stations)[:2]
+    shortcut = {'source': first, 'destination': second, 'distance': 0.5, 'capacity': 10, 'bidirectional': True}
+    existing = railway.store.index.get_track(first, second)
+    if existing is None:
+        assert client.post('/api/add-track', json=shortcut).status_code == 200
+        check_mst(client, railway)
+
+    closure = {'source': 'DEL', 'destination': 'MSTNEW', 'reason': 'test', 'duration': 2}
+    response = client.post('/api/add-track-closure', json=closure)
+    assert response.status_code == 200
+    check_mst(client, railway)
+    assert client.delete(f"/api/track-closures/{response.get_json()['closure']['id']}").status_code == 200
+    check_mst(client, railway)
+
+    if existing is None:
+        assert client.delete(f"/api/tracks/{first}/{second}").status_code == 200
+    assert client.delete('/api/tracks/DEL/MSTNEW').status_code == 200
+    assert client.delete('/api/stations/MSTNEW').status_code == 200
+    check_mst(client, railway)
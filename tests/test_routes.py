@@ -0,0 +1,205 @@
+import heapq
+import json
+from collections import deque
+
+import pytest
+
+
+def batch(client, queries):
+    response = client.post('/api/routes/batch', json={'queries': queries})
+    assert response.status_code == 200
+    return sorted((json.loads(line) for line in response.get_data(as_text=True).splitlines()),
+                  key=lambda line: line['index'])
+
+
+def test_batch_routes_match_between_pool_and_inline(client, railway, monkeypatch):
+    stations = sorted(railway.store.index.stations)[:8]
+    queries = [{'from': a, 'to': b, 'k': 2} for a in stations for b in stations if a != b]
+    assert len(queries) > railway.ROUTE_BATCH_INLINE_LIMIT
+    pooled = batch(client, queries)
+    monkeypatch.setattr(railway, 'ROUTE_BATCH_INLINE_LIMIT', len(queries))
+    assert batch(client, queries) == pooled
+    assert len(pooled) == len(queries)
+
+
+def test_batch_pool_workers_are_spawned(client, railway):
+    graph = railway.get_route_graph('distance')
+    pool = railway.get_batch_pool(graph, ('distance', id(railway.store.index), railway.store.index.network_version))
+    assert pool._mp_context.get_start_method() == 'spawn'
+
+
+def test_batch_workers_import_without_side_effects(railway):
+    graph = railway.get_route_graph('distance')
+    pool = railway.get_batch_pool(graph, ('distance', id(railway.store.index), railway.store.index.network_version))
+    # The worker imported x to unpickle its graph; that import must not have opened anything
+    check = ("(lambda x: (x.store.data, x.store._started, x.store.file_lock._fd, x._timetable, len(x._batch_graph)))"
+             "(__import__('sys').modules['x'])")
+    assert pool.submit(eval, check).result(timeout=60) == (None, False, None, None, len(graph))
+
+
+def adjacency(railway, metric):
+    """{u: {v: cost}} over open tracks, cheapest parallel track per direction"""
+    graph = {}
+    for track in railway.store.get()['tracks']:
+        cost = float(track.get(metric, track['distance']))
+        pairs = [(track['source'], track['destination'])]
+        if track.get('bidirectional', False):
+            pairs.append((track['destination'], track['source']))
+        for u, v in pairs:
+            edges = graph.setdefault(u, {})
+            edges[v] = min(edges.get(v, float('inf')), cost)
+    return graph
+
+
+def distances_to(graph, target):
+    """Exact shortest distance from every station to ``target``"""
+    reverse = {}
+    for u, edges in graph.items():
+        for v, cost in edges.items():
+            reverse.setdefault(v, []).append((u, cost))
+    best = {target: 0.0}
+    queue = [(0.0, target)]
+    while queue:
+        d, v = heapq.heappop(queue)
+        if d > best[v]:
+            continue
+        for u, cost in reverse.get(v, ()):
+            if d + cost < best.get(u, float('inf')):
+                best[u] = d + cost
+                heapq.heappush(queue, (d + cost, u))
+    return best
+
+
+def simple_path_costs(graph, source, target, limit):
+    """Costs of every loop-free path from source to target costing at most ``limit``"""
+    remaining = distances_to(graph, target)
+    costs = []
+
+    def extend(u, cost, seen):
+        if u == target:
+            costs.append(cost)
+            return
+        for v, step in graph.get(u, {}).items():
+            if v not in seen and cost + step + remaining.get(v, float('inf')) <= limit + 1e-6:
+                extend(v, cost + step, seen | {v})
+
+    extend(source, 0.0, {source})
+    return sorted(costs)
+
+
+@pytest.mark.parametrize('source, destination', [('DEL', 'MAS'), ('HWH', 'CSTM'), ('DEL', 'NZM'), ('SBC', 'LKO')])
+def test_k_shortest_paths_match_enumeration(client, railway, source, destination):
+    k = 4
+    result = batch(client, [{'from': source, 'to': destination, 'k': k}])[0]
+    paths = result['paths']
+    assert result['status'] == 'success' and paths
+    graph = adjacency(railway, 'distance')
+    for path in paths:
+        assert path['path'][0] == source and path['path'][-1] == destination
+        assert len(set(path['path'])) == len(path['path'])
+        assert path['cost'] == pytest.approx(sum(graph[u][v] for u, v in zip(path['path'], path['path'][1:])))
+    assert len({tuple(path['path']) for path in paths}) == len(paths)
+    expected = simple_path_costs(graph, source, destination, paths[-1]['cost'])[:k]
+    assert [path['cost'] for path in paths] == pytest.approx(expected, abs=1e-3)
+    single = client.get('/api/route', query_string={'from': source, 'to': destination}).get_json()
+    assert single['cost'] == pytest.approx(paths[0]['cost'], abs=1e-3)
+
+
+def edmonds_karp(graph, source, sink):
+    residual = {u: dict(edges) for u, edges in graph.items()}
+    for u, edges in graph.items():
+        for v in edges:
+            residual.setdefault(v, {}).setdefault(u, 0.0)
+    flow = 0.0
+    while True:
+        previous = {source: None}
+        queue = deque([source])
+        while queue and sink not in previous:
+            u = queue.popleft()
+            for v, capacity in residual[u].items():
+                if capacity > 1e-9 and v not in previous:
+                    previous[v] = u
+                    queue.append(v)
+        if sink not in previous:
+            return flow
+        path = []
+        v = sink
+        while previous[v] is not None:
+            path.append((previous[v], v))
+            v = previous[v]
+        pushed = min(residual[u][v] for u, v in path)
+        for u, v in path:
+            residual[u][v] -= pushed
+            residual[v][u] += pushed
+        flow += pushed
+
+
+@pytest.mark.parametrize('source, sink', [('NOWHERE', 'MAS'), ('DEL', 'NOWHERE')])
+def test_unknown_station_is_404_like_route(client, source, sink):
+    flow = client.get('/api/maxflow', query_string={'source': source, 'sink': sink})
+    route = client.get('/api/route', query_string={'from': source, 'to': sink})
+    assert flow.status_code == route.status_code == 404
+    assert flow.get_json() == route.get_json() == {'status': 'error', 'message': 'Station not found'}
+    batch = client.post('/api/maxflow', json={'pairs': [[source, sink]]}).get_json()
+    assert batch['results'][0]['message'] == 'Station not found'
+
+
+@pytest.mark.parametrize('source, sink', [('DEL', 'MAS'), ('HWH', 'CSTM'), ('LKO', 'SBC')])
+def test_max_flow_matches_edmonds_karp_and_its_cut(client, railway, source, sink):
+    result = client.get('/api/maxflow', query_string={'source': source, 'sink': sink}).get_json()
+    graph = adjacency(railway, 'capacity')
+    assert result['maxFlow'] == pytest.approx(edmonds_karp(graph, source, sink))
+    assert sum(edge['capacity'] for edge in result['minCut']) == pytest.approx(result['maxFlow'])
+    cut = {(edge['from'], edge['to']) for edge in result['minCut']}
+    reachable = {source}
+    queue = deque([source])
+    while queue:
+        u = queue.popleft()
+        for v, capacity in graph.get(u, {}).items():
+            if (u, v) not in cut and capacity > 0 and v not in reachable:
+                reachable.add(v)
+                queue.append(v)
+    assert sink not in reachable
+
+
+@pytest.mark.parametrize('latitude, longitude', [('abc', 77.0), (None, 77.0), (28.6, [77]), (91, 77.0),
+                                                 (28.6, -180.5), (float('nan'), 77.0), (28.6, float('inf'))])
+def test_station_coordinates_must_be_usable(client, railway, latitude, longitude):
+    station = {'id': 'BADCOORD', 'name': 'Bad', 'latitude': latitude, 'longitude': longitude}
+    response = client.post('/api/add-station', json=station)
+    assert response.status_code == 400
+    assert 'latitude' in response.get_json()['message']
+    assert 'BADCOORD' not in railway.store.index.stations
+
+    body = '\n'.join(json.dumps(dict(record, collection='stations')) for record in [
+        {'id': 'BULKGOOD', 'name': 'Good', 'latitude': 12.5, 'longitude': 77.5}, station])
+    report = client.post('/api/bulk-import', data=body).get_json()
+    assert report['imported']['stations'] == 1
+    assert [(e['line'], e['key']) for e in report['errors']] == [(2, 'BADCOORD')]
+    assert 'BADCOORD' not in railway.store.index.stations
+    assert client.delete('/api/stations/BULKGOOD').status_code == 200
+
+
+def test_station_with_bad_stored_coordinates_does_not_break_routing(client, railway):
+    # A legacy record that never went through add-station's checks
+    index = railway.store.index
+    station = {'id': 'LEGACY', 'name': 'Legacy', 'latitude': 'abc', 'longitude': None}
+    tracks = [{'source': 'DEL', 'destination': 'LEGACY', 'distance': 1.0, 'capacity': 5, 'bidirectional': True},
+              {'source': 'LEGACY', 'destination': 'MAS', 'distance': 1.0, 'capacity': 5, 'bidirectional': True}]
+    index.insert('stations', station)
+    for track in tracks:
+        index.insert('tracks', track)
+    try:
+        for source, destination in [('DEL', 'MAS'), ('LEGACY', 'HWH'), ('HWH', 'LEGACY')]:
+            response = client.get('/api/route', query_string={'from': source, 'to': destination})
+            assert response.status_code == 200
+            graph = railway.get_route_graph('distance')
+            dist, _ = graph.shortest_path_tree(graph.position[source])
+            assert response.get_json()['cost'] == pytest.approx(dist[graph.position[destination]], abs=1e-3)
+        assert client.get('/api/route', query_string={'from': 'DEL', 'to': 'MAS'}).get_json()['path'] == \
+            ['DEL', 'LEGACY', 'MAS']
+        assert client.get('/api/maxflow', query_string={'source': 'DEL', 'sink': 'MAS'}).status_code == 200
+    finally:
+        for track in tracks:
+            index.delete('tracks', track)
+        index.delete('stations', station)
@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+
+@pytest.fixture
+def grid(railway):
+    """A grid over random stations, clustered around both poles and the antimeridian"""
+    rng = random.Random(23)
+    grid = railway.StationGrid()
+    points = {}
+    for i in range(3000):
+        if i % 3 == 0:
+            lat, lon = rng.uniform(-20, 20), rng.choice((-1, 1)) * rng.uniform(175, 180)
+        elif i % 3 == 1:
+            lat, lon = rng.choice((-1, 1)) * rng.uniform(80, 90), rng.uniform(-180, 180)
+        else:
+            lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        points[f"S{i}"] = (lat, lon)
+        grid.add({'id': f"S{i}", 'latitude': lat, 'longitude': lon})
+    return grid, points
+
+
+def brute_nearest(railway, points, lat, lon, n, max_km=None):
+    pairs = sorted((railway.haversine_km(lat, lon, *p), station_id) for station_id, p in points.items())
+    return [station_id for distance, station_id in pairs if max_km is None or distance <= max_km][:n]
+
+
+def test_nearest_matches_brute_force_across_the_antimeridian(railway, grid):
+    grid, points = grid
+    rng = random.Random(5)
+    queries = [(0.0, 180.0), (0.0, -180.0), (10.0, 179.9), (-5.0, -179.9), (89.9, 0.0), (-89.9, 90.0)]
+    queries += [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(100)]
+    for lat, lon in queries:
+        for n, max_km in ((1, None), (7, None), (25, 800.0)):
+            got = [station_id for _, station_id in grid.nearest(lat, lon, n, max_km)]
+            assert got == brute_nearest(railway, points, lat, lon, n, max_km), (lat, lon, n, max_km)
+
+
+def test_nearest_finds_station_just_across_the_antimeridian(railway):
+    grid = railway.StationGrid()
+    grid.add({'id': 'EAST', 'latitude': 0.0, 'longitude': 179.99})
+    grid.add({'id': 'FAR', 'latitude': 0.0, 'longitude': 170.0})
+    assert [station_id for _, station_id in grid.nearest(0.0, -179.99, 1)] == ['EAST']
+
+
+@pytest.mark.parametrize('box', [(-10, 170, 10, -170), (-90, -180, 90, 180), (0, 179, 5, 180), (-5, -180, 5, -179)])
+def test_bbox_matches_brute_force(grid, box):
+    grid, points = grid
+    south, west, north, east = box
+    if west <= east:
+        expected = {s for s, (lat, lon) in points.items() if south <= lat <= north and west <= lon <= east}
+    else:
+        expected = {s for s, (lat, lon) in points.items() if south <= lat <= north and (lon >= west or lon <= east)}
+    assert set(grid.in_bbox(*box)) == expected
+
+
+def test_grid_follows_station_edits(client, railway):
+    station = {'id': 'GRIDNEW', 'name': 'Grid test', 'latitude': -33.0, 'longitude': 151.0}
+    assert client.post('/api/add-station', json=station).status_code == 200
+    nearest = client.get('/api/stations/nearest?lat=-33&lon=151&n=1').get_json()['stations']
+    assert nearest[0]['id'] == 'GRIDNEW'
+    assert client.delete('/api/stations/GRIDNEW').status_code == 200
+    nearest = client.get('/api/stations/nearest?lat=-33&lon=151&n=1').get_json()['stations']
+    assert nearest[0]['id'] != 'GRIDNEW'
+
+
+@pytest.mark.parametrize('query', ['lat=100&lon=0', 'lat=1', 'lat=1&lon=1&n=0', 'lat=1&lon=1&n=x', 'lat=1&lon=1&maxKm=x'])
+def test_nearest_rejects_bad_queries(client, query):
+    assert client.get(f"/api/stations/nearest?{query}").status_code == 400
@@ -0,0 +1,169 @@
+import copy
+import json
+import os
+import time
+
+import pytest
+
+
+def by_key(railway, data):
+    return {name: {railway.record_key(name, r): r for r in data.get(name, [])} for name in railway.RECORD_KEYS}
+
+
+def make_changes(client, railway, train):
+    date = '2033-03-03'
+    booking = {'trainId': train['id'], 'date': date, 'from': train['route'][0], 'to': train['route'][-1],
+               'class': '1ac'}
+    for i, class_type in enumerate(['1ac', '2ac', '3ac', 'sleeper']):
+        response = client.post('/api/bookings', json=dict(booking, bookingId=f"STORE{i}", **{'class': class_type}))
+        assert response.get_json()['bookingId'] == f"STORE{i}"
+    # Folds into STORE0, which is then updated in place
+    assert client.post('/api/bookings', json=dict(booking, bookingId='STORE-MERGE')).get_json()['bookingId'] == 'STORE0'
+    assert client.delete('/api/bookings/STORE1').status_code == 200
+    assert client.delete('/api/bookings/STORE3').status_code == 200
+    station = {'id': 'STORENEW', 'name': 'Storage test', 'latitude': 20.0, 'longitude': 80.0}
+    assert client.post('/api/add-station', json=station).status_code == 200
+    closure = {'stationId': 'STORENEW', 'reason': 'test', 'duration': 2}
+    assert client.post('/api/add-station-closure', json=closure).status_code == 200
+    assert client.put(f"/api/trains/{train['id']}", json=dict(train, name='Storage test')).status_code == 200
+
+
+def test_reopened_repository_matches_memory(client, railway, backend, stores, train):
+    first, _ = stores
+    make_changes(client, railway, first.index.trains[train['id']])
+    repo = backend[0]()
+    try:
+        data, _ = repo.load()
+    finally:
+        repo.close()
+    assert by_key(railway, data) == by_key(railway, first.data)
+
+
+def test_other_worker_replays_changes(client, railway, stores, train):
+    first, second = stores
+    make_changes(client, railway, first.index.trains[train['id']])
+    with second.writing():
+        assert by_key(railway, second.data) == by_key(railway, first.data)
+        assert set(second.index.bookings) == set(first.index.bookings)
+        for name in railway.INDEXED_COLLECTIONS:
+            assert second.index.lists[name] is second.data[name]
+            assert {id(r): i for i, r in enumerate(second.data[name])} == second.index.slots[name]
+        segment = second.inventory.segment(second.index.trains[train['id']], train['route'][0], train['route'][-1])
+        trip = (second.index.trains[train['id']], '2033-03-03', '1ac', *segment)
+        assert second.inventory.available(*trip) == first.inventory.available(
+            first.index.trains[train['id']], '2033-03-03', '1ac', *segment)
+        assert second.closures.is_station_closed('STORENEW')
+
+
+def write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+@pytest.mark.parametrize('sync_mode', ['always', 'batch', 'none'])
+def test_journal_compaction_in_every_sync_mode(client, railway, tmp_path, monkeypatch, sync_mode):
+    json_path = str(tmp_path / 'railways.json')
+    write_json(json_path, copy.deepcopy(railway.store.get()))
+
+    def open_repo():
+        return railway.JsonRepository(json_path, railway.Journal(json_path + '.journal', sync_mode))
+
+    lock_path = str(tmp_path / 'railways.lock')
+    store, other = railway.NetworkStore(open_repo(), lock_path), railway.NetworkStore(open_repo(), lock_path)
+    store.get()
+    other.get()
+    monkeypatch.setattr(railway, 'store', store)
+    monkeypatch.setattr(railway, 'JOURNAL_COMPACT_EVENTS', 4)
+    try:
+        for i in range(4):
+            station = {'id': f"COMPACT{i}", 'name': 'Compacted', 'latitude': 21.0, 'longitude': 81.0 + i}
+            assert client.post('/api/add-station', json=station).status_code == 200
+        assert client.delete('/api/stations/COMPACT3').status_code == 200
+        # The fourth event wakes the background compaction
+        deadline = time.monotonic() + 10
+        while os.path.getsize(json_path + '.journal') and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert os.path.getsize(json_path + '.journal') == 0
+        with open(json_path) as f:
+            snapshot = json.load(f)
+        assert by_key(railway, snapshot) == by_key(railway, store.data)
+        assert {'COMPACT0', 'COMPACT1', 'COMPACT2'} <= {s['id'] for s in snapshot['stations']}
+
+        # Events after the compaction land in the emptied journal
+        assert client.delete('/api/stations/COMPACT2').status_code == 200
+        events, _ = railway.Journal(json_path + '.journal').read_events()
+        assert [event for _, event in events] == [{'op': 'delete', 'collection': 'stations', 'key': 'COMPACT2'}]
+        reopened = open_repo()
+        try:
+            data, _ = reopened.load()
+        finally:
+            reopened.close()
+        assert by_key(railway, data) == by_key(railway, store.data)
+        with other.writing():
+            assert by_key(railway, other.data) == by_key(railway, store.data)
+    finally:
+        store.repo.close()
+        other.repo.close()
+
+
+def seeded_database(railway, db_path, json_path):
+    return railway.SqliteRepository(db_path, 'always',
+                                    seed=railway.JsonRepository(json_path, railway.Journal(json_path + '.journal', 'none')))
+
+
+def test_empty_database_imports_the_json_data_once(railway, tmp_path):
+    json_path, db_path = str(tmp_path / 'railways.json'), str(tmp_path / 'railways.db')
+    data = copy.deepcopy(railway.store.get())
+    write_json(json_path, data)
+    pending = {'id': 'SEEDED', 'name': 'Journalled', 'latitude': 22.0, 'longitude': 82.0}
+    journal = railway.Journal(json_path + '.journal', 'always')
+    journal.append({'op': 'put', 'collection': 'stations', 'record': pending})
+    journal.close()
+
+    first, second = seeded_database(railway, db_path, json_path), seeded_database(railway, db_path, json_path)
+    try:
+        imported, position = first.load()
+        assert by_key(railway, imported) == by_key(railway, dict(data, stations=data['stations'] + [pending]))
+        assert first.stamp() == 1
+        # A second worker starting on the same file finds it written and leaves it alone
+        write_json(json_path, railway.empty_data())
+        assert by_key(railway, second.load()[0]) == by_key(railway, imported)
+        assert second.stamp() == 1 and second.position() == position
+    finally:
+        first.close()
+        second.close()
+
+
+def test_databases_in_use_are_not_seeded(railway, tmp_path):
+    json_path, db_path = str(tmp_path / 'railways.json'), str(tmp_path / 'railways.db')
+    station = {'id': 'ONLY', 'name': 'Only', 'latitude': 23.0, 'longitude': 83.0}
+    repo = railway.SqliteRepository(db_path, 'always')
+    repo.append({'op': 'put', 'collection': 'stations', 'record': station})
+    repo.close()
+    write_json(json_path, copy.deepcopy(railway.store.get()))
+    repo = seeded_database(railway, db_path, json_path)
+    try:
+        assert repo.load()[0]['stations'] == [station]
+    finally:
+        repo.close()
+
+    # Without JSON data an empty database simply starts empty
+    os.remove(json_path)
+    repo = seeded_database(railway, str(tmp_path / 'fresh.db'), json_path)
+    try:
+        assert repo.load()[0] == railway.empty_data()
+        assert repo.stamp() == 0
+    finally:
+        repo.close()
+
+
+def test_sqlite_backend_starts_from_the_json_data(railway, tmp_path, monkeypatch):
+    monkeypatch.setattr(railway, 'SQLITE_FILE', str(tmp_path / 'railways.db'))
+    source = railway.JsonRepository(railway.DATA_FILE, railway.Journal(railway.JOURNAL_FILE, 'none'))
+    repo = railway.open_repository('sqlite')
+    try:
+        expected, _ = source.load()
+        assert by_key(railway, repo.load()[0]) == by_key(railway, expected)
+    finally:
+        repo.close()
+        source.close()
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def snapshotting(railway, monkeypatch):
+    """Treat every timetable as large enough to snapshot, starting from a cold cache"""
+    monkeypatch.setattr(railway, 'TIMETABLE_SNAPSHOT_MIN_TRAINS', 1)
+    monkeypatch.setattr(railway, '_timetable', None)
+    monkeypatch.setattr(railway, '_timetable_saved', None)
+    if os.path.exists(railway.TIMETABLE_SNAPSHOT):
+        os.unlink(railway.TIMETABLE_SNAPSHOT)
+    yield railway
+    if os.path.exists(railway.TIMETABLE_SNAPSHOT):
+        os.unlink(railway.TIMETABLE_SNAPSHOT)
+
+
+def test_rebuilds_do_not_write_the_snapshot(client, snapshotting):
+    assert client.get('/api/search?from=DEL&to=LKO').status_code == 200
+    assert not os.path.exists(snapshotting.TIMETABLE_SNAPSHOT)
+
+
+def test_snapshot_is_written_once_per_state_and_maps_back(client, snapshotting):
+    railway = snapshotting
+    built = railway.get_timetable()
+    assert railway.save_timetable_snapshot()
+    assert not railway.save_timetable_snapshot()
+    loaded = railway.Timetable.load(railway.TIMETABLE_SNAPSHOT, railway.store.fingerprint())
+    assert loaded is not None
+    for source, destination in [('DEL', 'LKO'), ('HWH', 'CSTM'), ('MAS', 'SBC')]:
+        assert sorted(loaded.search(source, destination)) == sorted(built.search(source, destination))
+
+
+def test_stale_snapshot_is_rewritten_after_a_change(client, snapshotting, train):
+    railway = snapshotting
+    railway.get_timetable()
+    assert railway.save_timetable_snapshot()
+    assert client.put(f"/api/trains/{train['id']}", json=dict(train, name='Snapshot test')).status_code == 200
+    railway.get_timetable()
+    assert railway.save_timetable_snapshot()
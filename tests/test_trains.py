@@ -0,0 +1,84 @@
+import copy
+
+import pytest
+
+
+@pytest.fixture
+def spare_train(client, railway):
+    """A train with distinct stops the test may edit; it is put back afterwards"""
+    train = next(t for t in reversed(railway.store.get()['trains'])
+                 if len(t['route']) >= 3 and len(set(t['route'])) == len(t['route']))
+    original = copy.deepcopy(train)
+    yield train
+    assert client.put(f"/api/trains/{original['id']}", json=original).status_code == 200
+
+
+def index_matches_store(railway):
+    trains = railway.store.get()['trains']
+    return set(railway.store.index.trains) == {t['id'] for t in trains} and len(trains) == len(railway.store.index.trains)
+
+
+def test_update_changes_train_and_index(client, railway, spare_train):
+    train_id = spare_train['id']
+    dropped = spare_train['route'][-1]
+    updated = dict(copy.deepcopy(spare_train), name='Renamed', route=spare_train['route'][:-1],
+                   timings=spare_train['timings'][:len(spare_train['route']) - 1])
+    response = client.put(f"/api/trains/{train_id}", json=updated)
+    assert response.status_code == 200
+    assert railway.store.index.trains[train_id]['name'] == 'Renamed'
+    assert railway.store.index.trains[train_id] is spare_train
+    assert train_id not in railway.store.index.station_trains.get(dropped, set())
+    assert index_matches_store(railway)
+
+
+@pytest.mark.parametrize('body', [
+    {'name': 'No id'},
+    {'id': 'SOMETHING-ELSE', 'name': 'Changed id'},
+    {'id': None},
+    [],
+])
+def test_update_rejects_bad_id_without_touching_index(client, railway, spare_train, body):
+    before = copy.deepcopy(spare_train)
+    response = client.put(f"/api/trains/{spare_train['id']}", json=body)
+    assert response.status_code == 400
+    assert response.get_json()['status'] == 'error'
+    assert spare_train == before
+    assert index_matches_store(railway)
+
+
+def test_update_rejects_duplicate_id(client, railway, spare_train):
+    other = railway.store.get()['trains'][0]
+    response = client.put(f"/api/trains/{spare_train['id']}", json=dict(spare_train, id=other['id']))
+    assert response.status_code == 400
+    assert railway.store.index.trains[other['id']] is other
+    assert index_matches_store(railway)
+
+
+@pytest.mark.parametrize('route', ['DEL', ['NOWHERE'], [['DEL']]])
+def test_update_rejects_bad_route(client, railway, spare_train, route):
+    before = copy.deepcopy(spare_train)
+    response = client.put(f"/api/trains/{spare_train['id']}", json=dict(spare_train, route=route))
+    assert response.status_code == 400
+    assert spare_train == before
+    assert index_matches_store(railway)
+
+
+def test_update_unknown_train_is_404(client):
+    assert client.put('/api/trains/NO-SUCH-TRAIN', json={'id': 'NO-SUCH-TRAIN'}).status_code == 404
+
+
+def test_update_recounts_seats_for_new_route(client, railway, spare_train):
+    date = '2032-02-02'
+    inventory = railway.store.inventory
+    route = spare_train['route']
+    railway.store.index.add_booking({
+        'bookingId': 'TRAIN-TEST-1', 'trainId': spare_train['id'], 'date': date,
+        'from': route[0], 'to': route[-1], 'class': '1ac', 'status': 'confirmed', 'passengerCount': 2,
+    })
+    inventory.reset_train(spare_train['id'])
+    assert inventory.available(spare_train, date, '1ac', 0, len(route) - 1) == inventory.capacity(spare_train, '1ac') - 2
+    # The booking's destination is no longer on the route, so it holds no seats
+    updated = dict(copy.deepcopy(spare_train), route=route[:-1], timings=spare_train['timings'][:len(route) - 1])
+    assert client.put(f"/api/trains/{spare_train['id']}", json=updated).status_code == 200
+    assert inventory.available(spare_train, date, '1ac', 0, len(route) - 2) == inventory.capacity(spare_train, '1ac')
+    railway.store.index.remove_booking(railway.store.index.bookings['TRAIN-TEST-1'])
@@ -0,0 +1,13 @@
+"""Production entry point.
+
+Run with gunicorn using the settings in gunicorn.conf.py:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+or with waitress on platforms without fork/flock (single process):
+
+    waitress-serve --port=5000 --threads=8 wsgi:app
+"""
+from x import app
+
+application = app
@@ -1,14 +1,124 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, has_request_context, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+import atexit
+import csv
+import gzip
+import hashlib
+import heapq
+import io
 import json
+import math
+import mmap
+import multiprocessing
 import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
 from datetime import datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+try:
+    import fcntl
+except ImportError:  # no flock on Windows: run a single worker process there
+    fcntl = None
+
+try:
+    import numpy as np
+except ImportError:  # optional: timetable queries fall back to plain loops
+    np = None
+
+try:
+    import brotli
+except ImportError:  # optional: without it responses are gzip-compressed only
+    brotli = None
 
 app = Flask(__name__, static_folder='static')
 CORS(app)  # Enable CORS for all routes
 
 # Configuration
+# Fare calculation parameters (kept in step with script/booking.js)
+FARE_CONFIG = {
+    'baseFarePerKm': {
+        'sleeper': 0.6,
+        '3ac': 1.5,
+        '2ac': 2.2,
+        '1ac': 4.0,
+        'chair car': 1.8,
+        'executive chair car': 3.0
+    },
+    'quotaMultipliers': {
+        'general': 1.0,
+        'tatkal': 1.3,
+        'premium tatkal': 1.5,
+        'ladies': 0.75,
+        'senior citizen': 0.5
+    },
+    'trainMultipliers': {
+        'default': 1.0,
+        'Rajdhani Express': 1.6,
+        'Shatabdi Express': 1.6,
+        'Duronto Express': 1.6,
+        'Garib Rath Express': 1.3,
+        'Sampark Kranti Express': 1.3,
+        'Superfast Express': 1.2,
+        'Jan Shatabdi Express': 1.1,
+        'Intercity Express': 1.0,
+        'Mail Express': 1.0,
+        'Passenger Special': 0.8
+    }
+}
+
+# Seats per train and class unless a train sets its own "seats": {class: n}
+SEAT_CAPACITY = {
+    'sleeper': 720,
+    '3ac': 384,
+    '2ac': 184,
+    '1ac': 48,
+    'chair car': 584,
+    'executive chair car': 112
+}
+
 DATA_FILE = 'data/railways.json'
+JOURNAL_FILE = 'data/railways.journal'
+LOCK_FILE = 'data/railways.lock'
+JOURNAL_SYNC = os.environ.get('RAILWAY_JOURNAL_SYNC', 'batch')  # 'always', 'batch' or 'none'
+STORAGE_BACKEND = os.environ.get('RAILWAY_STORAGE', 'json')  # 'json' or 'sqlite'
+SQLITE_FILE = 'data/railways.db'
+SQLITE_EVENT_RETENTION = 10000  # change events kept in SQLite for other workers to catch up
+JOURNAL_BATCH_INTERVAL = 0.05  # seconds between fsyncs in 'batch' mode
+JOURNAL_COMPACT_EVENTS = 1000  # compact once this many events are pending
+JOURNAL_COMPACT_INTERVAL = 60  # ...or at least this often (seconds)
+EDGE_LOG_LIMIT = 10000  # track changes remembered for incremental consumers
+CHANGE_LOG_LIMIT = 10000  # record changes kept for /api/changes
+BOOKING_PAGE_SIZE = 100  # default page size for /api/bookings
+BOOKING_PAGE_MAX = 1000  # largest page a client may ask for
+BOOKING_STREAM_CHUNK = 1000  # bookings serialized per read-lock hold when streaming
+SORTED_IDS_CHUNK = 1000  # ids per chunk of the all-bookings id list (see SortedIds)
+BULK_IMPORT_BATCH = 1000  # records validated and committed together by /api/bulk-import
+BULK_IMPORT_MAX_ERRORS = 1000  # per-record errors listed in an import report
+TIMETABLE_SNAPSHOT = 'data/timetable.bin'
+TIMETABLE_SNAPSHOT_MIN_TRAINS = 1000  # smaller timetables rebuild faster than a snapshot pays off
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+PROFILING = os.environ.get('RAILWAY_PROFILING', '0') == '1'  # opt in to per-request profiles via PROFILE_HEADER
+PROFILE_HEADER = 'X-Profile'
+PROFILE_INTERVAL = 0.001  # seconds between stack samples
+PROFILE_DIR = 'data/profiles'
+PROFILE_KEEP = 20  # saved profiles kept on disk
+IMPACT_WORKERS = 2  # threads analysing the impact of new closures
+IMPACT_JOB_DIR = 'data/jobs'
+IMPACT_JOB_KEEP = 200  # closure-impact jobs kept in memory and on disk
+IMPACT_BOOKING_LIMIT = 1000  # affected bookings listed per job (all are counted)
+SPATIAL_CELL_DEGREES = 0.5  # lat/lon cell size of the station grid
+NEAREST_MAX = 100  # most stations /api/stations/nearest returns
+BBOX_MAX_STATIONS = 5000  # most stations /api/network/bbox returns
 
 # Global variable to cache counts
 metrics_cache = {
@@ -20,65 +130,2055 @@ metrics_cache = {
     'total_station_closures':0
 }
 
-# Ensure data directory exists
-os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
 
-def load_data():
-    """Load railway data from JSON file and clean up expired closures"""
-    if not os.path.exists(DATA_FILE):
-        return {
-            "stations": [],
-            "tracks": [],
-            "trains": [],
-            "bookings": [],
-            "station_closures": [],
-            "track_closures": []
-        }
-    
-    with open(DATA_FILE) as f:
-        data = json.load(f)
-    
-    current_time = datetime.now()
-    
-    # Clean up expired station closures
-    if 'station_closures' in data:
-        initial_count = len(data['station_closures'])
-        data['station_closures'] = [
-            c for c in data['station_closures']
-            if 'startTime' in c and 
-            current_time - datetime.fromisoformat(c['startTime']) < timedelta(hours=c.get('duration', 0))
-        ]
-        if len(data['station_closures']) != initial_count:
-            save_data(data)  # Save if we removed any
-    
-    # Clean up expired track closures
-    if 'track_closures' in data:
-        initial_count = len(data['track_closures'])
-        data['track_closures'] = [
-            c for c in data['track_closures']
-            if 'startTime' in c and 
-            current_time - datetime.fromisoformat(c['startTime']) < timedelta(hours=c.get('duration', 0))
+def empty_data():
+    """Return an empty railway document"""
+    return {
+        "stations": [],
+        "tracks": [],
+        "trains": [],
+        "bookings": [],
+        "station_closures": [],
+        "track_closures": []
+    }
+
+# --------------------------
+# Instrumentation
+# --------------------------
+
+REQUEST_PHASES = ('lock', 'load', 'closures', 'serialize', 'write')
+_instrumented = threading.local()  # .phases / .active for the request this thread is serving
+
+@contextmanager
+def timed(phase):
+    """Charge the time spent in the block to ``phase`` of the current request.
+
+    Phases nest exclusively: while an inner phase runs the enclosing one
+    is paused, so a refresh inside lock acquisition counts as 'load' only.
+    Outside a request this does nothing.
+    """
+    phases = getattr(_instrumented, 'phases', None)
+    if phases is None:
+        yield
+        return
+    now = time.perf_counter()
+    outer = _instrumented.active
+    if outer is not None:
+        phases[outer[0]] = phases.get(outer[0], 0.0) + now - outer[1]
+    _instrumented.active = (phase, now)
+    try:
+        yield
+    finally:
+        now = time.perf_counter()
+        phases[phase] = phases.get(phase, 0.0) + now - _instrumented.active[1]
+        _instrumented.active = None if outer is None else (outer[0], now)
+
+def prometheus_labels(**labels):
+    """Render a Prometheus label set"""
+    escaped = (f'{k}="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+               for k, v in labels.items())
+    return '{' + ','.join(escaped) + '}'
+
+class Metrics:
+    """Request and storage counters for this process, rendered for Prometheus.
+
+    Latency is a fixed-bucket histogram per (route, method); phase time and
+    byte counts are plain counters. Routes are URL rules, not paths, so the
+    label set stays small. Each gunicorn worker keeps and serves its own.
+    """
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.latency = {}  # (route, method) -> [count per bucket..., +Inf count, sum]
+        self.responses = defaultdict(int)  # (route, method, status) -> count
+        self.phases = defaultdict(float)  # (route, method, phase) -> seconds
+        self.transferred = defaultdict(int)  # (route, method, direction) -> bytes
+        self.storage = defaultdict(int)  # direction -> bytes
+
+    def observe(self, route, method, status, seconds, phases, received, sent):
+        """Record one finished request"""
+        key = (route, method)
+        slot = bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[slot] += 1
+            histogram[-1] += seconds
+            self.responses[route, method, status] += 1
+            for phase, spent in phases.items():
+                self.phases[route, method, phase] += spent
+            self.transferred[route, method, 'in'] += received
+            self.transferred[route, method, 'out'] += sent
+
+    def count_storage(self, direction, size):
+        """Record bytes read from or written to the data store"""
+        with self._lock:
+            self.storage[direction] += size
+
+    def render(self):
+        """Prometheus text exposition format"""
+        with self._lock:
+            latency = {k: list(v) for k, v in self.latency.items()}
+            responses = dict(self.responses)
+            phases = dict(self.phases)
+            transferred = dict(self.transferred)
+            storage = dict(self.storage)
+        lines = [
+            '# HELP railway_request_duration_seconds Request latency by route.',
+            '# TYPE railway_request_duration_seconds histogram'
         ]
-        if len(data['track_closures']) != initial_count:
-            save_data(data)  # Save if we removed any
-    
+        for (route, method), histogram in sorted(latency.items()):
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), histogram):
+                total += count
+                labels = prometheus_labels(route=route, method=method, le=bound)
+                lines.append(f'railway_request_duration_seconds_bucket{labels} {total}')
+            labels = prometheus_labels(route=route, method=method)
+            lines.append(f'railway_request_duration_seconds_sum{labels} {histogram[-1]:.6f}')
+            lines.append(f'railway_request_duration_seconds_count{labels} {total}')
+        lines += ['# HELP railway_requests_total Responses by route and status.',
+                  '# TYPE railway_requests_total counter']
+        for (route, method, status), count in sorted(responses.items()):
+            lines.append(f'railway_requests_total{prometheus_labels(route=route, method=method, status=status)} {count}')
+        lines += ['# HELP railway_request_phase_seconds_total Request time spent in lock wait, data load, '
+                  'closure filtering, serialization and storage writes.',
+                  '# TYPE railway_request_phase_seconds_total counter']
+        for (route, method, phase), spent in sorted(phases.items()):
+            lines.append(f'railway_request_phase_seconds_total{prometheus_labels(route=route, method=method, phase=phase)} {spent:.6f}')
+        lines += ['# HELP railway_request_bytes_total Request bodies received and responses sent.',
+                  '# TYPE railway_request_bytes_total counter']
+        for (route, method, direction), size in sorted(transferred.items()):
+            lines.append(f'railway_request_bytes_total{prometheus_labels(route=route, method=method, direction=direction)} {size}')
+        lines += ['# HELP railway_storage_bytes_total Bytes read from and written to the data store.',
+                  '# TYPE railway_storage_bytes_total counter']
+        for direction, size in sorted(storage.items()):
+            lines.append(f'railway_storage_bytes_total{prometheus_labels(direction=direction)} {size}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with dumps() charged to the 'serialize' phase"""
+
+    def dumps(self, obj, **kwargs):
+        with timed('serialize'):
+            return super().dumps(obj, **kwargs)
+
+app.json = TimedJSONProvider(app)
+
+class SamplingProfiler:
+    """Samples one thread's stack from a background thread every ``interval`` seconds.
+
+    Samples are kept as collapsed stacks ("outer;inner;leaf count"), the
+    input format of flamegraph.pl and speedscope. Nothing runs unless a
+    request asks for a profile.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in
+                       sorted(self.samples.items(), key=lambda item: -item[1]))
+
+def save_profile(profile_id, text):
+    """Store a request profile where any worker can serve it, keeping the newest PROFILE_KEEP"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.txt"), 'w') as f:
+        f.write(text)
+    saved = sorted((entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith('.txt')),
+                   key=lambda entry: entry.stat().st_mtime)
+    for entry in saved[:-PROFILE_KEEP]:
+        os.unlink(entry.path)
+
+def count_stream(chunks, phases, finish):
+    """Pass a streamed body through, counting its bytes and charging its phases to the request"""
+    sent = 0
+    iterator = iter(chunks)
+    try:
+        while True:
+            _instrumented.phases, _instrumented.active = phases, None
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _instrumented.phases = None
+            sent += len(chunk) if isinstance(chunk, bytes) else len(chunk.encode())
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        finish(sent)
+
+@app.before_request
+def start_request_metrics():
+    """Start the request clock (and the profiler when PROFILE_HEADER asks for it)"""
+    _instrumented.phases = {}
+    _instrumented.active = None
+    g.request_started = time.perf_counter()
+    if PROFILING and request.headers.get(PROFILE_HEADER):
+        g.profile_id = f"{os.getpid()}-{time.time_ns()}"
+        g.profiler = SamplingProfiler(threading.get_ident()).start()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    method = request.method
+    phases = _instrumented.phases or {}
+    received = request.content_length or 0
+
+    def finish(sent):
+        metrics.observe(route, method, response.status_code, time.perf_counter() - started,
+                        phases, received, sent)
+
+    if response.is_streamed:
+        response.response = count_stream(response.response, phases, finish)
+    else:
+        finish(response.content_length or 0)
+    if 'profile_id' in g:
+        response.headers['X-Profile-Id'] = g.profile_id
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    _instrumented.phases = None
+    _instrumented.active = None
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        try:
+            save_profile(g.profile_id, profiler.collapsed())
+        except OSError as e:
+            app.logger.warning("Could not save profile %s: %s", g.profile_id, e)
+
+@app.route('/api/_metrics', methods=['GET'])
+def get_metrics():
+    """Request and storage metrics of this worker in Prometheus text format"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/_profile/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """A saved request profile as collapsed stacks"""
+    if not profile_id.replace('-', '').isalnum():
+        return jsonify({"status": "error", "message": "Invalid profile id"}), 400
+    try:
+        with open(os.path.join(PROFILE_DIR, f"{profile_id}.txt")) as f:
+            return Response(f.read(), mimetype='text/plain')
+    except FileNotFoundError:
+        return jsonify({"status": "error", "message": "Profile not found"}), 404
+
+# --------------------------
+# Concurrency
+# --------------------------
+
+class RWLock:
+    """Many readers or one writer within a process.
+
+    Waiting writers block new readers, so a steady stream of GETs cannot
+    starve a booking. The writer may re-acquire the lock, and may also
+    take it for reading.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = None
+        self._depth = 0
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._cond:
+            if self._writer == threading.get_ident():
+                self._depth += 1
+                return
+            while self._writer is not None or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            if self._writer == threading.get_ident():
+                self._depth -= 1
+                return
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        """Take the write lock; return False if this thread already held it"""
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._depth += 1
+                return False
+            self._waiting_writers += 1
+            while self._writer is not None or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = me
+            self._depth = 1
+            return True
+
+    def release_write(self):
+        with self._cond:
+            self._depth -= 1
+            if not self._depth:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        outermost = self.acquire_write()
+        try:
+            yield outermost
+        finally:
+            self.release_write()
+
+class FileLock:
+    """Exclusive lock shared by all worker processes, via flock on a side file.
+
+    Callers must already hold the in-process write lock, so only one
+    thread per process ever waits here; nested acquires just count.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._depth = 0
+
+    def __enter__(self):
+        if self._depth == 0 and fcntl is not None:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+# --------------------------
+# Booking Journal
+# --------------------------
+
+# Field that identifies a record in each journaled collection
+RECORD_KEYS = {
+    'stations': 'id',
+    'tracks': ('source', 'destination'),
+    'trains': 'id',
+    'bookings': 'bookingId',
+    'station_closures': 'id',
+    'track_closures': 'id'
+}
+
+def record_key(collection, record):
+    """Key identifying a record within its collection (tracks by their endpoints)"""
+    field = RECORD_KEYS[collection]
+    if isinstance(field, tuple):
+        return tuple(record.get(f) for f in field)
+    return record.get(field)
+
+def event_key(event):
+    """Key of the record an event puts or deletes"""
+    if event['op'] == 'put':
+        return record_key(event['collection'], event['record'])
+    key = event['key']
+    return tuple(key) if isinstance(key, list) else key  # JSON turns track keys into lists
+
+def apply_events(data, events):
+    """Replay journal events onto a railway document.
+
+    Events are upserts ('put') and deletes keyed by RECORD_KEYS, so
+    replaying an event that the snapshot already contains is harmless.
+    """
+    collections = {}
+    for event in events:
+        name = event['collection']
+        if name not in collections:
+            collections[name] = {record_key(name, r): r for r in data.get(name, [])}
+        records = collections[name]
+        if event['op'] == 'put':
+            records[event_key(event)] = event['record']
+        elif event['op'] == 'delete':
+            records.pop(event_key(event), None)
+    for name, records in collections.items():
+        data[name] = list(records.values())
+    return data
+
+class Journal:
+    """Append-only write-ahead log of record-level change events.
+
+    Each event is one JSON line. Durability depends on ``sync_mode``:
+    'always' fsyncs before append() returns, with concurrent writers
+    sharing a single fsync (group commit); 'batch' fsyncs from a
+    background thread every JOURNAL_BATCH_INTERVAL seconds; 'none'
+    leaves flushing to the OS.
+    """
+
+    def __init__(self, path, sync_mode='batch'):
+        if sync_mode not in ('always', 'batch', 'none'):
+            raise ValueError(f"Unknown journal sync mode: {sync_mode}")
+        self.path = path
+        self.sync_mode = sync_mode
+        self.pending_events = 0
+        self._file = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._written = 0
+        self._synced = 0
+        self._compact_wanted = threading.Event()
+        self._threads_started = False
+        self.compact_callback = None
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+        return self._file
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def read_events(self, start=0):
+        """Return ([(end offset, event), ...], end offset) for the complete events after byte ``start``"""
+        if not os.path.exists(self.path):
+            return [], 0
+        events = []
+        offset = start
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # another process is still writing this line
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    break  # torn write at the tail, ignore the rest
+                offset += len(line)
+                events.append((offset, event))
+        metrics.count_storage('read', offset - start)
+        if start == 0:
+            self.pending_events = len(events)
+        else:
+            self.pending_events += len(events)
+        return events, offset
+
+    def append(self, event):
+        """Append an event, make it durable according to sync_mode and return the new end offset"""
+        return self.append_many([event])
+
+    def append_many(self, events):
+        """Append events with a single write (and fsync) and return the new end offset"""
+        lines = b''.join((json.dumps(event, separators=(',', ':')) + '\n').encode() for event in events)
+        metrics.count_storage('written', len(lines))
+        with self._lock:
+            f = self._open()
+            f.write(lines)
+            f.flush()
+            offset = f.tell()
+            self._written += 1
+            seq = self._written
+            self.pending_events += len(events)
+        self._start_threads()
+        if self.sync_mode == 'always':
+            self._sync(seq)
+        if self.pending_events >= JOURNAL_COMPACT_EVENTS:
+            self._compact_wanted.set()
+        return offset
+
+    def _sync(self, seq=None):
+        with self._sync_lock:
+            if seq is not None and self._synced >= seq:
+                return  # another writer's fsync already covered this event
+            with self._lock:
+                target = self._written
+                if self._file is None or target == self._synced:
+                    return
+                fd = self._file.fileno()
+            os.fsync(fd)
+            self._synced = target
+
+    def reset(self, snapshot):
+        """Write a snapshot via ``snapshot()`` and then empty the journal.
+
+        Appends are blocked for the duration, so no event can land between
+        the snapshot and the truncation and be lost.
+        """
+        with self._lock:
+            snapshot()
+            if self._file is not None:
+                self._file.truncate(0)
+                os.fsync(self._file.fileno())
+            elif os.path.exists(self.path):
+                os.truncate(self.path, 0)
+            self._synced = self._written
+            self.pending_events = 0
+
+    def close(self):
+        self._sync()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _start_threads(self):
+        if self._threads_started:
+            return
+        self._threads_started = True
+        if self.sync_mode == 'batch':
+            threading.Thread(target=self._sync_loop, daemon=True, name='journal-sync').start()
+        threading.Thread(target=self._compact_loop, daemon=True, name='journal-compact').start()
+
+    def _sync_loop(self):
+        while True:
+            time.sleep(JOURNAL_BATCH_INTERVAL)
+            self._sync()
+
+    def _compact_loop(self):
+        while True:
+            self._compact_wanted.wait(JOURNAL_COMPACT_INTERVAL)
+            self._compact_wanted.clear()
+            if self.pending_events and self.compact_callback is not None:
+                try:
+                    self.compact_callback()
+                except Exception as e:
+                    app.logger.exception("Journal compaction failed: %s", e)
+
+# --------------------------
+# Repositories
+# --------------------------
+
+class Repository:
+    """Where NetworkStore persists the railway data.
+
+    The store keeps the whole network in memory and hands every change to
+    its repository as a record-level event: {'op': 'put', 'collection',
+    'record'} or {'op': 'delete', 'collection', 'key'}. Other worker
+    processes catch up through stamp(), which changes whenever the data is
+    rewritten wholesale, and read_events(), which returns the events
+    appended after a position().
+    """
+
+    compact_callback = None  # called from a background thread when events should be folded
+
+    def stamp(self):
+        raise NotImplementedError
+
+    def position(self):
+        raise NotImplementedError
+
+    def load(self):
+        """Return (data, position) with every stored event applied"""
+        raise NotImplementedError
+
+    def read_events(self, start):
+        """Return ([(position, event), ...], position) for events after ``start``.
+
+        Each event comes with the position just past it; (None, position)
+        means the events are gone.
+        """
+        raise NotImplementedError
+
+    def append(self, event):
+        """Persist one event and return the new position"""
+        return self.append_many([event])
+
+    def append_many(self, events):
+        """Persist events in one commit and return the new position"""
+        raise NotImplementedError
+
+    def write(self, data):
+        """Replace the stored data wholesale"""
+        raise NotImplementedError
+
+    def compact(self, data):
+        """Fold the events appended so far; ``data`` is the current document"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class JsonRepository(Repository):
+    """The railway document as one JSON snapshot plus an event journal.
+
+    Snapshots go to a temporary file in the same directory that is then
+    renamed over the original, so readers never see a half-written
+    document. Positions are byte offsets into the journal.
+    """
+
+    def __init__(self, path, journal):
+        self.path = path
+        self.journal = journal
+
+    @property
+    def compact_callback(self):
+        return self.journal.compact_callback
+
+    @compact_callback.setter
+    def compact_callback(self, callback):
+        self.journal.compact_callback = callback
+
+    def stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def position(self):
+        return self.journal.size()
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                data = json.load(f)
+                metrics.count_storage('read', f.tell())
+            for key, value in empty_data().items():
+                data.setdefault(key, value)
+        else:
+            data = empty_data()
+        events, position = self.journal.read_events()
+        return apply_events(data, (event for _, event in events)), position
+
+    def read_events(self, start):
+        return self.journal.read_events(start)
+
+    def append_many(self, events):
+        return self.journal.append_many(events)
+
+    def write(self, data):
+        self.journal.reset(lambda: self._write_snapshot(data))
+
+    def compact(self, data):
+        self.write(data)
+
+    def _write_snapshot(self, data):
+        directory = os.path.dirname(self.path) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.railways.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+                metrics.count_storage('written', f.tell())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def close(self):
+        self.journal.close()
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0), ('floor', 0);
+CREATE TABLE IF NOT EXISTS stations (id TEXT PRIMARY KEY, record TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS tracks (
+    source TEXT NOT NULL, destination TEXT NOT NULL, record TEXT NOT NULL,
+    PRIMARY KEY (source, destination)
+);
+CREATE INDEX IF NOT EXISTS tracks_destination ON tracks (destination);
+CREATE TABLE IF NOT EXISTS trains (id TEXT PRIMARY KEY, record TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS bookings (
+    booking_id TEXT PRIMARY KEY, train_id TEXT, date TEXT, status TEXT, class TEXT,
+    passenger TEXT, record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bookings_trip ON bookings (train_id, date);
+CREATE INDEX IF NOT EXISTS bookings_date ON bookings (date);
+CREATE INDEX IF NOT EXISTS bookings_passenger ON bookings (passenger);
+CREATE TABLE IF NOT EXISTS station_closures (id TEXT PRIMARY KEY, station_id TEXT, record TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS station_closures_station ON station_closures (station_id);
+CREATE TABLE IF NOT EXISTS track_closures (
+    id TEXT PRIMARY KEY, source TEXT, destination TEXT, record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS track_closures_edge ON track_closures (source, destination);
+CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY AUTOINCREMENT, event TEXT NOT NULL);
+"""
+
+# Indexed columns per collection, key columns first; the JSON record follows them
+SQLITE_COLUMNS = {
+    'stations': (('id',), ()),
+    'tracks': (('source', 'destination'), ()),
+    'trains': (('id',), ()),
+    'bookings': (('booking_id',), ('train_id', 'date', 'status', 'class', 'passenger')),
+    'station_closures': (('id',), ('station_id',)),
+    'track_closures': (('id',), ('source', 'destination'))
+}
+
+SQLITE_SYNC = {'always': 'FULL', 'batch': 'NORMAL', 'none': 'OFF'}
+
+def sqlite_row(collection, record):
+    """Column values for a record: key, indexed fields, then the JSON text"""
+    key = record_key(collection, record)
+    values = list(key) if isinstance(key, tuple) else [key]
+    if collection == 'bookings':
+        filters = dict(booking_filter_values(record))
+        values += [filters['trainId'], filters['date'], filters['status'], filters['class'], filters['passenger']]
+    elif collection == 'station_closures':
+        values.append(record.get('stationId'))
+    elif collection == 'track_closures':
+        values += [record.get('source'), record.get('destination')]
+    values.append(json.dumps(record))
+    return values
+
+class SqliteRepository(Repository):
+    """The railway data as one SQLite table per collection, in WAL mode.
+
+    Each change is a single-row upsert or delete by primary key, plus a
+    row in ``events`` that other workers tail, committed together; no
+    unrelated rows are touched. Statements are fixed strings, so the
+    sqlite3 module's statement cache keeps them prepared per connection.
+    Events older than SQLITE_EVENT_RETENTION are trimmed as new ones
+    arrive; a worker that fell further behind reloads everything.
+
+    ``seed`` is a repository (normally the JSON one) imported when the
+    first connection finds this database never written, so switching
+    backends does not start the service on an empty network.
+    """
+
+    def __init__(self, path, sync_mode='batch', seed=None):
+        if sync_mode not in SQLITE_SYNC:
+            raise ValueError(f"Unknown journal sync mode: {sync_mode}")
+        self.path = path
+        self.sync_mode = sync_mode
+        self.seed = seed
+        self._local = threading.local()
+        self._upsert = {}
+        self._delete = {}
+        for name, (keys, indexed) in SQLITE_COLUMNS.items():
+            columns = keys + indexed + ('record',)
+            self._upsert[name] = (f"INSERT OR REPLACE INTO {name} ({', '.join(columns)}) "
+                                  f"VALUES ({', '.join('?' * len(columns))})")
+            self._delete[name] = f"DELETE FROM {name} WHERE {' AND '.join(k + ' = ?' for k in keys)}"
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(f'PRAGMA synchronous={SQLITE_SYNC[self.sync_mode]}')
+            conn.executescript(SQLITE_SCHEMA)
+            self._local.conn = conn
+            if self.seed is not None:
+                self._import_seed()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _meta(self, conn, key):
+        return conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()[0]
+
+    def stamp(self):
+        return self._meta(self._connection(), 'generation')
+
+    def position(self):
+        row = self._connection().execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+        return row[0] if row else 0
+
+    def load(self):
+        conn = self._connection()
+        conn.execute('BEGIN')
+        try:
+            data = empty_data()
+            for name in SQLITE_COLUMNS:
+                data[name] = [json.loads(r) for r, in conn.execute(f'SELECT record FROM {name} ORDER BY rowid')]
+            position = self.position()
+        finally:
+            conn.execute('COMMIT')
+        return data, position
+
+    def read_events(self, start):
+        conn = self._connection()
+        if start < self._meta(conn, 'floor'):
+            return None, self.position()
+        events = []
+        position = start
+        for seq, event in conn.execute('SELECT seq, event FROM events WHERE seq > ? ORDER BY seq', (start,)):
+            events.append((seq, json.loads(event)))
+            metrics.count_storage('read', len(event))
+            position = seq
+        return events, position
+
+    def append_many(self, events):
+        seq = self.position()
+        with self._transaction() as conn:
+            for event in events:
+                name = event['collection']
+                if event['op'] == 'put':
+                    conn.execute(self._upsert[name], sqlite_row(name, event['record']))
+                else:
+                    key = event_key(event)
+                    conn.execute(self._delete[name], key if isinstance(key, tuple) else (key,))
+                text = json.dumps(event, separators=(',', ':'))
+                metrics.count_storage('written', len(text))
+                seq = conn.execute('INSERT INTO events (event) VALUES (?)', (text,)).lastrowid
+                if seq % SQLITE_EVENT_RETENTION == 0:
+                    floor = seq - SQLITE_EVENT_RETENTION
+                    conn.execute('DELETE FROM events WHERE seq <= ?', (floor,))
+                    conn.execute("UPDATE meta SET value = ? WHERE key = 'floor'", (floor,))
+        return seq
+
+    def write(self, data):
+        with self._transaction() as conn:
+            self._replace(conn, data)
+
+    def _replace(self, conn, data):
+        for name in SQLITE_COLUMNS:
+            conn.execute(f'DELETE FROM {name}')
+            conn.executemany(self._upsert[name], (sqlite_row(name, r) for r in data.get(name, [])))
+        conn.execute('DELETE FROM events')
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+        conn.execute("UPDATE meta SET value = (SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence "
+                     "WHERE name = 'events') WHERE key = 'floor'")
+
+    def _import_seed(self):
+        """Copy the seed into a database that was never written, once.
+
+        The emptiness check and the import share one write transaction,
+        so of several workers starting together only the first imports.
+        """
+        seed, self.seed = self.seed, None
+        try:
+            if seed.stamp() is None:
+                return
+            with self._transaction() as conn:
+                if self._meta(conn, 'generation') or self.position():
+                    return
+                data, _ = seed.load()
+                self._replace(conn, data)
+            app.logger.warning("Imported %s into the empty database %s", seed.path, self.path)
+        finally:
+            seed.close()
+
+    def compact(self, data):
+        self._connection().execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+def open_repository(backend=STORAGE_BACKEND):
+    """The repository for the configured storage backend"""
+    if backend == 'json':
+        return JsonRepository(DATA_FILE, Journal(JOURNAL_FILE, JOURNAL_SYNC))
+    if backend == 'sqlite':
+        seed = JsonRepository(DATA_FILE, Journal(JOURNAL_FILE, 'none'))  # existing JSON data, imported once
+        return SqliteRepository(SQLITE_FILE, JOURNAL_SYNC, seed=seed)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+# --------------------------
+# Lookup Indexes
+# --------------------------
+
+def edge_key(a, b):
+    """Canonical undirected key for the track(s) between two stations"""
+    return (a, b) if a <= b else (b, a)
+
+BOOKING_FILTERS = ('trainId', 'date', 'status', 'class', 'passenger')
+# Filters selective enough to keep posting lists for; status and class match
+# most bookings, so they are checked per booking instead. Empty values (no
+# passenger name) are not posted either.
+BOOKING_POSTINGS = ('trainId', 'date', 'passenger')
+
+def booking_filter_values(booking):
+    """(filter, value) pairs a booking is indexed under"""
+    details = booking.get('passengerDetails') or {}
+    yield 'trainId', booking.get('trainId')
+    yield 'date', booking.get('date')
+    yield 'status', booking.get('status')
+    yield 'class', booking.get('class')
+    yield 'passenger', str(details.get('name', '')).strip().lower()
+
+def sorted_discard(items, value):
+    """Remove ``value`` from a sorted list if present"""
+    i = bisect_left(items, value)
+    if i < len(items) and items[i] == value:
+        del items[i]
+
+def ids_after(ids, after):
+    """Iterate a sorted id list from just past ``after`` without copying it"""
+    start = 0 if after is None else bisect_right(ids, after)
+    return (ids[i] for i in range(start, len(ids)))
+
+class SortedIds:
+    """A sorted set of ids that stays cheap to change when it is very long.
+
+    insort() into one list of a million ids moves half of it on every
+    insert. The ids are kept instead in consecutive sorted chunks of at
+    most 2 * SORTED_IDS_CHUNK, so a change only moves ids within one chunk.
+    """
+
+    def __init__(self):
+        self._chunks = []  # non-empty sorted lists; every id in a chunk precedes the next chunk's
+        self._maxes = []  # last id of each chunk
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def add(self, item):
+        if not self._chunks:
+            self._chunks.append([item])
+            self._maxes.append(item)
+            self._len += 1
+            return
+        i = min(bisect_left(self._maxes, item), len(self._chunks) - 1)
+        chunk = self._chunks[i]
+        j = bisect_left(chunk, item)
+        if j < len(chunk) and chunk[j] == item:
+            return
+        chunk.insert(j, item)
+        self._maxes[i] = chunk[-1]
+        self._len += 1
+        if len(chunk) > 2 * SORTED_IDS_CHUNK:
+            self._chunks[i:i + 1] = [chunk[:SORTED_IDS_CHUNK], chunk[SORTED_IDS_CHUNK:]]
+            self._maxes[i:i + 1] = [chunk[SORTED_IDS_CHUNK - 1], chunk[-1]]
+
+    def discard(self, item):
+        i = bisect_left(self._maxes, item)
+        if i == len(self._chunks):
+            return
+        chunk = self._chunks[i]
+        j = bisect_left(chunk, item)
+        if j == len(chunk) or chunk[j] != item:
+            return
+        del chunk[j]
+        self._len -= 1
+        if chunk:
+            self._maxes[i] = chunk[-1]
+        else:
+            del self._chunks[i]
+            del self._maxes[i]
+
+    def after(self, after=None):
+        """Iterate the ids greater than ``after`` (all of them for None) in order"""
+        chunks = self._chunks
+        first = 0 if after is None else bisect_right(self._maxes, after)
+        for i in range(first, len(chunks)):
+            yield from ids_after(chunks[i], after if i == first else None)
+
+def booking_matches(booking, filters):
+    """Does a booking satisfy every filter given?"""
+    values = dict(booking_filter_values(booking))
+    for name in BOOKING_FILTERS:
+        if filters.get(name) is not None and values[name] != filters[name]:
+            return False
+    date = booking.get('date') or ''
+    if filters.get('dateFrom') is not None and date < filters['dateFrom']:
+        return False
+    if filters.get('dateTo') is not None and date > filters['dateTo']:
+        return False
+    return True
+
+def station_coordinates(station):
+    """(lat, lon) of a station as floats, or None unless both are finite and in range"""
+    try:
+        lat, lon = float(station['latitude']), float(station['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None  # also rejects NaN
+    return lat, lon
+
+class StationGrid:
+    """Station coordinates bucketed into fixed-size lat/lon cells.
+
+    add()/remove() touch one cell, so the grid follows station edits
+    without rebuilds. Cell columns wrap at the antimeridian. Bounding-box
+    queries visit only the cells the box overlaps (or the occupied cells,
+    if fewer). nearest() visits occupied cells in order of a lower bound
+    on their distance and stops once that bound passes the n-th station
+    found, which stays cheap near the poles where every column is close.
+    """
+
+    def __init__(self, cell=SPATIAL_CELL_DEGREES):
+        self.cell = cell
+        self.columns = max(1, round(360 / cell))  # cells around a parallel
+        self.cells = defaultdict(dict)  # (row, col) -> {station id: (lat, lon)}
+        self.where = {}  # station id -> (row, col)
+        self.row_columns = defaultdict(set)  # row -> occupied columns
+
+    def _row(self, lat):
+        return math.floor(lat / self.cell)
+
+    def _column(self, lon):
+        """Unwrapped column from -180 degrees; 180 itself is column ``self.columns``"""
+        return math.floor((lon + 180.0) / self.cell)
+
+    def _key(self, lat, lon):
+        return self._row(lat), self._column(lon) % self.columns
+
+    def add(self, station):
+        coordinates = station_coordinates(station)
+        if coordinates is None:
+            return  # stations without usable coordinates are not placed
+        lat, lon = coordinates
+        self.remove(station['id'])
+        key = self._key(lat, lon)
+        self.cells[key][station['id']] = (lat, lon)
+        self.where[station['id']] = key
+        self.row_columns[key[0]].add(key[1])
+
+    def remove(self, station_id):
+        key = self.where.pop(station_id, None)
+        if key is not None:
+            cell = self.cells[key]
+            cell.pop(station_id, None)
+            if not cell:
+                del self.cells[key]
+                columns = self.row_columns[key[0]]
+                columns.discard(key[1])
+                if not columns:
+                    del self.row_columns[key[0]]
+
+    def in_bbox(self, south, west, north, east):
+        """Yield ids of stations inside the box; west > east wraps the antimeridian"""
+        if west > east:
+            yield from self.in_bbox(south, west, north, 180.0)
+            yield from self.in_bbox(south, -180.0, north, east)
+            return
+        r0, r1 = self._row(south), self._row(north)
+        c0, c1 = self._column(west), self._column(east)
+        columns = {c % self.columns for c in range(c0, c1 + 1)}
+        if (r1 - r0 + 1) * len(columns) > len(self.cells):
+            keys = [k for k in self.cells if r0 <= k[0] <= r1 and k[1] in columns]
+        else:
+            keys = [(r, c) for r in range(r0, r1 + 1) for c in columns if (r, c) in self.cells]
+        for key in keys:
+            for station_id, (lat, lon) in self.cells[key].items():
+                if south <= lat <= north and west <= lon <= east:
+                    yield station_id
+
+    def _lower_bound(self, lat, row, offset):
+        """Least distance (km) from latitude ``lat`` to a cell in ``row``, ``offset`` columns away"""
+        south, north = row * self.cell, (row + 1) * self.cell
+        dlat = math.radians(max(0.0, south - lat, lat - north))
+        dlon = math.radians(max(0, offset - 1) * self.cell)
+        widest = math.radians(min(90.0, max(abs(lat), abs(south), abs(north))))
+        a = math.sin(dlat / 2) ** 2 + (math.cos(widest) * math.sin(dlon / 2)) ** 2
+        return 2 * 6371.0 * math.asin(math.sqrt(min(1.0, a)))
+
+    def nearest(self, lat, lon, n, max_km=None):
+        """Up to ``n`` (distance km, station id) pairs closest to a point, nearest first"""
+        if not self.where or n < 1:
+            return []
+        row, col = self._key(lat, lon)
+        lowest, highest = min(self.row_columns), max(self.row_columns)
+
+        def offset(c):
+            return min(abs(c - col), self.columns - abs(c - col))
+
+        # Entries are (bound, row, columns, i): columns is None for a row not
+        # opened yet, else that row's occupied columns nearest first and i the next
+        queue = [(self._lower_bound(lat, row, 0), row, None, 0)]
+        if row - 1 >= lowest:
+            queue.append((self._lower_bound(lat, row - 1, 0), row - 1, None, 0))
+        best = []  # max-heap of (-distance, station id), at most n long
+        while queue:
+            bound, r, columns, i = heapq.heappop(queue)
+            limit = -best[0][0] if len(best) == n else max_km
+            if limit is not None and bound > limit:
+                break
+            if columns is None:
+                # Open the row and queue the next one further out on its side
+                columns = sorted(self.row_columns.get(r, ()), key=offset)
+                if columns:
+                    heapq.heappush(queue, (self._lower_bound(lat, r, offset(columns[0])), r, columns, 0))
+                following = r + 1 if r >= row else r - 1
+                if (following <= highest) if r >= row else (following >= lowest):
+                    heapq.heappush(queue, (self._lower_bound(lat, following, 0), following, None, 0))
+                continue
+            for station_id, (s_lat, s_lon) in self.cells[(r, columns[i])].items():
+                distance = haversine_km(lat, lon, s_lat, s_lon)
+                if max_km is not None and distance > max_km:
+                    continue
+                if len(best) < n:
+                    heapq.heappush(best, (-distance, station_id))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, station_id))
+            if i + 1 < len(columns):
+                heapq.heappush(queue, (self._lower_bound(lat, r, offset(columns[i + 1])), r, columns, i + 1))
+        return sorted((-d, station_id) for d, station_id in best)
+
+# Collections NetworkIndex keeps positions for: name -> (add method, remove method)
+INDEXED_COLLECTIONS = {
+    'stations': ('add_station', 'remove_station'),
+    'tracks': ('add_track', 'remove_track'),
+    'trains': ('add_train', 'remove_train'),
+    'bookings': ('add_booking', 'remove_booking')
+}
+
+class NetworkIndex:
+    """Hash indexes over the railway document.
+
+    Built once when the store loads and then kept in step by the
+    mutation endpoints, so ID lookups do not scan the lists. insert()
+    and delete() also add and remove records in the document itself,
+    using each record's remembered position.
+    """
+
+    def __init__(self, data=None):
+        self.network_version = 0  # bumped whenever stations or tracks change
+        self.train_version = 0  # bumped whenever trains change
+        self.rebuild(data or empty_data())
+
+    def rebuild(self, data):
+        self.network_version += 1
+        self.train_version += 1
+        self.stations = {}
+        self.trains = {}
+        self.bookings = {}
+        self.lists = {name: data[name] for name in INDEXED_COLLECTIONS}  # the document's lists, kept in step by insert/delete
+        self.slots = {name: {id(r): i for i, r in enumerate(records)}  # id(record) -> position in its list
+                      for name, records in self.lists.items()}
+        self.bookings_by_trip = defaultdict(list)  # (trainId, date) -> bookings
+        self.edges = defaultdict(list)  # edge_key -> tracks
+        self.station_edges = defaultdict(set)  # station id -> edge keys
+        self.track_count = 0
+        self.trip_stats = defaultdict(lambda: [0, 0])  # (trainId, date) -> [bookings, passengers]
+        self.revenue_by_class = defaultdict(Decimal)  # class -> fare total of confirmed bookings
+        self.edge_log = []  # edge keys touched since the last rebuild, in order
+        self.booking_ids = SortedIds()  # all booking ids; the order pages are served in
+        self.booking_postings = {name: {} for name in BOOKING_POSTINGS}  # filter -> value -> sorted ids
+        self.booking_dates = []  # distinct booking dates, sorted, for date-range queries
+        self.station_trains = defaultdict(set)  # station id -> ids of trains calling there
+        self.hop_trains = defaultdict(set)  # directed (source, destination) -> ids of trains running it
+        self.grid = StationGrid()
+        for station in data['stations']:
+            self.add_station(station)
+        for track in data['tracks']:
+            self.add_track(track)
+        for train in data['trains']:
+            self.add_train(train)
+        for booking in data['bookings']:
+            self.add_booking(booking)
+
+    def add_station(self, station):
+        self.stations[station['id']] = station
+        self.grid.add(station)
+        self.network_version += 1
+
+    def remove_station(self, station):
+        self.stations.pop(station['id'], None)
+        self.station_edges.pop(station['id'], None)
+        self.grid.remove(station['id'])
+        self.network_version += 1
+
+    def add_track(self, track):
+        self.network_version += 1
+        self.track_count += 1
+        key = edge_key(track['source'], track['destination'])
+        self.edges[key].append(track)
+        self.station_edges[track['source']].add(key)
+        self.station_edges[track['destination']].add(key)
+        self._log_edge(key)
+
+    def remove_track(self, track):
+        self.network_version += 1
+        key = edge_key(track['source'], track['destination'])
+        tracks = self.edges.get(key, [])
+        remaining = [t for t in tracks if t is not track]
+        self.track_count -= len(tracks) - len(remaining)
+        tracks[:] = remaining
+        if not tracks:
+            self.edges.pop(key, None)
+            self.station_edges[track['source']].discard(key)
+            self.station_edges[track['destination']].discard(key)
+        self._log_edge(key)
+
+    def _log_edge(self, key):
+        if len(self.edge_log) >= EDGE_LOG_LIMIT:
+            self.edge_log = []  # readers holding the old list start over
+        self.edge_log.append(key)
+
+    def find_track(self, source, destination):
+        """Return the track a train can use from source to destination"""
+        for track in self.edges.get(edge_key(source, destination), ()):
+            if track['source'] == source and track['destination'] == destination:
+                return track
+            if track.get('bidirectional', False) and track['source'] == destination and track['destination'] == source:
+                return track
+        return None
+
+    def get_track(self, source, destination):
+        """Return the track stored exactly as source -> destination"""
+        for track in self.edges.get(edge_key(source, destination), ()):
+            if track['source'] == source and track['destination'] == destination:
+                return track
+        return None
+
+    def station_tracks(self, station_id):
+        """Return all tracks touching a station"""
+        return [t for key in self.station_edges.get(station_id, ()) for t in self.edges[key]]
+
+    def add_train(self, train):
+        self.trains[train['id']] = train
+        self.train_version += 1
+        route = train.get('route') or []
+        for station_id in route:
+            self.station_trains[station_id].add(train['id'])
+        for hop in zip(route, route[1:]):
+            self.hop_trains[hop].add(train['id'])
+
+    def remove_train(self, train):
+        self.trains.pop(train['id'], None)
+        self.train_version += 1
+        route = train.get('route') or []
+        for station_id in route:
+            self._unlink_train(self.station_trains, station_id, train['id'])
+        for hop in zip(route, route[1:]):
+            self._unlink_train(self.hop_trains, hop, train['id'])
+
+    @staticmethod
+    def _unlink_train(postings, key, train_id):
+        ids = postings.get(key)
+        if ids is not None:
+            ids.discard(train_id)
+            if not ids:
+                del postings[key]
+
+    def add_booking(self, booking):
+        booking_id = booking['bookingId']
+        self.bookings[booking_id] = booking
+        trip = (booking.get('trainId'), booking.get('date'))
+        self.bookings_by_trip[trip].append(booking)
+        self._count_booking(trip, booking, 1)
+        self.booking_ids.add(booking_id)
+        for name, value in booking_filter_values(booking):
+            postings = self.booking_postings.get(name)
+            if postings is None or not value:
+                continue
+            if value not in postings:
+                postings[value] = []
+                if name == 'date':
+                    insort(self.booking_dates, value)
+            insort(postings[value], booking_id)
+
+    def _count_booking(self, trip, booking, sign):
+        stats = self.trip_stats[trip]
+        stats[0] += sign
+        stats[1] += sign * int(booking.get('passengerCount', 1))
+        if not stats[0]:
+            del self.trip_stats[trip]
+        if booking.get('status') == 'confirmed':
+            fare = fare_amount(booking.get('fare', 0))
+            if fare is not None:
+                self.revenue_by_class[booking.get('class')] += sign * fare
+
+    def remove_booking(self, booking):
+        booking_id = booking['bookingId']
+        if self.bookings.pop(booking_id, None) is None:
+            return
+        trip = (booking.get('trainId'), booking.get('date'))
+        self._count_booking(trip, booking, -1)
+        trip_bookings = self.bookings_by_trip.get(trip, [])
+        trip_bookings[:] = [b for b in trip_bookings if b is not booking]
+        if not trip_bookings:
+            self.bookings_by_trip.pop(trip, None)
+        self.booking_ids.discard(booking_id)
+        for name, value in booking_filter_values(booking):
+            postings = self.booking_postings.get(name)
+            ids = None if postings is None or not value else postings.get(value)
+            if ids is None:
+                continue
+            sorted_discard(ids, booking_id)
+            if not ids:
+                del postings[value]
+                if name == 'date':
+                    sorted_discard(self.booking_dates, value)
+
+    def lookup(self, collection, key):
+        """Records of an indexed collection stored under ``key`` (see record_key)"""
+        if collection == 'tracks':
+            return [t for t in self.edges.get(edge_key(*key), ()) if (t['source'], t['destination']) == key]
+        record = {'stations': self.stations, 'trains': self.trains, 'bookings': self.bookings}[collection].get(key)
+        return [] if record is None else [record]
+
+    def insert(self, collection, record):
+        """Append a new record to the document and index it"""
+        records = self.lists[collection]
+        self.slots[collection][id(record)] = len(records)
+        records.append(record)
+        getattr(self, INDEXED_COLLECTIONS[collection][0])(record)
+
+    def delete(self, collection, record):
+        """Drop a record from the document and the indexes.
+
+        The last record of the list moves into the freed slot, so the
+        list is never searched, shifted or rebuilt.
+        """
+        getattr(self, INDEXED_COLLECTIONS[collection][1])(record)
+        slots = self.slots[collection]
+        slot = slots.pop(id(record), None)
+        if slot is None:
+            return
+        records = self.lists[collection]
+        last = records.pop()
+        if last is not record:
+            records[slot] = last
+            slots[id(last)] = slot
+
+    def query_bookings(self, filters, after=None, limit=BOOKING_PAGE_SIZE):
+        """One page of bookings matching ``filters``, in booking id order.
+
+        ``filters`` maps BOOKING_FILTERS names to a value, plus optional
+        'dateFrom'/'dateTo' bounds. The smallest posting list (or the date
+        range) drives the scan from just after ``after``, or all ids when
+        only unselective filters are given; every filter is checked per
+        booking. Returns (bookings, next cursor).
+        """
+        sources = []  # (size, sorted id lists to merge)
+        for name in BOOKING_POSTINGS:
+            if filters.get(name):
+                ids = self.booking_postings[name].get(filters[name], [])
+                sources.append((len(ids), [ids]))
+        date_from, date_to = filters.get('dateFrom'), filters.get('dateTo')
+        if date_from is not None or date_to is not None:
+            lo = 0 if date_from is None else bisect_left(self.booking_dates, date_from)
+            hi = len(self.booking_dates) if date_to is None else bisect_right(self.booking_dates, date_to)
+            lists = [self.booking_postings['date'][d] for d in self.booking_dates[lo:hi]]
+            sources.append((sum(map(len, lists)), lists))
+        if sources:
+            streams = [ids_after(ids, after) for ids in min(sources, key=lambda source: source[0])[1]]
+            candidates = streams[0] if len(streams) == 1 else heapq.merge(*streams)
+        else:
+            candidates = self.booking_ids.after(after)
+
+        page = []
+        for booking_id in candidates:
+            booking = self.bookings[booking_id]
+            if booking_matches(booking, filters):
+                if len(page) == limit:
+                    return page, page[-1]['bookingId']
+                page.append(booking)
+        return page, None
+
+# --------------------------
+# Closure Engine
+# --------------------------
+
+def closure_window(closure):
+    """Return (start, end) epoch seconds for a closure, or None if it has no start"""
+    try:
+        start = datetime.fromisoformat(closure['startTime']).timestamp()
+        return start, start + float(closure.get('duration', 0)) * 3600
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def closure_kind(closure):
+    return 'station' if closure.get('type') == 'station' or 'stationId' in closure else 'track'
+
+def closure_targets(closure):
+    """Return the station ids / directed edges a closure blocks"""
+    if closure_kind(closure) == 'station':
+        return [('station', closure['stationId'])]
+    targets = [('track', (closure['source'], closure['destination']))]
+    if closure.get('bidirectional', False):
+        targets.append(('track', (closure['destination'], closure['source'])))
+    return targets
+
+class ClosureIndex:
+    """Station and track closures with their time windows parsed once.
+
+    Closures wait in a heap keyed by start time until they begin and sit
+    in a second heap keyed by expiry while active, so advance() only does
+    work when a closure actually starts or ends. "Closed now" checks are
+    then dict lookups; "closed at t" checks scan only the closures of the
+    station or edge asked about. Heap entries carry a sequence number
+    rather than the closure itself, so a stale entry left by a removed
+    closure can never match a later one.
+    """
+
+    def __init__(self, data=None):
+        self.rebuild(data or empty_data())
+
+    def rebuild(self, data):
+        self._closures = {}  # token -> (closure, start, end)
+        self._tokens = {}  # id(closure) -> token, for closures in _closures
+        self._sequence = 0  # last token handed out
+        self._active = defaultdict(set)  # target -> tokens of closures in force now
+        self._windows = defaultdict(dict)  # target -> {token: (start, end)}
+        self._pending = []  # (start, token) for closures not started yet
+        self._expiry = []  # (end, token) for closures in force
+        self._now = float('-inf')
+        self._expired = []
+        self.counts = {'station': 0, 'track': 0}  # closures not yet expired
+        self._lock = threading.RLock()  # readers advance the clock concurrently
+        for closure in data['station_closures'] + data['track_closures']:
+            self._add(closure)
+
+    def add(self, closure):
+        with self._lock:
+            self._add(closure)
+
+    def _add(self, closure):
+        if id(closure) in self._tokens:
+            self._remove(closure)
+        window = closure_window(closure)
+        self._sequence += 1
+        token = self._tokens[id(closure)] = self._sequence
+        if window is None:
+            # Closures without a valid start time are dropped on the next advance()
+            self._closures[token] = (closure, float('-inf'), float('-inf'))
+            heapq.heappush(self._expiry, (float('-inf'), token))
+            return
+        start, end = window
+        self._closures[token] = (closure, start, end)
+        self.counts[closure_kind(closure)] += 1
+        for target in closure_targets(closure):
+            self._windows[target][token] = window
+        if start <= self._now:
+            self._activate(token)
+        else:
+            heapq.heappush(self._pending, (start, token))
+
+    def remove(self, closure):
+        """Forget a closure, including an expired one still awaiting purge; heap entries are skipped lazily"""
+        with self._lock:
+            self._remove(closure)
+            if any(c is closure for c in self._expired):
+                self._expired = [c for c in self._expired if c is not closure]
+
+    def _remove(self, closure):
+        token = self._tokens.pop(id(closure), None)
+        entry = self._closures.pop(token, None)
+        if entry is None:
+            return
+        if entry[1] != float('-inf'):
+            self.counts[closure_kind(closure)] -= 1
+        for target in closure_targets(closure):
+            self._active.get(target, set()).discard(token)
+            self._windows.get(target, {}).pop(token, None)
+
+    def _activate(self, token):
+        closure, start, end = self._closures[token]
+        for target in closure_targets(closure):
+            self._active[target].add(token)
+        heapq.heappush(self._expiry, (end, token))
+
+    def advance(self, now=None):
+        """Move the clock to ``now``, starting and expiring closures"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._advance(now)
+
+    def _advance(self, now):
+        if now < self._now:
+            return
+        self._now = now
+        while self._pending and self._pending[0][0] <= now:
+            _, token = heapq.heappop(self._pending)
+            entry = self._closures.get(token)
+            if entry is not None and entry[1] <= now:
+                self._activate(token)
+        while self._expiry and self._expiry[0][0] <= now:
+            _, token = heapq.heappop(self._expiry)
+            entry = self._closures.get(token)
+            if entry is None or entry[2] > now:
+                continue
+            self._expired.append(entry[0])
+            self._remove(entry[0])
+
+    def pop_expired(self, now=None):
+        """Advance the clock and return closures that expired since the last call"""
+        with self._lock, timed('closures'):
+            self._advance(time.time() if now is None else now)
+            expired, self._expired = self._expired, []
+        return expired
+
+    def visible(self, closures):
+        """Filter out closures that expired but have not been purged from the data yet"""
+        with timed('closures'):
+            self.advance()
+            if not self._expired:
+                return closures
+            expired_ids = {id(c) for c in self._expired}
+            return [c for c in closures if id(c) not in expired_ids]
+
+    def expired(self):
+        """Return closures that expired but have not been purged from the data yet"""
+        with self._lock:
+            self._advance(time.time())
+            return list(self._expired)
+
+    def _closed(self, target, at):
+        with self._lock:
+            if at is None:
+                self._advance(time.time())
+                return bool(self._active.get(target))
+            return any(start <= at < end for start, end in self._windows.get(target, {}).values())
+
+    def closed_stations(self):
+        """Return the ids of stations closed now"""
+        with self._lock:
+            self._advance(time.time())
+            return {target[1] for target, tokens in self._active.items() if tokens and target[0] == 'station'}
+
+    def closed_edges(self):
+        """Return the directed (source, destination) edges closed now"""
+        with self._lock:
+            self._advance(time.time())
+            return {target[1] for target, tokens in self._active.items() if tokens and target[0] == 'track'}
+
+    def closed_by_station(self):
+        """Return {station id: number of closures in force now}"""
+        with self._lock:
+            self._advance(time.time())
+            return {target[1]: len(tokens) for target, tokens in self._active.items()
+                    if tokens and target[0] == 'station'}
+
+    def is_station_closed(self, station_id, at=None):
+        """Is the station closed now, or at epoch time ``at``"""
+        return self._closed(('station', station_id), at)
+
+    def is_track_closed(self, source, destination, at=None):
+        """Is the directed edge source -> destination closed now, or at ``at``"""
+        return self._closed(('track', (source, destination)), at)
+
+# --------------------------
+# Seat Inventory
+# --------------------------
+
+class SeatInventory:
+    """Booked-seat counters per (train, date, class) and route segment.
+
+    Each key holds an int array with one counter per hop of the train's
+    route. A booking from stop i to stop j occupies hops i..j-1, so a
+    request fits when the busiest of those hops has room, which is an
+    O(segments) check. Check-and-increment runs under a per-key lock
+    (striped over a fixed pool), so concurrent requests cannot overbook.
+    """
+
+    LOCK_STRIPES = 64
+
+    def __init__(self, index):
+        self.index = index
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self.rebuild()
+
+    def rebuild(self):
+        self._counts = {}  # (trainId, date, class) -> array of booked seats per hop
+        self._train_keys = defaultdict(set)  # trainId -> keys in _counts
+        for booking in self.index.bookings.values():
+            self._apply(booking, 1)
+
+    def _lock_for(self, key):
+        return self._locks[hash(key) % self.LOCK_STRIPES]
+
+    def segment(self, train, source, destination):
+        """Return (i, j) route positions for a trip, or None if not served in that order"""
+        route = train.get('route', [])
+        try:
+            i = route.index(source)
+            j = route.index(destination)
+        except ValueError:
+            return None
+        return (i, j) if i < j else None
+
+    def capacity(self, train, class_type):
+        return train.get('seats', {}).get(class_type, SEAT_CAPACITY.get(class_type, 0))
+
+    def _counters(self, train, date, class_type):
+        key = (train['id'], date, class_type)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = array('i', [0]) * max(0, len(train.get('route', [])) - 1)
+            self._counts[key] = counts
+            self._train_keys[train['id']].add(key)
+        return key, counts
+
+    def _apply(self, booking, sign):
+        """Add (sign=1) or remove (sign=-1) a confirmed booking's seats without checks"""
+        if booking.get('status') != 'confirmed':
+            return
+        train = self.index.trains.get(booking.get('trainId'))
+        if train is None:
+            return
+        segment = self.segment(train, booking.get('from'), booking.get('to'))
+        if segment is None:
+            return
+        key, counts = self._counters(train, booking.get('date'), booking.get('class'))
+        seats = int(booking.get('passengerCount', 1)) * sign
+        with self._lock_for(key):
+            for hop in range(*segment):
+                counts[hop] = max(0, counts[hop] + seats)
+
+    def available(self, train, date, class_type, i, j):
+        """Seats free on every hop between positions i and j"""
+        counts = self._counts.get((train['id'], date, class_type))
+        booked = max(counts[i:j]) if counts is not None and j > i else 0
+        return max(0, self.capacity(train, class_type) - booked)
+
+    def reserve(self, train, date, class_type, i, j, seats):
+        """Atomically take ``seats`` on hops i..j-1; return False if any hop is full"""
+        key, counts = self._counters(train, date, class_type)
+        with self._lock_for(key):
+            if max(counts[i:j]) + seats > self.capacity(train, class_type):
+                return False
+            for hop in range(i, j):
+                counts[hop] += seats
+        return True
+
+    def unreserve(self, train, date, class_type, i, j, seats):
+        """Give back seats taken by reserve()"""
+        key, counts = self._counters(train, date, class_type)
+        with self._lock_for(key):
+            for hop in range(i, j):
+                counts[hop] = max(0, counts[hop] - seats)
+
+    def hold(self, booking):
+        """Count an already-accepted booking's seats"""
+        self._apply(booking, 1)
+
+    def release(self, booking):
+        self._apply(booking, -1)
+
+    def reset_train(self, train_id):
+        """Recount a train's seats after its route changed or it was removed"""
+        for key in self._train_keys.pop(train_id, ()):
+            self._counts.pop(key, None)
+        dates = {date for (booked_train, date) in self.index.bookings_by_trip if booked_train == train_id}
+        for date in dates:
+            for booking in self.index.bookings_by_trip[(train_id, date)]:
+                self._apply(booking, 1)
+
+# --------------------------
+# Change Feed
+# --------------------------
+
+def diff_data(old, new):
+    """Per-collection inserts, updates and deletes turning ``old`` into ``new``"""
+    result = {}
+    for name in RECORD_KEYS:
+        before = {record_key(name, r): r for r in old.get(name, [])}
+        after = {record_key(name, r): r for r in new.get(name, [])}
+        delta = {
+            'inserted': [r for k, r in after.items() if k not in before],
+            'updated': [r for k, r in after.items() if k in before and before[k] != r],
+            'deleted': [k for k in before if k not in after]
+        }
+        if any(delta.values()):
+            result[name] = delta
+    return result
+
+class ChangeLog:
+    """Recent record-level changes, for clients that poll /api/changes.
+
+    Entries are stamped with the repository position their event ends at.
+    Clients hold an opaque "<epoch>-<position>" token, where the epoch
+    names the stored snapshot positions count from. Both come from the
+    shared repository, so every worker process gives a state the same
+    token. The epoch changes whenever the data is rewritten wholesale
+    (for the JSON backend that includes journal compaction); such tokens,
+    like ones older than the retained window, get a reset answer telling
+    the client to fetch /api/data again.
+    """
+
+    def __init__(self, limit=CHANGE_LOG_LIMIT):
+        self.limit = limit
+        self.reset('', 0)
+
+    def reset(self, epoch, position):
+        self.epoch = epoch
+        self.entries = deque()  # (position, change, collection, key, record)
+        self.floor = position  # changes after this position are all retained
+
+    def append(self, position, change, collection, key, record=None):
+        self.entries.append((position, change, collection, key, record))
+        if len(self.entries) > self.limit:
+            self.floor = self.entries.popleft()[0]
+
+    def token(self, position):
+        return f"{self.epoch}-{position}"
+
+    def since(self, token, position):
+        """Net changes after ``token``, or None if the client must refetch everything"""
+        epoch, _, number = (token or '').rpartition('-')
+        try:
+            number = int(number)
+        except ValueError:
+            return None
+        if epoch != self.epoch or number < self.floor or number > position:
+            return None
+        net = {}  # (collection, key) -> [first change, last change, record]
+        for entry_position, change, collection, key, record in self.entries:
+            if entry_position <= number:
+                continue
+            state = net.get((collection, key))
+            if state is None:
+                net[(collection, key)] = [change, change, record]
+            else:
+                state[1], state[2] = change, record
+        result = {}
+        for (collection, key), (first, last, record) in net.items():
+            if first == 'insert' and last == 'delete':
+                continue  # came and went in between
+            delta = result.setdefault(collection, {'inserted': [], 'updated': [], 'deleted': []})
+            if last == 'delete':
+                delta['deleted'].append(key)
+            elif first == 'insert':
+                delta['inserted'].append(record)
+            else:
+                delta['updated'].append(record)
+        return result
+
+# --------------------------
+# In-memory Network Store
+# --------------------------
+
+class NetworkStore:
+    """Process-resident copy of the railway data.
+
+    The data is read from ``repo`` once and served from memory afterwards.
+    Every change is applied in memory and then handed to the repository
+    as a record-level event (see Repository), so writes never rewrite
+    unrelated data.
+
+    Several worker processes may share the repository. Writers hold
+    ``rwlock`` for writing plus the inter-process ``file_lock``, and first
+    catch up with whatever other workers wrote: new events are applied
+    incrementally, wholesale rewrites trigger a full reload. Readers only
+    take ``rwlock`` for reading.
+    """
+
+    def __init__(self, repo, lock_path):
+        self.repo = repo
+        self.data = None
+        self.index = NetworkIndex()
+        self.closures = ClosureIndex()
+        self.inventory = SeatInventory(self.index)
+        self.changes = ChangeLog()
+        self.version = 0
+        self.rwlock = RWLock()
+        self.file_lock = FileLock(lock_path)
+        self._stamp = None
+        self._position = 0
+        self._lock = threading.RLock()
+        self._started = False
+        repo.compact_callback = self.compact
+
+    def _start(self):
+        """First use in this process: create the data directory and close the repository at exit"""
+        with self._lock:
+            if not self._started:
+                os.makedirs(os.path.dirname(self.file_lock.path) or '.', exist_ok=True)
+                atexit.register(self.repo.close)
+                self._started = True
+
+    def get(self):
+        """Return the cached data, loading it on first use"""
+        if self.data is None:
+            with self._lock, timed('load'):
+                if self.data is None:
+                    self._load()
+        return self.data
+
+    def is_stale(self):
+        """Has the repository changed since this process last looked?"""
+        if self.data is None:
+            return True
+        return self.repo.stamp() != self._stamp or self.repo.position() != self._position
+
+    def refresh(self):
+        """Catch up with changes made outside this process; call with the write lock held"""
+        with self._lock, timed('load'):
+            if self.data is None or self.repo.stamp() != self._stamp:
+                self._load()
+                return
+            position = self.repo.position()
+            if position < self._position:
+                self._load()
+            elif position > self._position:
+                events, position = self.repo.read_events(self._position)
+                if events is None:
+                    self._load()
+                    return
+                self._position = position
+                for event_position, event in events:
+                    self._apply_live(event, event_position)
+                self.version += 1
+
+    @contextmanager
+    def reading(self):
+        """Shared access to up-to-date data"""
+        if self.is_stale():
+            with self.writing():
+                pass
+        with self.rwlock.read():
+            yield self.get()
+
+    @contextmanager
+    def writing(self):
+        """Exclusive access across threads and worker processes"""
+        with self.rwlock.write() as outermost:
+            if not self._started:
+                self._start()
+            with self.file_lock:
+                if outermost:
+                    self.refresh()
+                yield self.data
+
+    def _load(self):
+        if not self._started:
+            self._start()
+        stamp = self.repo.stamp()
+        data, self._position = self.repo.load()
+        self.index.rebuild(data)
+        self.closures.rebuild(data)
+        self.inventory.rebuild()
+        self.data = data
+        self._stamp = stamp
+        self.version += 1
+        self.changes.reset(self.epoch(), self._position)
+
+    def _apply_live(self, event, position):
+        """Apply an event written by another process, ending at ``position``, to the data and indexes"""
+        name = event['collection']
+        record = event.get('record')
+        key = event_key(event)
+        if name in INDEXED_COLLECTIONS:
+            olds = self.index.lookup(name, key)
+        else:
+            olds = [r for r in self.data[name] if record_key(name, r) == key]
+        if event['op'] == 'delete':
+            self.changes.append(position, 'delete', name, key)
+        else:
+            self.changes.append(position, 'update' if olds else 'insert', name, key, record)
+
+        if name == 'bookings':
+            for old in olds:
+                self.inventory.release(old)
+                if event['op'] == 'put':
+                    self.index.remove_booking(old)
+                    old.clear()  # update in place to keep its list position
+                    old.update(record)
+                    self.index.add_booking(old)
+                    self.inventory.hold(old)
+                else:
+                    self.index.delete(name, old)
+            if not olds and event['op'] == 'put':
+                self.index.insert(name, record)
+                self.inventory.hold(record)
+            return
+
+        if name in INDEXED_COLLECTIONS:
+            for old in olds:
+                self.index.delete(name, old)
+            if event['op'] == 'put':
+                self.index.insert(name, record)
+        else:
+            for old in olds:
+                self.closures.remove(old)
+            if olds:
+                self.data[name] = [r for r in self.data[name] if not any(r is old for old in olds)]
+            if event['op'] == 'put':
+                self.data[name].append(record)
+                self.closures.add(record)
+        if name == 'trains':
+            self.inventory.reset_train(key)
+
+    def log(self, op, collection, record=None, key=None):
+        """Persist a change already applied to the in-memory data.
+
+        ``op`` is 'insert', 'update' or 'delete'; inserts and updates are
+        both stored as upserts ('put').
+        """
+        self.log_many([(op, collection, record, key)])
+
+    def log_many(self, changes):
+        """Persist several (op, collection, record, key) changes in one repository commit"""
+        events = []
+        keyed = []
+        for op, collection, record, key in changes:
+            event = {'op': 'delete' if op == 'delete' else 'put', 'collection': collection}
+            if op == 'delete':
+                event['key'] = key
+            else:
+                event['record'] = record
+                key = record_key(collection, record)
+            events.append(event)
+            keyed.append((op, collection, key, record))
+        with timed('write'):
+            self._position = self.repo.append_many(events)
+        self.version += 1
+        for op, collection, key, record in keyed:
+            self.changes.append(self._position, op, collection, key, record)
+
+    def save(self, data=None):
+        """Write the whole data set through the repository"""
+        with self.writing(), self._lock:
+            replaced = data is not None and data is not self.data
+            if replaced:
+                self.data = data
+                self.index.rebuild(data)
+                self.closures.rebuild(data)
+                self.inventory.rebuild()
+            self._write()
+            self.version += 1
+            self.changes.reset(self.epoch(), self._position)
+
+    def compact(self):
+        """Fold pending events into the stored data"""
+        with self.writing(), self._lock:
+            if self.data is not None:
+                with timed('write'):
+                    self.repo.compact(self.data)
+                stamp, position = self.repo.stamp(), self.repo.position()
+                if (stamp, position) != (self._stamp, self._position):
+                    self._stamp, self._position = stamp, position
+                    self.changes.reset(self.epoch(), position)
+
+    def position(self):
+        """Repository position of the data this process holds"""
+        return self._position
+
+    def epoch(self):
+        """Names the stored snapshot this process loaded or wrote; the same in every worker"""
+        text = json.dumps([type(self.repo).__name__, self._stamp])
+        return hashlib.blake2b(text.encode(), digest_size=6).hexdigest()
+
+    def fingerprint(self):
+        """Identifies the stored state this process holds, for caches kept on disk"""
+        return [type(self.repo).__name__, self._stamp, self._position]
+
+    def _write(self):
+        with timed('write'):
+            self.repo.write(self.data)
+        self._stamp = self.repo.stamp()
+        self._position = self.repo.position()
+
+# Opens no files until first used, so batch-route workers can import this module
+store = NetworkStore(open_repository(), LOCK_FILE)
+
+# POST endpoints that only read the data
+READ_ONLY_ENDPOINTS = {'batch_routes', 'max_flow', 'quote_fares'}
+# Endpoints that never touch the data
+UNLOCKED_ENDPOINTS = {'get_metrics', 'get_profile', 'get_job'}
+
+@app.before_request
+def acquire_data_lock():
+    """GETs share the data; everything else gets it exclusively across workers"""
+    if request.endpoint in UNLOCKED_ENDPOINTS:
+        return
+    stack = ExitStack()
+    with timed('lock'):
+        if request.method in ('GET', 'HEAD', 'OPTIONS') or request.endpoint in READ_ONLY_ENDPOINTS:
+            stack.enter_context(store.reading())
+            g.data_lock_mode = 'read'
+        else:
+            stack.enter_context(store.writing())
+            g.data_lock_mode = 'write'
+    g.data_lock = stack
+
+@app.teardown_request
+def release_data_lock(exc):
+    stack = g.pop('data_lock', None)
+    if stack is not None:
+        stack.close()
+
+def load_data():
+    """Return railway data from the in-memory store.
+
+    Expired closures are purged (and the purge journaled) only when the
+    caller holds the write lock; readers filter them with
+    store.closures.visible() instead of writing during a GET.
+    """
+    data = store.get()
+    if has_request_context() and g.get('data_lock_mode') != 'write':
+        return data
+    expired = store.closures.pop_expired()
+    if expired:
+        # Journal the removals rather than rewriting the whole file
+        expired_ids = {id(c) for c in expired}
+        for kind in ('station_closures', 'track_closures'):
+            removed = [c for c in data[kind] if id(c) in expired_ids]
+            if removed:
+                data[kind] = [c for c in data[kind] if id(c) not in expired_ids]
+                for c in removed:
+                    store.log('delete', kind, key=c.get('id'))
     return data
 
 def save_data(data):
-    """Save railway data to JSON file"""
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    """Persist railway data through the in-memory store"""
+    store.save(data)
 
 def update_metrics_cache():
-    """Update the cached metrics"""
-    data = load_data()
-    metrics_cache['total_trains'] = len(data['trains'])
-    metrics_cache['total_stations'] = len(data['stations'])
-    metrics_cache['total_tracks'] = len(data['tracks'])
-    metrics_cache['total_station_closures'] = len(data['station_closures'])
-    metrics_cache['total_track_closures'] = len(data['track_closures'])
-    # print( len(data['track_closures']))
-    metrics_cache['total_bookings'] = len(data.get('bookings', []))
+    """Refresh the cached totals from the incrementally maintained counters"""
+    store.get()
+    store.closures.advance()
+    metrics_cache['total_trains'] = len(store.index.trains)
+    metrics_cache['total_stations'] = len(store.index.stations)
+    metrics_cache['total_tracks'] = store.index.track_count
+    metrics_cache['total_station_closures'] = store.closures.counts['station']
+    metrics_cache['total_track_closures'] = store.closures.counts['track']
+    metrics_cache['total_bookings'] = len(store.index.bookings)
+
+def set_closure_start(closure_data):
+    """Default startTime to now, keeping a valid future one; return an error message"""
+    now = datetime.now()
+    try:
+        start = datetime.fromisoformat(closure_data['startTime']) if closure_data.get('startTime') else now
+        float(closure_data['duration'])
+    except (TypeError, ValueError):
+        return "Invalid startTime or duration"
+    if start.tzinfo is not None:
+        start = start.astimezone().replace(tzinfo=None)
+    closure_data['startTime'] = max(start, now).isoformat()
+    return None
 
 # --------------------------
 # Station Closure Endpoints
@@ -86,17 +2186,9 @@ def update_metrics_cache():
 
 @app.route('/api/station-closures', methods=['GET'])
 def get_station_closures():
-    """Get all active station closures"""
+    """Get all active and scheduled station closures"""
     data = load_data()
-    current_time = datetime.now()
-    
-    active_closures = [
-        c for c in data.get('station_closures', [])
-        if 'startTime' in c and 
-        current_time - datetime.fromisoformat(c['startTime']) < timedelta(hours=c.get('duration', 0))
-    ]
-    
-    return jsonify(active_closures)
+    return jsonify(store.closures.visible(data['station_closures']))
 
 @app.route('/api/add-station-closure', methods=['POST'])
 def add_station_closure():
@@ -109,12 +2201,14 @@ def add_station_closure():
         return jsonify({"status": "error", "message": "Missing required fields"}), 400
         
     # Check if station exists
-    if not any(s['id'] == closure_data['stationId'] for s in data['stations']):
+    if closure_data['stationId'] not in store.index.stations:
         return jsonify({"status": "error", "message": "Station not found"}), 400
     
-    # Add timestamp and ID
-    closure_data['startTime'] = datetime.now().isoformat()
-    closure_data['id'] = f"stclos_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    # Add timestamp and ID; a future startTime schedules the closure
+    error = set_closure_start(closure_data)
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+    closure_data['id'] = f"stclos_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
     closure_data['type'] = 'station'
     
     # Initialize closures list if it doesn't exist
@@ -123,8 +2217,10 @@ def add_station_closure():
     
     # Add the closure
     data['station_closures'].append(closure_data)
-    save_data(data)
-    return jsonify({"status": "success", "closure": closure_data})
+    store.closures.add(closure_data)
+    store.log('insert', 'station_closures', record=closure_data)
+    job = impact_jobs.submit(closure_data)
+    return jsonify({"status": "success", "closure": closure_data, "impactJob": job['id']})
 
 @app.route('/api/station-closures/<closure_id>', methods=['DELETE'])
 def remove_station_closure(closure_id):
@@ -135,13 +2231,15 @@ def remove_station_closure(closure_id):
         return jsonify({"status": "error", "message": "No station closures found"}), 404
     
     # Find and remove closure
-    initial_count = len(data['station_closures'])
+    removed = [c for c in data['station_closures'] if c.get('id') == closure_id]
     data['station_closures'] = [c for c in data['station_closures'] if c.get('id') != closure_id]
+    for c in removed:
+        store.closures.remove(c)
     
-    if len(data['station_closures']) == initial_count:
+    if not removed:
         return jsonify({"status": "error", "message": "Station closure not found"}), 404
     
-    save_data(data)
+    store.log('delete', 'station_closures', key=closure_id)
     return jsonify({"status": "success"})
 
 # --------------------------
@@ -150,17 +2248,9 @@ def remove_station_closure(closure_id):
 
 @app.route('/api/track-closures', methods=['GET'])
 def get_track_closures():
-    """Get all active track closures"""
+    """Get all active and scheduled track closures"""
     data = load_data()
-    current_time = datetime.now()
-    
-    active_closures = [
-        c for c in data.get('track_closures', [])
-        if 'startTime' in c and 
-        current_time - datetime.fromisoformat(c['startTime']) < timedelta(hours=c.get('duration', 0))
-    ]
-    
-    return jsonify(active_closures)
+    return jsonify(store.closures.visible(data['track_closures']))
 
 @app.route('/api/add-track-closure', methods=['POST'])
 def add_track_closure():
@@ -174,18 +2264,16 @@ def add_track_closure():
         return jsonify({"status": "error", "message": "Missing required fields"}), 400
     
     # Check if track exists
-    track_exists = any(
-        (t['source'] == closure_data['source'] and t['destination'] == closure_data['destination']) or
-        (t.get('bidirectional', False) and t['source'] == closure_data['destination'] and t['destination'] == closure_data['source'])
-        for t in data['tracks']
-    )
+    track = store.index.find_track(closure_data['source'], closure_data['destination'])
     
-    if not track_exists:
+    if not track:
         return jsonify({"status": "error", "message": "Track not found"}), 400
     
-    # Add timestamp and ID
-    closure_data['startTime'] = datetime.now().isoformat()
-    closure_data['id'] = f"trclos_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    # Add timestamp and ID; a future startTime schedules the closure
+    error = set_closure_start(closure_data)
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+    closure_data['id'] = f"trclos_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
     closure_data['type'] = 'track'
     
     # Initialize closures list if it doesn't exist
@@ -194,8 +2282,10 @@ def add_track_closure():
     
     # Add the closure
     data['track_closures'].append(closure_data)
-    save_data(data)
-    return jsonify({"status": "success", "closure": closure_data})
+    store.closures.add(closure_data)
+    store.log('insert', 'track_closures', record=closure_data)
+    job = impact_jobs.submit(closure_data)
+    return jsonify({"status": "success", "closure": closure_data, "impactJob": job['id']})
 
 @app.route('/api/track-closures/<closure_id>', methods=['DELETE'])
 def remove_track_closure(closure_id):
@@ -206,70 +2296,109 @@ def remove_track_closure(closure_id):
         return jsonify({"status": "error", "message": "No track closures found"}), 404
     
     # Find and remove closure
-    initial_count = len(data['track_closures'])
+    removed = [c for c in data['track_closures'] if c.get('id') == closure_id]
     data['track_closures'] = [c for c in data['track_closures'] if c.get('id') != closure_id]
+    for c in removed:
+        store.closures.remove(c)
     
-    if len(data['track_closures']) == initial_count:
+    if not removed:
         return jsonify({"status": "error", "message": "Track closure not found"}), 404
     
-    save_data(data)
+    store.log('delete', 'track_closures', key=closure_id)
     return jsonify({"status": "success"})
 
 # --------------------------
 # Data Endpoint with Active Closures
 # --------------------------
 
+_data_payloads = {}  # encoding -> (etag, body) for the current /api/data version
+_data_payloads_lock = threading.Lock()
+
+def data_etag():
+    """Validator for /api/data: the change token plus closures expired but not yet purged, which are hidden"""
+    return f"{store.changes.token(store.position())}-{len(store.closures.expired())}"
+
+def data_payload(data, etag, encoding):
+    """Serialize (and compress) the /api/data body once per version and encoding"""
+    cached = _data_payloads.get(encoding)
+    if cached is not None and cached[0] == etag:
+        return cached[1]
+    with _data_payloads_lock:
+        cached = _data_payloads.get(encoding)
+        if cached is not None and cached[0] == etag:
+            return cached[1]
+        plain = _data_payloads.get('identity')
+        if plain is not None and plain[0] == etag:
+            body = plain[1]
+        else:
+            body = app.json.dumps({
+                'version': store.changes.token(store.position()),
+                'stations': data['stations'],
+                'tracks': data['tracks'],
+                'trains': data['trains'],
+                'bookings': data.get('bookings', []),
+                'station_closures': store.closures.visible(data['station_closures']),
+                'track_closures': store.closures.visible(data['track_closures'])
+            }).encode()
+            _data_payloads['identity'] = (etag, body)
+        with timed('serialize'):
+            if encoding == 'gzip':
+                body = gzip.compress(body, compresslevel=6)
+            elif encoding == 'br':
+                body = brotli.compress(body)
+        _data_payloads[encoding] = (etag, body)
+        return body
+
 @app.route('/api/data', methods=['GET'])
 def get_all_data():
     """Endpoint to get all railway data with active closures"""
     data = load_data()
-    current_time = datetime.now()
-    
-    # Filter out expired closures
-    active_station_closures = [
-        c for c in data.get('station_closures', [])
-        if 'startTime' in c and 
-        current_time - datetime.fromisoformat(c['startTime']) < timedelta(hours=c.get('duration', 0))
-    ]
-    
-    active_track_closures = [
-        c for c in data.get('track_closures', [])
-        if 'startTime' in c and 
-        current_time - datetime.fromisoformat(c['startTime']) < timedelta(hours=c.get('duration', 0))
-    ]
-    print(data['station_closures'])
-    
-    response_data = {
-        'stations': data['stations'],
-        'tracks': data['tracks'],
-        'trains': data['trains'],
-        'bookings': data.get('bookings', []),
-        'station_closures': data['station_closures'],
-        'track_closures': data['track_closures']
-    }
-    # print(response_data)
-   
-    return jsonify(response_data)
+
+    etag = data_etag()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        encoding = 'identity'
+        if brotli is not None and request.accept_encodings['br']:
+            encoding = 'br'
+        elif request.accept_encodings['gzip']:
+            encoding = 'gzip'
+        response = Response(data_payload(data, etag, encoding), mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Inserts, updates and deletes per collection since the version token a client last saw"""
+    load_data()
+    version = store.changes.token(store.position())
+    changes = store.changes.since(request.args.get('since'), store.position())
+    if changes is None:
+        return jsonify({"status": "success", "version": version, "reset": True})
+    # Expired closures stay in the data until the next write purges them
+    for closure in store.closures.expired():
+        name = 'station_closures' if closure_kind(closure) == 'station' else 'track_closures'
+        delta = changes.setdefault(name, {'inserted': [], 'updated': [], 'deleted': []})
+        delta['inserted'] = [c for c in delta['inserted'] if c is not closure]
+        if closure.get('id') not in delta['deleted']:
+            delta['deleted'].append(closure.get('id'))
+    return jsonify({"status": "success", "version": version, "reset": False, "changes": changes})
 
 # --------------------------
 # Train Validation with Closures
 # --------------------------
 
-def is_station_closed(station_id, closures):
-    """Check if a station is closed"""
-    return any(
-        c['type'] == 'station' and c['stationId'] == station_id
-        for c in closures
-    )
+def is_station_closed(station_id, at=None):
+    """Check if a station is closed now, or at epoch time ``at``"""
+    return store.closures.is_station_closed(station_id, at)
 
-def is_track_closed(source, destination, closures):
-    """Check if a track is closed"""
-    return any(
-        c['type'] == 'track' and 
-        ((c['source'] == source and c['destination'] == destination) or
-         (c.get('bidirectional', False) and c['source'] == destination and c['destination'] == source))
-        for c in closures
-    )
+def is_track_closed(source, destination, at=None):
+    """Check if a track is closed now, or at epoch time ``at``"""
+    return store.closures.is_track_closed(source, destination, at)
 
 @app.route('/api/trains-add', methods=['POST'])
 def add_train():
@@ -286,25 +2415,14 @@ def add_train():
                 "message": f"Missing required fields: {', '.join(missing_fields)}"
             }), 400
 
-        data = load_data()
+        load_data()
         
-        if any(t['id'] == train_data['id'] for t in data['trains']):
+        if train_data['id'] in store.index.trains:
             return jsonify({
                 "status": "error",
                 "message": f"Train ID {train_data['id']} already exists"
             }), 400
         
-        # Get active closures
-        current_time = datetime.now()
-        active_closures = [
-            *[c for c in data.get('station_closures', [])
-              if 'startTime' in c and 
-              current_time - datetime.fromisoformat(c['startTime']) < timedelta(hours=c.get('duration', 0))],
-            *[c for c in data.get('track_closures', [])
-              if 'startTime' in c and 
-              current_time - datetime.fromisoformat(c['startTime']) < timedelta(hours=c.get('duration', 0))]
-        ]
-        
         # Route validation with closure check
         route = train_data['route']
         for i in range(len(route) - 1):
@@ -312,19 +2430,14 @@ def add_train():
             dst = route[i + 1]
 
             # Check if station is closed
-            if is_station_closed(src, active_closures):
+            if is_station_closed(src):
                 return jsonify({
                     "status": "error",
                     "message": f"Station {src} is temporarily closed"
                 }), 400
 
             # Check if track exists and is not closed
-            track = next(
-                (t for t in data['tracks']
-                if ((t['source'] == src and t['destination'] == dst) or
-                    (t.get('bidirectional', False) and t['source'] == dst and t['destination'] == src))),
-                None
-            )
+            track = store.index.find_track(src, dst)
 
             if not track:
                 return jsonify({
@@ -332,15 +2445,14 @@ def add_train():
                     "message": f"No direct track between {src} and {dst}"
                 }), 400
 
-            if is_track_closed(src, dst, active_closures):
+            if is_track_closed(src, dst):
                 return jsonify({
                     "status": "error",
                     "message": f"Track between {src} and {dst} is temporarily closed"
                 }), 400
         
-        data['trains'].append(train_data)
-        save_data(data)
-        update_metrics_cache()
+        store.index.insert('trains', train_data)
+        store.log('insert', 'trains', train_data)
         
         return jsonify({
             "status": "success",
@@ -358,46 +2470,191 @@ def add_train():
 @app.route('/api/get_count', methods=['GET'])
 def get_count():
     update_metrics_cache()
-    print(metrics_cache)
-    return jsonify(metrics_cache)
+    if request.args.get('details') not in ('1', 'true'):
+        return jsonify(metrics_cache)
+    return jsonify({
+        **metrics_cache,
+        'bookings_by_trip': [
+            {'trainId': train_id, 'date': date, 'bookings': stats[0], 'passengers': stats[1]}
+            for (train_id, date), stats in store.index.trip_stats.items()
+        ],
+        'revenue_by_class': {k: float(v.quantize(FARE_QUANTUM)) for k, v in store.index.revenue_by_class.items()},
+        'active_closures_by_station': store.closures.closed_by_station()
+    })
 
 # --------------------------
 # Booking Endpoints
 # --------------------------
 
+BOOKING_QUERY_ARGS = BOOKING_FILTERS + ('dateFrom', 'dateTo', 'cursor', 'limit')
+BOOKING_CSV_FIELDS = ('bookingId', 'trainId', 'trainName', 'date', 'from', 'to', 'class', 'quota',
+                      'fare', 'status', 'passengerCount', 'passengerName', 'passengerAge',
+                      'passengerGender', 'departureTime', 'arrivalTime', 'bookingTime')
+
+def parse_booking_filters(args):
+    """Booking filters from query arguments; returns (filters, error message)"""
+    filters = {name: args[name] for name in BOOKING_FILTERS if args.get(name)}
+    if 'passenger' in filters:
+        filters['passenger'] = filters['passenger'].strip().lower()
+    for bound in ('dateFrom', 'dateTo'):
+        if args.get(bound):
+            try:
+                datetime.strptime(args[bound], '%Y-%m-%d')
+            except ValueError:
+                return None, f"{bound} must be a YYYY-MM-DD date"
+            filters[bound] = args[bound]
+    return filters, None
+
+def stream_bookings(filters, serialize):
+    """Yield serialized matching bookings a chunk at a time.
+
+    Each chunk is read under its own shared lock and resumes from the
+    last booking id of the previous one, so memory stays bounded and
+    writers are not held off for the whole download.
+    """
+    after = None
+    while True:
+        with store.reading():
+            page, after = store.index.query_bookings(filters, after, BOOKING_STREAM_CHUNK)
+            with timed('serialize'):
+                rows = [serialize(booking) for booking in page]
+        yield rows
+        if after is None:
+            return
+
+def booking_csv_row(booking):
+    """One CSV line for a booking, passenger details flattened"""
+    details = booking.get('passengerDetails') or {}
+    row = dict(booking, passengerName=details.get('name'), passengerAge=details.get('age'),
+               passengerGender=details.get('gender'))
+    out = io.StringIO()
+    csv.writer(out).writerow([row.get(field, '') for field in BOOKING_CSV_FIELDS])
+    return out.getvalue()
+
+@app.route('/api/bookings/export', methods=['GET'])
+def export_bookings():
+    """Stream matching bookings as NDJSON (default) or CSV"""
+    load_data()
+    filters, error = parse_booking_filters(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    export_format = request.args.get('format', 'ndjson')
+
+    if export_format == 'csv':
+        def generate():
+            yield ','.join(BOOKING_CSV_FIELDS) + '\r\n'
+            for rows in stream_bookings(filters, booking_csv_row):
+                yield ''.join(rows)
+        response = Response(generate(), mimetype='text/csv')
+    elif export_format == 'ndjson':
+        def generate():
+            for rows in stream_bookings(filters, json.dumps):
+                yield ''.join(row + '\n' for row in rows)
+        response = Response(generate(), mimetype='application/x-ndjson')
+    else:
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+    response.headers['Content-Disposition'] = f'attachment; filename=bookings.{export_format}'
+    return response
+
 @app.route('/api/bookings', methods=['GET', 'POST'])
 def handle_bookings():
-    data = load_data()
+    load_data()
     
     if request.method == 'GET':
-        return jsonify(data.get('bookings', []))
+        if not any(arg in request.args for arg in BOOKING_QUERY_ARGS):
+            # The plain list, as before, but streamed instead of built in memory
+            def generate():
+                yield '['
+                separator = ''
+                for rows in stream_bookings({}, json.dumps):
+                    if rows:
+                        yield separator + ','.join(rows)
+                        separator = ','
+                yield ']'
+            return Response(generate(), mimetype='application/json')
+
+        filters, error = parse_booking_filters(request.args)
+        if error:
+            return jsonify({"error": error}), 400
+        try:
+            limit = int(request.args.get('limit', BOOKING_PAGE_SIZE))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= BOOKING_PAGE_MAX:
+            return jsonify({"error": f"limit must be between 1 and {BOOKING_PAGE_MAX}"}), 400
+        bookings, next_cursor = store.index.query_bookings(filters, request.args.get('cursor') or None, limit)
+        return jsonify({"bookings": bookings, "nextCursor": next_cursor})
     
     elif request.method == 'POST':
         booking_data = request.json
         
-        if 'bookings' not in data:
-            data['bookings'] = []
+        required_fields = ['bookingId', 'trainId', 'date', 'from', 'to', 'class']
+        if not booking_data or not all(key in booking_data for key in required_fields):
+            return jsonify({"error": "Missing required fields"}), 400
+        booking_data.setdefault('status', 'confirmed')
+        booking_data.setdefault('passengerCount', 1)
+        booking_data.setdefault('quota', 'general')
         
-        existing_booking = next(
-            (b for b in data['bookings'] 
-             if b['trainId'] == booking_data['trainId'] 
-             and b['date'] == booking_data['date']
-             and b['status'] == 'confirmed'),
+        train = store.index.trains.get(booking_data['trainId'])
+        if not train:
+            return jsonify({"error": "Train not found"}), 404
+        segment = store.inventory.segment(train, booking_data['from'], booking_data['to'])
+        if segment is None:
+            return jsonify({"error": "Train does not run between these stations"}), 400
+        if booking_data['class'] not in SEAT_CAPACITY and booking_data['class'] not in train.get('seats', {}):
+            return jsonify({"error": "Invalid class"}), 400
+        try:
+            seats = int(booking_data['passengerCount'])
+        except (TypeError, ValueError):
+            seats = 0
+        if seats < 1:
+            return jsonify({"error": "Invalid passenger count"}), 400
+        booking_data['passengerCount'] = seats
+        if booking_data['class'] in fare_engine.classes:
+            # The server prices the journey; a client-supplied fare must match it
+            fare, _, error = fare_engine.quote(store.index, train, booking_data['from'], booking_data['to'],
+                                               booking_data['class'], booking_data['quota'])
+            if error:
+                return jsonify({"error": error}), 400
+            fare *= seats
+            if 'fare' in booking_data and fare_amount(booking_data['fare']) != fare:
+                return jsonify({"error": "Fare does not match the current fare", "expectedFare": str(fare)}), 400
+            booking_data['fare'] = str(fare)
+        elif fare_amount(booking_data.get('fare')) is None:
+            return jsonify({"error": "Missing or invalid fare"}), 400
+        # Only confirmed bookings hold seats; waitlisted and pending ones are not counted
+        confirmed = booking_data['status'] == 'confirmed'
+        if confirmed and not store.inventory.reserve(train, booking_data['date'], booking_data['class'], *segment, seats):
+            return jsonify({"error": "Not enough seats available"}), 409
+        
+        if booking_data['bookingId'] in store.index.bookings:
+            if confirmed:
+                store.inventory.unreserve(train, booking_data['date'], booking_data['class'], *segment, seats)
+            return jsonify({"error": "Booking ID already exists"}), 400
+        
+        # Only fold into a booking for the same seats (class and segment) whose
+        # stored count and fare can be added to; anything else is kept apart
+        existing_booking = confirmed and next(
+            (b for b in store.index.bookings_by_trip.get((booking_data['trainId'], booking_data['date']), [])
+             if b['status'] == 'confirmed' and b.get('class') == booking_data['class']
+             and b.get('from') == booking_data['from'] and b.get('to') == booking_data['to']
+             and isinstance(b.get('passengerCount', 1), int) and fare_amount(b.get('fare')) is not None),
             None
         )
         
         if existing_booking:
-            existing_booking['passengerCount'] += booking_data.get('passengerCount', 1)
-            existing_booking['fare'] = str(float(existing_booking['fare']) + float(booking_data['fare']))
+            store.index.remove_booking(existing_booking)
+            existing_booking['passengerCount'] = existing_booking.get('passengerCount', 1) + seats
+            existing_booking['fare'] = str(fare_amount(existing_booking['fare']) + fare_amount(booking_data['fare']))
+            store.index.add_booking(existing_booking)
             booking_id = existing_booking['bookingId']
             message = "Booking updated"
+            store.log('update', 'bookings', record=existing_booking)
         else:
-            data['bookings'].append(booking_data)
+            store.index.insert('bookings', booking_data)
             booking_id = booking_data['bookingId']
             message = "Booking successful"
-        
-        save_data(data)
-        update_metrics_cache()
+            store.log('insert', 'bookings', record=booking_data)
         return jsonify({"message": message, "bookingId": booking_id})
 
 @app.route('/api/bookings/<booking_id>', methods=['DELETE'])
@@ -407,14 +2664,14 @@ def cancel_booking(booking_id):
     if 'bookings' not in data:
         return jsonify({"error": "No bookings found"}), 404
     
-    initial_count = len(data['bookings'])
-    data['bookings'] = [b for b in data['bookings'] if b['bookingId'] != booking_id]
-    
-    if len(data['bookings']) == initial_count:
+    booking = store.index.bookings.get(booking_id)
+    if not booking:
         return jsonify({"error": "Booking not found"}), 404
     
-    save_data(data)
-    update_metrics_cache()
+    store.index.delete('bookings', booking)
+    store.inventory.release(booking)
+    
+    store.log('delete', 'bookings', key=booking_id)
     return jsonify({"message": "Booking deleted successfully"}), 200
 
 @app.route('/api/get_booking/<booking_id>', methods=['GET'])
@@ -424,7 +2681,7 @@ def get_booking(booking_id):
     if 'bookings' not in data:
         return jsonify({"error": "No bookings found"}), 404
     
-    booking = next((b for b in data['bookings'] if b['bookingId'] == booking_id), None)
+    booking = store.index.bookings.get(booking_id)
     
     if not booking:
         return jsonify({"error": "Booking not found"}), 404
@@ -442,30 +2699,31 @@ def get_stations():
 
 @app.route('/api/add-station', methods=['POST'])
 def add_station():
-    data = load_data()
+    load_data()
     station = request.json
     
     if not all(key in station for key in ['id', 'name', 'latitude', 'longitude']):
         return jsonify({"status": "error", "message": "Missing required fields"}), 400
+
+    if station_coordinates(station) is None:
+        return jsonify({"status": "error", "message": "latitude must be a number from -90 to 90 and longitude one from -180 to 180"}), 400
         
-    if any(s['id'] == station['id'] for s in data['stations']):
+    if station['id'] in store.index.stations:
         return jsonify({"status": "error", "message": "Station ID already exists"}), 400
         
-    data['stations'].append(station)
-    save_data(data)
-    update_metrics_cache()
+    store.index.insert('stations', station)
+    store.log('insert', 'stations', station)
     return jsonify({"status": "success", "station": station})
 
 @app.route('/api/stations/<station_id>', methods=['DELETE'])
 def delete_station(station_id):
-    data = load_data()
+    load_data()
     
-    station = next((s for s in data['stations'] if s['id'] == station_id), None)
+    station = store.index.stations.get(station_id)
     if not station:
         return jsonify({"status": "error", "message": "Station not found"}), 404
     
-    tracks_using_station = [t for t in data['tracks'] 
-                          if t['source'] == station_id or t['destination'] == station_id]
+    tracks_using_station = store.index.station_tracks(station_id)
     if tracks_using_station:
         return jsonify({
             "status": "error",
@@ -473,11 +2731,40 @@ def delete_station(station_id):
             "tracks": tracks_using_station
         }), 400
     
-    data['stations'] = [s for s in data['stations'] if s['id'] != station_id]
-    save_data(data)
-    update_metrics_cache()
+    store.index.delete('stations', station)
+    store.log('delete', 'stations', key=station_id)
     return jsonify({"status": "success"})
 
+def parse_coordinates(args, *names):
+    """Float query arguments as a list, or None if any is missing or not a number"""
+    try:
+        values = [float(args[name]) for name in names]
+    except (KeyError, TypeError, ValueError):
+        return None
+    return values if all(math.isfinite(v) for v in values) else None
+
+@app.route('/api/stations/nearest', methods=['GET'])
+def nearest_stations():
+    """The n stations closest to ?lat=&lon= (optionally within ?maxKm=), nearest first"""
+    load_data()
+    point = parse_coordinates(request.args, 'lat', 'lon')
+    if point is None or not (-90 <= point[0] <= 90 and -180 <= point[1] <= 180):
+        return jsonify({"status": "error", "message": "lat and lon must be valid coordinates"}), 400
+    try:
+        n = int(request.args.get('n', 5))
+        max_km = float(request.args['maxKm']) if request.args.get('maxKm') else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid n or maxKm"}), 400
+    if not 1 <= n <= NEAREST_MAX:
+        return jsonify({"status": "error", "message": f"n must be between 1 and {NEAREST_MAX}"}), 400
+
+    stations = store.index.stations
+    return jsonify({
+        "status": "success",
+        "stations": [dict(stations[station_id], distanceKm=round(distance, 3))
+                     for distance, station_id in store.index.grid.nearest(point[0], point[1], n, max_km)]
+    })
+
 # --------------------------
 # Track Endpoints
 # --------------------------
@@ -489,7 +2776,7 @@ def get_tracks():
 
 @app.route('/api/add-track', methods=['POST'])
 def add_track():
-    data = load_data()
+    load_data()
     track = request.json
 
     if 'weight' not in track:  # Auto-fill if missing
@@ -499,40 +2786,71 @@ def add_track():
     if not all(key in track for key in required_fields):
         return jsonify({"status": "error", "message": "Missing required fields"}), 400
     
-    source_exists = any(s['id'] == track['source'] for s in data['stations'])
-    dest_exists = any(s['id'] == track['destination'] for s in data['stations'])
+    source_exists = track['source'] in store.index.stations
+    dest_exists = track['destination'] in store.index.stations
     if not source_exists or not dest_exists:
         return jsonify({"status": "error", "message": "Source or destination station not found"}), 400
     
-    existing_track = next((t for t in data['tracks'] 
-                         if t['source'] == track['source'] and 
-                         t['destination'] == track['destination']), None)
+    existing_track = store.index.get_track(track['source'], track['destination'])
     if existing_track:
         return jsonify({"status": "error", "message": "Track already exists"}), 400
     
     if 'bidirectional' not in track:
         track['bidirectional'] = False
     
-    data['tracks'].append(track)
-    save_data(data)
-    update_metrics_cache()
+    store.index.insert('tracks', track)
+    store.log('insert', 'tracks', track)
     return jsonify({"status": "success", "track": track})
 
 @app.route('/api/tracks/<source>/<destination>', methods=['DELETE'])
 def delete_track(source, destination):
-    data = load_data()
+    load_data()
     
-    initial_count = len(data['tracks'])
-    data['tracks'] = [t for t in data['tracks'] 
-                     if not (t['source'] == source and t['destination'] == destination)]
-    
-    if len(data['tracks']) == initial_count:
+    track = store.index.get_track(source, destination)
+    if not track:
         return jsonify({"status": "error", "message": "Track not found"}), 404
     
-    save_data(data)
-    update_metrics_cache()
+    while track:
+        store.index.delete('tracks', track)
+        track = store.index.get_track(source, destination)
+    
+    store.log('delete', 'tracks', key=(source, destination))
     return jsonify({"status": "success"})
 
+@app.route('/api/network/bbox', methods=['GET'])
+def network_in_bbox():
+    """Stations inside ?south=&west=&north=&east= and the tracks touching them.
+
+    A track is included when either end is inside the box, so lines
+    leaving the viewport are still drawn. At most BBOX_MAX_STATIONS
+    stations are returned; "truncated" says when there were more.
+    """
+    load_data()
+    box = parse_coordinates(request.args, 'south', 'west', 'north', 'east')
+    if box is None:
+        return jsonify({"status": "error", "message": "south, west, north and east are required"}), 400
+    south, west, north, east = box
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        return jsonify({"status": "error", "message": "Invalid bounding box"}), 400
+
+    index = store.index
+    station_ids = []
+    truncated = False
+    for station_id in index.grid.in_bbox(south, west, north, east):
+        if len(station_ids) == BBOX_MAX_STATIONS:
+            truncated = True
+            break
+        station_ids.append(station_id)
+    edge_keys = set()
+    for station_id in station_ids:
+        edge_keys.update(index.station_edges.get(station_id, ()))
+    return jsonify({
+        "status": "success",
+        "stations": [index.stations[station_id] for station_id in station_ids],
+        "tracks": [track for key in edge_keys for track in index.edges.get(key, ())],
+        "truncated": truncated
+    })
+
 # --------------------------
 # Train Endpoints
 # --------------------------
@@ -546,17 +2864,17 @@ def get_trains():
 def delete_train(train_id):
     data = load_data()
     
-    initial_count = len(data['trains'])
-    data['trains'] = [t for t in data['trains'] if t['id'] != train_id]
-    
-    if len(data['trains']) == initial_count:
+    train = store.index.trains.get(train_id)
+    if not train:
         return jsonify({
             "status": "error",
             "message": f"Train {train_id} not found"
         }), 404
     
-    save_data(data)
-    update_metrics_cache()
+    store.index.delete('trains', train)
+    store.inventory.reset_train(train_id)
+    store.log('delete', 'trains', key=train_id)
+    
     return jsonify({
         "status": "success",
         "message": f"Train {train_id} deleted successfully",
@@ -565,26 +2883,1968 @@ def delete_train(train_id):
 
 @app.route('/api/trains/<train_id>', methods=['PUT'])
 def update_train(train_id):
-    data = load_data()
-    train_data = request.json
+    load_data()
+    train_data = request.get_json(silent=True)
     
-    train_index = next((i for i, t in enumerate(data['trains']) 
-                      if t['id'] == train_id), None)
-    if train_index is None:
+    train = store.index.trains.get(train_id)
+    if train is None:
         return jsonify({"status": "error", "message": "Train not found"}), 404
     
-    for station_id in train_data.get('route', []):
-        if not any(s['id'] == station_id for s in data['stations']):
+    # Validate everything before the index is touched
+    if not isinstance(train_data, dict):
+        return jsonify({"status": "error", "message": "No data received"}), 400
+    if train_data.get('id') != train_id:
+        return jsonify({
+            "status": "error",
+            "message": f"Train ID must be {train_id}; it cannot be changed"
+        }), 400
+    route = train_data.get('route', [])
+    if not isinstance(route, list):
+        return jsonify({"status": "error", "message": "Route must be a list of station IDs"}), 400
+    for station_id in route:
+        if not isinstance(station_id, str) or station_id not in store.index.stations:
             return jsonify({
                 "status": "error",
                 "message": f"Station {station_id} in route not found"
             }), 400
     
-    data['trains'][train_index] = train_data
-    save_data(data)
-    update_metrics_cache()
+    # Update in place so the train keeps its position in the list
+    store.index.remove_train(train)
+    train.clear()
+    train.update(train_data)
+    store.index.add_train(train)
+    store.inventory.reset_train(train_id)
+    store.log('update', 'trains', train)
     return jsonify({"status": "success", "train": train_data})
 
+# --------------------------
+# Bulk Import
+# --------------------------
+
+BULK_IMPORT_TYPES = ('stations', 'tracks', 'trains')
+BULK_REQUIRED_FIELDS = {
+    'stations': ['id', 'name', 'latitude', 'longitude'],
+    'tracks': ['source', 'destination', 'distance', 'capacity'],
+    'trains': ['id', 'name', 'speed', 'type', 'route', 'timings']
+}
+BULK_KEY_FIELDS = {'stations': ('id',), 'tracks': ('source', 'destination'), 'trains': ('id',)}
+BULK_CSV_NUMBERS = {'latitude': float, 'longitude': float, 'distance': float, 'weight': float,
+                    'capacity': int, 'speed': int}
+
+def is_station_list(route):
+    return isinstance(route, list) and all(isinstance(station_id, str) for station_id in route)
+
+def parse_bulk_csv_row(kind, row):
+    """Turn a CSV row into a record; train routes and timings are ';'-separated"""
+    record = {k: v for k, v in row.items() if k and v not in (None, '')}
+    for field, convert in BULK_CSV_NUMBERS.items():
+        if field in record:
+            record[field] = convert(record[field])
+    if 'bidirectional' in record:
+        record['bidirectional'] = record['bidirectional'].strip().lower() in ('1', 'true', 'yes')
+    if kind == 'trains':
+        for field in ('route', 'timings'):
+            if field in record:
+                record[field] = [v.strip() for v in record[field].split(';') if v.strip()]
+    return record
+
+def read_bulk_records(stream, fmt, default_type=None):
+    """Yield (line number, type, record, error) from an NDJSON or CSV text stream.
+
+    A record's type comes from its own 'collection' field (trains already use
+    'type' for the train type) or ``default_type``.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            kind = row.pop('collection', None) or default_type
+            try:
+                yield reader.line_num, kind, parse_bulk_csv_row(kind, row), None
+            except ValueError as e:
+                yield reader.line_num, kind, None, f"Invalid value: {e}"
+        return
+    for line, text in enumerate(stream, 1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError:
+            yield line, default_type, None, "Invalid JSON"
+            continue
+        if not isinstance(record, dict):
+            yield line, default_type, None, "Each line must be a JSON object"
+            continue
+        yield line, record.pop('collection', None) or default_type, record, None
+
+class BulkImport:
+    """Validate and apply stations, tracks and trains a batch at a time.
+
+    Each batch is checked against the indexes with set operations: every
+    (src, dst) hop of every train in the batch is tested against the
+    usable-edge set and the closed stations/edges at once, and only the
+    trains that hit a bad hop are walked to name it. Valid records are
+    applied in memory and persisted with one store.log_many() per batch;
+    invalid ones are reported with their line number.
+    """
+
+    def __init__(self):
+        self.imported = {kind: 0 for kind in BULK_IMPORT_TYPES}
+        self.errors = []
+        self.error_count = 0
+        self.batches = 0
+        self.edges = set()  # directed hops a train can use
+        for tracks in store.index.edges.values():
+            for track in tracks:
+                self._add_edges(track)
+
+    def _add_edges(self, track):
+        self.edges.add((track['source'], track['destination']))
+        if track.get('bidirectional', False):
+            self.edges.add((track['destination'], track['source']))
+
+    def error(self, line, kind, record, message):
+        self.error_count += 1
+        if len(self.errors) < BULK_IMPORT_MAX_ERRORS:
+            key = None
+            if isinstance(record, dict) and kind in RECORD_KEYS:
+                key = record_key(kind, record)
+            self.errors.append({"line": line, "type": kind, "key": key, "message": message})
+
+    def run(self, records):
+        batch = []
+        for line, kind, record, problem in records:
+            if problem is not None:
+                self.error(line, kind, record, problem)
+            elif kind not in BULK_IMPORT_TYPES:
+                self.error(line, kind, record, f"Unknown record type, expected one of {', '.join(BULK_IMPORT_TYPES)}")
+            else:
+                missing = [f for f in BULK_REQUIRED_FIELDS[kind] if f not in record]
+                if missing:
+                    self.error(line, kind, record, f"Missing required fields: {', '.join(missing)}")
+                elif not all(isinstance(record[f], str) for f in BULK_KEY_FIELDS[kind]):
+                    self.error(line, kind, record, f"{' and '.join(BULK_KEY_FIELDS[kind])} must be strings")
+                else:
+                    batch.append((line, kind, record))
+            if len(batch) >= BULK_IMPORT_BATCH:
+                self.commit(batch)
+                batch = []
+        if batch:
+            self.commit(batch)
+        return self
+
+    def commit(self, batch):
+        """Validate one batch (stations, then tracks, then trains) and persist what passed"""
+        changes = []
+        by_kind = defaultdict(list)
+        for line, kind, record in batch:
+            by_kind[kind].append((line, record))
+
+        for line, station in by_kind['stations']:
+            if station['id'] in store.index.stations:
+                self.error(line, 'stations', station, "Station ID already exists")
+                continue
+            if station_coordinates(station) is None:
+                self.error(line, 'stations', station, "latitude must be a number from -90 to 90 and longitude one from -180 to 180")
+                continue
+            store.index.insert('stations', station)
+            changes.append(('insert', 'stations', station, None))
+
+        for line, track in by_kind['tracks']:
+            if track['source'] not in store.index.stations or track['destination'] not in store.index.stations:
+                self.error(line, 'tracks', track, "Source or destination station not found")
+                continue
+            if store.index.get_track(track['source'], track['destination']):
+                self.error(line, 'tracks', track, "Track already exists")
+                continue
+            track.setdefault('weight', track['distance'])
+            track.setdefault('bidirectional', False)
+            store.index.insert('tracks', track)
+            self._add_edges(track)
+            changes.append(('insert', 'tracks', track, None))
+
+        trains = by_kind['trains']
+        hops = set()
+        for _, train in trains:
+            route = train['route']
+            if is_station_list(route):
+                hops.update(zip(route, route[1:]))
+        closed_stations = store.closures.closed_stations()
+        bad_hops = (hops - self.edges) | (hops & store.closures.closed_edges())
+        seen = set()
+        for line, train in trains:
+            route = train['route']
+            if not is_station_list(route):
+                self.error(line, 'trains', train, "route must be a list of station ids")
+                continue
+            if train['id'] in store.index.trains or train['id'] in seen:
+                self.error(line, 'trains', train, f"Train ID {train['id']} already exists")
+                continue
+            if bad_hops.intersection(zip(route, route[1:])) or closed_stations.intersection(route[:-1]):
+                self.error(line, 'trains', train, self.route_problem(route, closed_stations))
+                continue
+            seen.add(train['id'])
+            store.index.insert('trains', train)
+            changes.append(('insert', 'trains', train, None))
+
+        if changes:
+            store.log_many(changes)
+        for _, kind, _, _ in changes:
+            self.imported[kind] += 1
+        self.batches += 1
+
+    def route_problem(self, route, closed_stations):
+        """The first problem on a route, in the order add_train reports them"""
+        closed_edges = store.closures.closed_edges()
+        for src, dst in zip(route, route[1:]):
+            if src in closed_stations:
+                return f"Station {src} is temporarily closed"
+            if (src, dst) not in self.edges:
+                return f"No direct track between {src} and {dst}"
+            if (src, dst) in closed_edges:
+                return f"Track between {src} and {dst} is temporarily closed"
+        return "Invalid route"
+
+    def report(self):
+        return {
+            "status": "success" if not self.error_count else "partial",
+            "imported": self.imported,
+            "batches": self.batches,
+            "errorCount": self.error_count,
+            "errors": sorted(self.errors, key=lambda e: e['line'])
+        }
+
+@app.route('/api/bulk-import', methods=['POST'])
+def bulk_import():
+    """Import stations, tracks and trains from an NDJSON or CSV body.
+
+    ?format=csv (or a text/csv body) reads CSV; ?type= gives the record
+    type for rows without a "collection" field.
+    """
+    load_data()
+    kind = request.args.get('type')
+    if kind is not None and kind not in BULK_IMPORT_TYPES:
+        return jsonify({"status": "error", "message": f"type must be one of {', '.join(BULK_IMPORT_TYPES)}"}), 400
+    fmt = 'csv' if request.args.get('format') == 'csv' or request.mimetype == 'text/csv' else 'ndjson'
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    importer = BulkImport().run(read_bulk_records(stream, fmt, kind))
+    return jsonify(importer.report())
+
+# --------------------------
+# Route Planning
+# --------------------------
+
+ROUTE_METRICS = ('distance', 'weight')
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * 6371.0 * math.asin(math.sqrt(min(1.0, a)))
+
+class RouteGraph:
+    """Compact adjacency over the track network, indexed by station number.
+
+    Edges are stored CSR-style: the neighbours of node ``u`` are
+    ``targets[offsets[u]:offsets[u + 1]]`` with costs in ``costs``. A
+    bidirectional track contributes an edge each way. ``heuristic_scale``
+    is the smallest cost/straight-line ratio over all edges, so the
+    scaled haversine distance never overestimates and A* stays exact.
+    Stations without usable coordinates get a zero heuristic.
+    """
+
+    def __init__(self, data, metric='distance'):
+        self.metric = metric
+        self.ids = [s['id'] for s in data['stations']]
+        self.position = {station_id: i for i, station_id in enumerate(self.ids)}
+        coordinates = [station_coordinates(s) for s in data['stations']]
+        self.located = bytearray(c is not None for c in coordinates)  # 0 for stations without usable coordinates
+        self.lat = array('d', (c[0] if c else 0.0 for c in coordinates))
+        self.lon = array('d', (c[1] if c else 0.0 for c in coordinates))
+
+        neighbours = [[] for _ in self.ids]
+        for track in data['tracks']:
+            u = self.position.get(track['source'])
+            v = self.position.get(track['destination'])
+            if u is None or v is None:
+                continue
+            cost = float(track.get(metric, track['distance']))
+            neighbours[u].append((v, cost))
+            if track.get('bidirectional', False):
+                neighbours[v].append((u, cost))
+
+        self.offsets = array('i', [0])
+        self.targets = array('i')
+        self.costs = array('d')
+        scale = float('inf')
+        for u, edges in enumerate(neighbours):
+            for v, cost in edges:
+                self.targets.append(v)
+                self.costs.append(cost)
+                straight = self.straight_line(u, v) if self.located[u] and self.located[v] else 0.0
+                if straight > 0:
+                    scale = min(scale, cost / straight)
+            self.offsets.append(len(self.targets))
+        self.heuristic_scale = 0.0 if scale == float('inf') else max(0.0, scale)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def straight_line(self, u, v):
+        return haversine_km(self.lat[u], self.lon[u], self.lat[v], self.lon[v])
+
+    def closed_sets(self, closures):
+        """Translate active closures into node numbers and (u, v) edge pairs"""
+        position = self.position
+        closed_nodes = {position[s] for s in closures.closed_stations() if s in position}
+        closed_edges = {(position[a], position[b]) for a, b in closures.closed_edges()
+                        if a in position and b in position}
+        return closed_nodes, closed_edges
+
+    def shortest_path(self, source, target, closed_nodes=frozenset(), closed_edges=frozenset()):
+        """A* from node ``source`` to node ``target``; return (cost, nodes) or None"""
+        offsets, targets, costs = self.offsets, self.targets, self.costs
+        scale = self.heuristic_scale
+        lat, lon, located = self.lat, self.lon, self.located
+        target_lat, target_lon = lat[target], lon[target]
+        if not located[target]:
+            scale = 0.0
+
+        def heuristic(node):
+            if not scale or not located[node]:
+                return 0.0
+            return scale * haversine_km(lat[node], lon[node], target_lat, target_lon)
+
+        # A zero heuristic on some nodes is admissible but not consistent, so a
+        # node may be reached more cheaply after it was expanded; it is then
+        # expanded again rather than kept in a closed set.
+        best = {source: 0.0}
+        previous = {source: None}
+        heap = [(heuristic(source), 0.0, source)]
+        while heap:
+            _, cost, u = heapq.heappop(heap)
+            if cost > best[u]:
+                continue  # superseded by a cheaper path
+            if u == target:
+                path = []
+                while u is not None:
+                    path.append(u)
+                    u = previous[u]
+                return cost, path[::-1]
+            for i in range(offsets[u], offsets[u + 1]):
+                v = targets[i]
+                if v in closed_nodes or (closed_edges and (u, v) in closed_edges):
+                    continue
+                new_cost = cost + costs[i]
+                if new_cost < best.get(v, float('inf')):
+                    best[v] = new_cost
+                    previous[v] = u
+                    heapq.heappush(heap, (new_cost + heuristic(v), new_cost, v))
+        return None
+
+    def shortest_path_tree(self, source, closed_nodes=frozenset(), closed_edges=frozenset()):
+        """Dijkstra from ``source`` to every reachable node; return (dist, previous)"""
+        offsets, targets, costs = self.offsets, self.targets, self.costs
+        dist = {source: 0.0}
+        previous = {source: None}
+        heap = [(0.0, source)]
+        while heap:
+            cost, u = heapq.heappop(heap)
+            if cost > dist[u]:
+                continue
+            for i in range(offsets[u], offsets[u + 1]):
+                v = targets[i]
+                if v in closed_nodes or (closed_edges and (u, v) in closed_edges):
+                    continue
+                new_cost = cost + costs[i]
+                if new_cost < dist.get(v, float('inf')):
+                    dist[v] = new_cost
+                    previous[v] = u
+                    heapq.heappush(heap, (new_cost, v))
+        return dist, previous
+
+    def bellman_ford_tree(self, source, closed_nodes=frozenset(), closed_edges=frozenset()):
+        """Bellman-Ford from ``source``; same result shape as shortest_path_tree"""
+        offsets, targets, costs = self.offsets, self.targets, self.costs
+        dist = {source: 0.0}
+        previous = {source: None}
+        for _ in range(max(1, len(self.ids) - 1)):
+            updated = False
+            for u, cost in list(dist.items()):
+                for i in range(offsets[u], offsets[u + 1]):
+                    v = targets[i]
+                    if v in closed_nodes or (closed_edges and (u, v) in closed_edges):
+                        continue
+                    new_cost = cost + costs[i]
+                    if new_cost < dist.get(v, float('inf')):
+                        dist[v] = new_cost
+                        previous[v] = u
+                        updated = True
+            if not updated:
+                break
+        return dist, previous
+
+    @staticmethod
+    def tree_path(tree, target):
+        """Read the path to ``target`` out of a shortest-path tree"""
+        dist, previous = tree
+        if target not in dist:
+            return None
+        path = []
+        node = target
+        while node is not None:
+            path.append(node)
+            node = previous[node]
+        return dist[target], path[::-1]
+
+    def edge_cost(self, u, v):
+        """Cheapest direct edge cost from u to v"""
+        return min(self.costs[i] for i in range(self.offsets[u], self.offsets[u + 1])
+                   if self.targets[i] == v)
+
+    def k_shortest_paths(self, source, target, k, closed_nodes=frozenset(),
+                         closed_edges=frozenset(), first=None):
+        """Yen's algorithm: up to ``k`` loopless paths as (cost, nodes), cheapest first"""
+        if first is None:
+            first = self.shortest_path(source, target, closed_nodes, closed_edges)
+        if first is None:
+            return []
+        paths = [first]
+        seen = {tuple(first[1])}
+        candidates = []
+        while len(paths) < k:
+            _, last_path = paths[-1]
+            root_cost = 0.0
+            for i in range(len(last_path) - 1):
+                spur = last_path[i]
+                root = last_path[:i + 1]
+                removed_edges = set(closed_edges)
+                for _, path in paths:
+                    if path[:i + 1] == root and len(path) > i + 1:
+                        removed_edges.add((path[i], path[i + 1]))
+                removed_nodes = set(closed_nodes).union(root[:-1])
+                spur_path = self.shortest_path(spur, target, removed_nodes, removed_edges)
+                if spur_path is not None:
+                    candidate = root[:-1] + spur_path[1]
+                    key = tuple(candidate)
+                    if key not in seen:
+                        seen.add(key)
+                        heapq.heappush(candidates, (root_cost + spur_path[0], candidate))
+                root_cost += self.edge_cost(last_path[i], last_path[i + 1])
+            if not candidates:
+                break
+            paths.append(heapq.heappop(candidates))
+        return paths
+
+    def max_flow(self, source, sink, closed_nodes=frozenset(), closed_edges=frozenset()):
+        """Dinic's max flow treating costs as capacities.
+
+        Returns (flow value, CSR indices of the edges in a minimum cut).
+        """
+        offsets, targets, costs = self.offsets, self.targets, self.costs
+        n = len(self.ids)
+        # Residual graph: edge e and its reverse e ^ 1, chained per node via head/nxt
+        head = [-1] * n
+        nxt, to, cap, origin = [], [], [], []
+        for u in range(n):
+            if u in closed_nodes:
+                continue
+            for i in range(offsets[u], offsets[u + 1]):
+                v = targets[i]
+                if costs[i] <= 0 or v in closed_nodes or (closed_edges and (u, v) in closed_edges):
+                    continue
+                for a, b, c, o in ((u, v, costs[i], i), (v, u, 0.0, -1)):
+                    to.append(b)
+                    cap.append(c)
+                    origin.append(o)
+                    nxt.append(head[a])
+                    head[a] = len(to) - 1
+
+        flow = 0.0
+        while True:
+            level = [-1] * n
+            level[source] = 0
+            queue = [source]
+            for u in queue:
+                e = head[u]
+                while e != -1:
+                    if cap[e] > 1e-9 and level[to[e]] < 0:
+                        level[to[e]] = level[u] + 1
+                        queue.append(to[e])
+                    e = nxt[e]
+            if level[sink] < 0:
+                break
+
+            # Blocking flow with current-arc pointers, iteratively
+            current = head[:]
+            path = []
+            u = source
+            while True:
+                if u == sink:
+                    pushed = min(cap[e] for e in path)
+                    for e in path:
+                        cap[e] -= pushed
+                        cap[e ^ 1] += pushed
+                    flow += pushed
+                    path = []
+                    u = source
+                    continue
+                e = current[u]
+                while e != -1 and not (cap[e] > 1e-9 and level[to[e]] == level[u] + 1):
+                    e = nxt[e]
+                current[u] = e
+                if e != -1:
+                    path.append(e)
+                    u = to[e]
+                    continue
+                level[u] = -1  # dead end, never enter again this phase
+                if not path:
+                    break
+                e = path.pop()
+                u = to[e ^ 1]
+                current[u] = nxt[current[u]]
+
+        # Minimum cut: saturated edges leaving the part still reachable from source
+        reachable = {source}
+        queue = [source]
+        for u in queue:
+            e = head[u]
+            while e != -1:
+                if cap[e] > 1e-9 and to[e] not in reachable:
+                    reachable.add(to[e])
+                    queue.append(to[e])
+                e = nxt[e]
+        cut = [origin[e] for e in range(0, len(to), 2)
+               if to[e ^ 1] in reachable and to[e] not in reachable]
+        return flow, cut
+
+_route_graphs = {}
+_route_graphs_lock = threading.Lock()
+
+def get_route_graph(metric='distance'):
+    """Return the RouteGraph for the current network, rebuilding it only after track/station changes"""
+    version = (id(store.index), store.index.network_version)
+    cached = _route_graphs.get(metric)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _route_graphs_lock:
+        cached = _route_graphs.get(metric)
+        if cached is None or cached[0] != version:
+            cached = (version, RouteGraph(store.data, metric))
+            _route_graphs[metric] = cached
+    return cached[1]
+
+@app.route('/api/route', methods=['GET'])
+def find_route():
+    """Shortest open route between two stations"""
+    load_data()
+    source = request.args.get('from')
+    destination = request.args.get('to')
+    metric = request.args.get('metric', 'distance')
+
+    if not source or not destination:
+        return jsonify({"status": "error", "message": "Missing from/to station"}), 400
+    if metric not in ROUTE_METRICS:
+        return jsonify({"status": "error", "message": f"Unknown metric {metric}"}), 400
+
+    graph = get_route_graph(metric)
+    if source not in graph.position or destination not in graph.position:
+        return jsonify({"status": "error", "message": "Station not found"}), 404
+    if is_station_closed(source):
+        return jsonify({"status": "error", "message": "Start station is temporarily closed"}), 400
+    if is_station_closed(destination):
+        return jsonify({"status": "error", "message": "Destination station is temporarily closed"}), 400
+
+    closed_nodes, closed_edges = graph.closed_sets(store.closures)
+    result = graph.shortest_path(graph.position[source], graph.position[destination],
+                                 closed_nodes, closed_edges)
+    if result is None:
+        return jsonify({"status": "error", "message": "No path exists between these stations"}), 404
+
+    cost, nodes = result
+    path = [graph.ids[n] for n in nodes]
+    return jsonify({
+        "status": "success",
+        "metric": metric,
+        "cost": round(cost, 3),
+        "path": path,
+        "stations": [store.index.stations[station_id].get('name', station_id) for station_id in path]
+    })
+
+# Batches at or below this size are answered in-process
+ROUTE_BATCH_INLINE_LIMIT = 32
+ROUTE_BATCH_MAX_QUERIES = 10000
+ROUTE_BATCH_MAX_K = 20
+
+_batch_graph = None
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+def _init_batch_worker(graph):
+    """Pool initializer: the pickled graph is all a worker needs"""
+    global _batch_graph
+    _batch_graph = graph
+
+def run_route_group(source, queries, closed_nodes, closed_edges, algorithm, graph=None):
+    """Answer all queries sharing ``source`` from one shortest-path tree.
+
+    ``queries`` is a list of (index, target, k) with node numbers. Returns
+    a list of (index, [(cost, nodes), ...]).
+    """
+    graph = graph or _batch_graph
+    if algorithm == 'bellman-ford':
+        tree = graph.bellman_ford_tree(source, closed_nodes, closed_edges)
+    else:
+        tree = graph.shortest_path_tree(source, closed_nodes, closed_edges)
+    results = []
+    for index, target, k in queries:
+        first = graph.tree_path(tree, target)
+        if first is None or k <= 1:
+            paths = [first] if first else []
+        else:
+            paths = graph.k_shortest_paths(source, target, k, closed_nodes, closed_edges, first=first)
+        results.append((index, paths))
+    return results
+
+def get_batch_pool(graph, version):
+    """Process pool whose workers hold ``graph``; recreated when the network changes.
+
+    Workers are spawned, not forked: a fork from this threaded server could
+    copy a lock another thread holds and leave the child stuck on it. A
+    spawned worker re-imports this module to unpickle the graph; nothing
+    at module level opens files, starts threads or registers exit hooks,
+    so that import is inert.
+    """
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None or _batch_pool[0] != version:
+            if _batch_pool is not None:
+                _batch_pool[1].shutdown(wait=False)
+            executor = ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=_init_batch_worker, initargs=(graph,))
+            _batch_pool = (version, executor)
+        return _batch_pool[1]
+
+def parse_route_query(query):
+    """Accept {"from", "to", "k"} objects or [from, to, k] lists"""
+    if isinstance(query, dict):
+        return query.get('from'), query.get('to'), query.get('k', 1)
+    if isinstance(query, (list, tuple)) and len(query) in (2, 3):
+        return query[0], query[1], query[2] if len(query) == 3 else 1
+    return None, None, None
+
+@app.route('/api/routes/batch', methods=['POST'])
+def batch_routes():
+    """K shortest routes for many origin-destination pairs, streamed as NDJSON"""
+    load_data()
+    body = request.get_json(silent=True) or {}
+    queries = body.get('queries')
+    metric = body.get('metric', 'distance')
+    algorithm = body.get('algorithm', 'dijkstra')
+
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"status": "error", "message": "Missing queries"}), 400
+    if len(queries) > ROUTE_BATCH_MAX_QUERIES:
+        return jsonify({"status": "error", "message": f"At most {ROUTE_BATCH_MAX_QUERIES} queries per batch"}), 400
+    if metric not in ROUTE_METRICS:
+        return jsonify({"status": "error", "message": f"Unknown metric {metric}"}), 400
+    if algorithm not in ('dijkstra', 'bellman-ford'):
+        return jsonify({"status": "error", "message": f"Unknown algorithm {algorithm}"}), 400
+
+    graph = get_route_graph(metric)
+    closed_nodes, closed_edges = graph.closed_sets(store.closures)
+    groups = defaultdict(list)
+    errors = []
+    for index, query in enumerate(queries):
+        source, destination, k = parse_route_query(query)
+        line = {"index": index, "from": source, "to": destination}
+        if source not in graph.position or destination not in graph.position:
+            errors.append(dict(line, status="error", message="Station not found"))
+        elif not isinstance(k, int) or not 1 <= k <= ROUTE_BATCH_MAX_K:
+            errors.append(dict(line, status="error", message=f"k must be between 1 and {ROUTE_BATCH_MAX_K}"))
+        elif graph.position[source] in closed_nodes or graph.position[destination] in closed_nodes:
+            errors.append(dict(line, status="error", message="Station is temporarily closed"))
+        else:
+            groups[graph.position[source]].append((index, graph.position[destination], k))
+
+    def format_result(index, paths):
+        source, destination, k = parse_route_query(queries[index])
+        return json.dumps({
+            "index": index,
+            "from": source,
+            "to": destination,
+            "status": "success" if paths else "no_path",
+            "paths": [{"cost": round(cost, 3), "path": [graph.ids[n] for n in nodes]}
+                      for cost, nodes in paths]
+        }) + '\n'
+
+    def generate():
+        for line in errors:
+            yield json.dumps(line) + '\n'
+        if len(queries) <= ROUTE_BATCH_INLINE_LIMIT or len(groups) == 1:
+            for source, group in groups.items():
+                for index, paths in run_route_group(source, group, closed_nodes, closed_edges,
+                                                    algorithm, graph):
+                    yield format_result(index, paths)
+            return
+        pool = get_batch_pool(graph, (metric, id(store.index), store.index.network_version))
+        futures = [pool.submit(run_route_group, source, group, closed_nodes, closed_edges, algorithm)
+                   for source, group in groups.items()]
+        for future in as_completed(futures):
+            for index, paths in future.result():
+                yield format_result(index, paths)
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+# --------------------------
+# Capacity Analysis
+# --------------------------
+
+MAXFLOW_BATCH_MAX_PAIRS = 1000
+
+def max_flow_result(graph, closed_nodes, closed_edges, source, sink):
+    """Max flow and min cut between two station ids as a response dict"""
+    line = {"source": source, "sink": sink}
+    if source not in graph.position or sink not in graph.position:
+        return dict(line, status="error", message="Station not found")
+    if source == sink:
+        return dict(line, status="error", message="Source and sink must differ")
+    u, v = graph.position[source], graph.position[sink]
+    if u in closed_nodes or v in closed_nodes:
+        return dict(line, status="error", message="Station is temporarily closed")
+    value, cut = graph.max_flow(u, v, closed_nodes, closed_edges)
+    edges = []
+    for i in cut:
+        a = bisect_right(graph.offsets, i) - 1
+        edges.append({"from": graph.ids[a], "to": graph.ids[graph.targets[i]], "capacity": graph.costs[i]})
+    return dict(line, status="success", maxFlow=value, minCut=edges)
+
+@app.route('/api/maxflow', methods=['GET', 'POST'])
+def max_flow():
+    """Line capacity between stations: GET ?source=&sink=, or POST {"pairs": [[source, sink], ...]}"""
+    load_data()
+    graph = get_route_graph('capacity')
+    closed_nodes, closed_edges = graph.closed_sets(store.closures)
+
+    if request.method == 'GET':
+        source = request.args.get('source')
+        sink = request.args.get('sink')
+        if not source or not sink:
+            return jsonify({"status": "error", "message": "Missing source or sink"}), 400
+        if source not in graph.position or sink not in graph.position:
+            return jsonify({"status": "error", "message": "Station not found"}), 404
+        result = max_flow_result(graph, closed_nodes, closed_edges, source, sink)
+        if result['status'] == 'error':
+            return jsonify(result), 400
+        return jsonify(result)
+
+    pairs = (request.get_json(silent=True) or {}).get('pairs')
+    if not isinstance(pairs, list) or not pairs:
+        return jsonify({"status": "error", "message": "Missing pairs"}), 400
+    if len(pairs) > MAXFLOW_BATCH_MAX_PAIRS:
+        return jsonify({"status": "error", "message": f"At most {MAXFLOW_BATCH_MAX_PAIRS} pairs per batch"}), 400
+    results = []
+    for pair in pairs:
+        if isinstance(pair, dict):
+            pair = (pair.get('source'), pair.get('sink'))
+        if not isinstance(pair, (list, tuple)) or len(pair) != 2:
+            results.append({"status": "error", "message": "Each pair needs a source and a sink"})
+            continue
+        results.append(max_flow_result(graph, closed_nodes, closed_edges, *pair))
+    return jsonify({"status": "success", "results": results})
+
+# --------------------------
+# Closure Impact
+# --------------------------
+
+def closure_dates(closure):
+    """First and last travel date (YYYY-MM-DD) a closure's window touches, or None"""
+    window = closure_window(closure)
+    if window is None:
+        return None
+    start, end = window
+    return (datetime.fromtimestamp(start).date().isoformat(),
+            datetime.fromtimestamp(max(start, end)).date().isoformat())
+
+def shift_date(date, days):
+    """A YYYY-MM-DD date moved by ``days``"""
+    return (datetime.strptime(date, '%Y-%m-%d') + timedelta(days=days)).date().isoformat()
+
+def stop_days(train):
+    """Days after its departure date on which a train is at each stop of its route"""
+    timings = train.get('timings')
+    days = []
+    day = 0
+    for minutes in rolling_minutes(timings if isinstance(timings, list) else [], len(train['route'])):
+        if minutes != TIMING_UNKNOWN:
+            day = minutes // 1440
+        days.append(day)
+    return days
+
+def blocked_segments(route, closed_stations, closed_hops):
+    """Merge a route's closed stops and hops into (i, j) spans to run around.
+
+    A closed stop k needs the span k-1..k+1 and a closed hop k the span
+    k..k+1; overlapping spans merge. Spans reaching past either end of
+    the route (a closed terminus) are clipped, and reported as such.
+    """
+    spans = sorted([(k - 1, k + 1) for k, s in enumerate(route) if s in closed_stations] +
+                   [(k, k + 1) for k, hop in enumerate(zip(route, route[1:])) if hop in closed_hops])
+    merged = []
+    for i, j in spans:
+        if merged and i < merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], j)
+        else:
+            merged.append([i, j])
+    return [(max(i, 0), min(j, len(route) - 1), i < 0 or j > len(route) - 1) for i, j in merged]
+
+def closure_impact(closure):
+    """Trains and confirmed bookings a closure hits, with detours around it.
+
+    Affected trains come from the station/hop inverted indexes, and their
+    bookings from the trainId postings. A booking's date is the day its
+    train departs, so a train running past midnight meets the closure on
+    bookings for earlier dates too; a booking counts only if the train is
+    on its journey's blocked stops on a date the closure window covers.
+    Everything needed is copied under the read
+    lock; detours are then searched on the route graph outside it,
+    avoiding this closure and every other one in force, with one search
+    per distinct (from, to) span shared by all trains that need it. Only
+    spans this closure blocks are reported.
+    """
+    targets = closure_targets(closure)
+    dates = closure_dates(closure)
+    with store.reading():
+        index = store.index
+        train_ids = set()
+        for kind, target in targets:
+            postings = index.station_trains if kind == 'station' else index.hop_trains
+            train_ids |= postings.get(target, set())
+        trains = []
+        for train_id in sorted(train_ids):
+            train = index.trains.get(train_id)
+            if train is None:
+                continue
+            route = list(train['route'])
+            hops = [index.find_track(a, b) for a, b in zip(route, route[1:])]
+            days = stop_days(train)
+            bookings = []
+            if dates is not None and route:
+                earliest = shift_date(dates[0], -days[-1])
+                for booking_id in index.booking_postings['trainId'].get(train_id, ()):
+                    booking = index.bookings[booking_id]
+                    date = booking.get('date')
+                    if booking.get('status') == 'confirmed' and isinstance(date, str) and earliest <= date <= dates[1]:
+                        bookings.append({k: booking.get(k) for k in
+                                         ('bookingId', 'date', 'from', 'to', 'class', 'passengerCount')})
+            trains.append((train_id, train.get('name'), route,
+                           [float(t['distance']) if t else 0.0 for t in hops], days, bookings))
+        graph = get_route_graph('distance')
+        closed_nodes, closed_edges = graph.closed_sets(store.closures)
+        closed_stations = store.closures.closed_stations()
+        closed_hops = store.closures.closed_edges()
+
+    # This closure may be scheduled rather than in force yet
+    position = graph.position
+    own_stations = {target for kind, target in targets if kind == 'station'}
+    own_hops = {target for kind, target in targets if kind == 'track'}
+    for kind, target in targets:
+        if kind == 'station':
+            closed_stations.add(target)
+            if target in position:
+                closed_nodes.add(position[target])
+        else:
+            closed_hops.add(target)
+            if target[0] in position and target[1] in position:
+                closed_edges.add((position[target[0]], position[target[1]]))
+
+    detours = {}  # (from, to) -> (cost, path) or None
+
+    def detour(source, target):
+        if (source, target) not in detours:
+            found = None
+            if source in position and target in position:
+                found = graph.shortest_path(position[source], position[target], closed_nodes, closed_edges)
+            detours[source, target] = found and (found[0], [graph.ids[n] for n in found[1]])
+        return detours[source, target]
+
+    affected_trains = []
+    affected_bookings = []
+    booking_count = 0
+    for train_id, name, route, distances, days, bookings in trains:
+        spans = []
+        for i, j, clipped in blocked_segments(route, closed_stations, closed_hops):
+            # Stops of the span where this closure blocks the station or the hop onwards
+            own = ([k for k in range(i, j + 1) if route[k] in own_stations] +
+                   [k for k in range(i, j) if (route[k], route[k + 1]) in own_hops])
+            if not own:
+                continue  # blocked by another closure only
+            span = {"from": route[i], "to": route[j], "replaces": route[i:j + 1],
+                    "distance": round(sum(distances[i:j]), 2)}
+            found = None if clipped or i == j else detour(route[i], route[j])
+            if clipped:
+                span.update(status="terminus_closed", detour=None)
+            elif found is None:
+                span.update(status="no_detour", detour=None)
+            else:
+                span.update(status="rerouted", detour=found[1], detourDistance=round(found[0], 2),
+                            extraDistance=round(found[0] - span['distance'], 2))
+            spans.append((i, j, own, span))
+        if not spans:
+            continue
+        statuses = {span['status'] for _, _, _, span in spans}
+        affected_trains.append({
+            "trainId": train_id,
+            "name": name,
+            "status": "rerouted" if statuses == {"rerouted"} else "disrupted",
+            "segments": [span for _, _, _, span in spans]
+        })
+
+        stops = {s: k for k, s in reversed(list(enumerate(route)))}
+        # Per day offset, the departure dates whose train is at such a stop within the closure's dates
+        windows = {} if not bookings else {
+            day: (shift_date(dates[0], -day), shift_date(dates[1], -day)) for day in set(days)}
+        for booking in bookings:
+            i, j = stops.get(booking['from']), stops.get(booking['to'])
+            if i is None or j is None:
+                continue
+            met = {day for day, (first, last) in windows.items() if first <= booking['date'] <= last}
+            if any(route[k] in own_stations and days[k] in met for k in (i, j)):
+                impact = "station_closed"
+            else:
+                hit = [span for a, b, own, span in spans if a < j and b > i and any(days[k] in met for k in own)]
+                if not hit:
+                    continue
+                impact = "rerouted" if all(span['status'] == "rerouted" for span in hit) else "no_detour"
+            booking_count += 1
+            if len(affected_bookings) < IMPACT_BOOKING_LIMIT:
+                affected_bookings.append(dict(booking, trainId=train_id, impact=impact))
+
+    return {
+        "closureId": closure.get('id'),
+        "type": closure_kind(closure),
+        "targets": [target for _, target in targets],
+        "dates": list(dates) if dates else None,
+        "affectedTrains": len(affected_trains),
+        "affectedBookings": booking_count,
+        "trains": affected_trains,
+        "bookings": affected_bookings,
+        "bookingsTruncated": booking_count > len(affected_bookings)
+    }
+
+class ImpactJobs:
+    """Closure-impact analyses run on a small thread pool.
+
+    submit() only records and queues the job, so the closure POST does
+    not wait for it. Each state change is also written to IMPACT_JOB_DIR,
+    so a status poll answered by another worker process finds the job;
+    the newest IMPACT_JOB_KEEP are kept.
+    """
+
+    def __init__(self, workers=IMPACT_WORKERS, directory=IMPACT_JOB_DIR):
+        self.workers = workers
+        self.directory = directory
+        self.jobs = {}  # job id -> job, oldest first
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, closure):
+        job = {"id": f"impact_{closure['id']}", "closureId": closure['id'], "state": "queued",
+               "createdAt": datetime.now().isoformat()}
+        with self._lock:
+            self.jobs[job['id']] = job
+            while len(self.jobs) > IMPACT_JOB_KEEP:
+                del self.jobs[next(iter(self.jobs))]
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='closure-impact')
+            executor = self._executor
+        self._publish(job)
+        executor.submit(self._run, job, dict(closure))
+        return dict(job)
+
+    def _run(self, job, closure):
+        self._update(job, state="running", startedAt=datetime.now().isoformat())
+        try:
+            result = closure_impact(closure)
+        except Exception as e:
+            self._update(job, state="failed", error=str(e), finishedAt=datetime.now().isoformat())
+        else:
+            self._update(job, state="done", result=result, finishedAt=datetime.now().isoformat())
+
+    def _update(self, job, **changes):
+        with self._lock:
+            job.update(changes)
+        self._publish(job)
+
+    def get(self, job_id):
+        """The job as last published, from memory or from disk; None if unknown"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        try:
+            with open(os.path.join(self.directory, f"{job_id}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _publish(self, job):
+        with self._lock:
+            text = json.dumps(job)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.job.', suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                f.write(text)
+            os.replace(tmp_path, os.path.join(self.directory, f"{job['id']}.json"))
+            if job['state'] == 'queued':
+                saved = sorted((entry for entry in os.scandir(self.directory) if entry.name.endswith('.json')),
+                               key=lambda entry: entry.stat().st_mtime)
+                for entry in saved[:-IMPACT_JOB_KEEP]:
+                    os.unlink(entry.path)
+        except OSError as e:
+            app.logger.warning("Could not publish job %s: %s", job['id'], e)
+
+impact_jobs = ImpactJobs()
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status (and, once done, the result) of a background job"""
+    if not job_id.replace('_', '').replace('-', '').isalnum():
+        return jsonify({"status": "error", "message": "Invalid job id"}), 400
+    job = impact_jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(job)
+
+# --------------------------
+# Spanning Tree
+# --------------------------
+
+class DisjointSet:
+    """Union-find with path halving and union by size"""
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def find(self, x):
+        parent = self.parent
+        if x not in parent:
+            parent[x] = x
+            self.size[x] = 1
+            return x
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return True
+
+class SpanningForest:
+    """Minimum spanning forest of the open track network, by distance.
+
+    Built once with Kruskal, then kept up to date from the index's edge
+    log and changes in the closed stations/tracks: a new or cheaper edge
+    replaces the heaviest edge on the tree path it closes, and a removed
+    tree edge is replaced by the cheapest edge across the cut, searched
+    from the smaller of the two halves.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._lock = threading.Lock()
+        self._index = None
+        self._log = None
+        self._log_offset = 0
+        self._closed_stations = set()
+        self._closed_edges = set()
+        self._network_version = None
+        self._result = None
+
+    def _reset(self):
+        self.weights = {}  # edge key -> distance of the cheapest open track
+        self.incident = defaultdict(set)  # station id -> open edge keys
+        self.tree = set()
+        self.tree_adj = defaultdict(set)  # station id -> neighbours in the forest
+        self.total = 0.0
+
+    def _edge_weight(self, key):
+        """Distance of the cheapest open track between the pair, or None"""
+        a, b = key
+        stations = self._index.stations
+        if a not in stations or b not in stations:
+            return None
+        if a in self._closed_stations or b in self._closed_stations:
+            return None
+        best = None
+        for track in self._index.edges.get(key, ()):
+            directions = [(track['source'], track['destination'])]
+            if track.get('bidirectional', False):
+                directions.append((track['destination'], track['source']))
+            if all(d in self._closed_edges for d in directions):
+                continue
+            distance = float(track.get('distance', 0))
+            if best is None or distance < best:
+                best = distance
+        return best
+
+    def sync(self, index, closures):
+        """Bring the forest in line with the index and closures; return the cached result"""
+        with self._lock:
+            closed_stations = closures.closed_stations()
+            closed_edges = closures.closed_edges()
+            if self._index is not index or self._log is not index.edge_log:
+                self._index = index
+                self._closed_stations, self._closed_edges = closed_stations, closed_edges
+                self._build()
+            else:
+                changed = set(index.edge_log[self._log_offset:])
+                for station in closed_stations ^ self._closed_stations:
+                    changed.update(index.station_edges.get(station, ()))
+                for a, b in closed_edges ^ self._closed_edges:
+                    changed.add(edge_key(a, b))
+                self._closed_stations, self._closed_edges = closed_stations, closed_edges
+                for key in changed:
+                    self._update(key, self._edge_weight(key))
+            self._log = index.edge_log
+            self._log_offset = len(index.edge_log)
+            if self._network_version != index.network_version:
+                # Station adds and removals change the component count but not the edge log
+                self._network_version = index.network_version
+                self.version += 1
+            if self._result is None or self._result['version'] != self.version:
+                self._result = self._snapshot()
+            return self._result
+
+    def _build(self):
+        self._reset()
+        for key in self._index.edges:
+            weight = self._edge_weight(key)
+            if weight is not None:
+                self.weights[key] = weight
+                self.incident[key[0]].add(key)
+                self.incident[key[1]].add(key)
+        components = DisjointSet()
+        for key in sorted(self.weights, key=lambda k: (self.weights[k], k)):
+            if components.union(*key):
+                self._link(key)
+        self.version += 1
+
+    def _link(self, key):
+        a, b = key
+        self.tree.add(key)
+        self.tree_adj[a].add(b)
+        self.tree_adj[b].add(a)
+        self.total += self.weights[key]
+
+    def _cut(self, key):
+        a, b = key
+        self.tree.discard(key)
+        self.tree_adj[a].discard(b)
+        self.tree_adj[b].discard(a)
+        self.total -= self.weights[key]
+
+    def _tree_path(self, a, b):
+        """Edge keys on the forest path from a to b, or None if not connected"""
+        previous = {a: None}
+        queue = deque([a])
+        while queue:
+            u = queue.popleft()
+            if u == b:
+                path = []
+                while previous[u] is not None:
+                    path.append(edge_key(u, previous[u]))
+                    u = previous[u]
+                return path
+            for v in self.tree_adj[u]:
+                if v not in previous:
+                    previous[v] = u
+                    queue.append(v)
+        return None
+
+    def _component(self, start, limit):
+        """Stations in start's tree, or None once more than ``limit`` are found"""
+        seen = {start}
+        stack = [start]
+        while stack:
+            for v in self.tree_adj[stack.pop()]:
+                if v not in seen:
+                    seen.add(v)
+                    if len(seen) > limit:
+                        return None
+                    stack.append(v)
+        return seen
+
+    def _update(self, key, weight):
+        old = self.weights.get(key)
+        if old == weight:
+            return
+        if old is not None:
+            self._delete(key)
+        if weight is not None:
+            self._insert(key, weight)
+        self.version += 1
+
+    def _insert(self, key, weight):
+        self.weights[key] = weight
+        self.incident[key[0]].add(key)
+        self.incident[key[1]].add(key)
+        path = self._tree_path(*key)
+        if path is None:
+            self._link(key)
+            return
+        heaviest = max(path, key=lambda k: (self.weights[k], k))
+        if (weight, key) < (self.weights[heaviest], heaviest):
+            self._cut(heaviest)
+            self._link(key)
+
+    def _delete(self, key):
+        a, b = key
+        in_tree = key in self.tree
+        if in_tree:
+            self._cut(key)
+        del self.weights[key]
+        self.incident[a].discard(key)
+        self.incident[b].discard(key)
+        if not in_tree:
+            return
+        # Walk both halves in step so the search stays on the smaller one
+        limit = 1
+        while True:
+            side = self._component(a, limit) or self._component(b, limit)
+            if side is not None:
+                break
+            limit *= 2
+        best = None
+        for station in side:
+            for candidate in self.incident[station]:
+                if candidate[0] in side and candidate[1] in side:
+                    continue
+                if best is None or (self.weights[candidate], candidate) < (self.weights[best], best):
+                    best = candidate
+        if best is not None:
+            self._link(best)
+
+    def _snapshot(self):
+        stations = [s for s in self._index.stations if s not in self._closed_stations]
+        edges = [{"source": a, "destination": b, "distance": self.weights[(a, b)]}
+                 for a, b in sorted(self.tree)]
+        components = len(stations) - len(self.tree)
+        return {
+            "status": "success",
+            "version": self.version,
+            "totalWeight": round(self.total, 6),
+            "edges": edges,
+            "components": components,
+            "connected": components <= 1,
+        }
+
+spanning_forest = SpanningForest()
+
+@app.route('/api/mst', methods=['GET'])
+def minimum_spanning_tree():
+    """Minimum spanning tree (forest, if the open network is split) by track distance"""
+    load_data()
+    return jsonify(spanning_forest.sync(store.index, store.closures))
+
+# --------------------------
+# Fare Engine
+# --------------------------
+
+FARE_QUANTUM = Decimal('0.01')
+FARE_BATCH_MAX = 10000
+
+def fare_amount(value):
+    """Exact Decimal for a fare factor or a stored/submitted fare; None if not a number"""
+    try:
+        amount = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None
+    return amount if amount.is_finite() else None
+
+class FareTable:
+    """One train's fares, cumulative along its route, per class.
+
+    ``cumulative[class][k]`` is the exact fare from the first stop to
+    stop k with the train-type factor applied and the quota factor not
+    yet, so a segment fare is one subtraction and one multiplication.
+    ``gaps[k]`` counts hops up to stop k that have no track.
+    """
+
+    __slots__ = ('stops', 'km', 'cumulative', 'gaps')
+
+    def __init__(self, stops, km, cumulative, gaps):
+        self.stops = stops  # station id -> first position on the route
+        self.km = km
+        self.cumulative = cumulative
+        self.gaps = gaps
+
+    def fare(self, i, j, class_type, quota_factor):
+        """Per-person fare from stop i to stop j, rounded to paise"""
+        fares = self.cumulative[class_type]
+        return ((fares[j] - fares[i]) * quota_factor).quantize(FARE_QUANTUM, rounding=ROUND_HALF_UP)
+
+class FareEngine:
+    """Server-side fares from FARE_CONFIG in exact decimal arithmetic.
+
+    The config factors are converted to Decimal once. A train's FareTable
+    is built the first time it is quoted and kept until trains or tracks
+    change, so quoting many segments of a train costs a few lookups each.
+    """
+
+    def __init__(self, config=FARE_CONFIG):
+        self.classes = {c: fare_amount(v) for c, v in config['baseFarePerKm'].items()}
+        self.train_factors = {t: fare_amount(v) for t, v in config['trainMultipliers'].items()}
+        self.quotas = {q: fare_amount(v) for q, v in config['quotaMultipliers'].items()}
+        self._tables = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def table(self, index, train):
+        version = (id(index), index.network_version, index.train_version)
+        with self._lock:
+            if version != self._version:
+                self._tables = {}
+                self._version = version
+            table = self._tables.get(train['id'])
+        if table is None:
+            table = self._build(index, train)
+            with self._lock:
+                if version == self._version:
+                    self._tables[train['id']] = table
+        return table
+
+    def _build(self, index, train):
+        route = train.get('route', [])
+        factor = self.train_factors.get(train.get('type'), self.train_factors['default'])
+        km = [Decimal(0)]
+        gaps = [0]
+        for source, destination in zip(route, route[1:]):
+            track = index.find_track(source, destination)
+            distance = fare_amount(track.get('distance', 0)) if track else None
+            km.append(km[-1] + (distance or 0))
+            gaps.append(gaps[-1] + (distance is None))
+        stops = {}
+        for k, station_id in enumerate(route):
+            stops.setdefault(station_id, k)
+        cumulative = {c: [d * rate * factor for d in km] for c, rate in self.classes.items()}
+        return FareTable(stops, km, cumulative, gaps)
+
+    def quote(self, index, train, source, destination, class_type, quota='general'):
+        """Return (per-person fare, distance, None) or (None, None, error message)"""
+        if class_type not in self.classes:
+            return None, None, "Invalid class"
+        if quota not in self.quotas:
+            return None, None, "Invalid quota"
+        table = self.table(index, train)
+        i = table.stops.get(source)
+        j = table.stops.get(destination)
+        if i is None or j is None or i >= j:
+            return None, None, "Train does not run between these stations"
+        if table.gaps[j] != table.gaps[i]:
+            return None, None, "No track on part of this journey"
+        return table.fare(i, j, class_type, self.quotas[quota]), table.km[j] - table.km[i], None
+
+fare_engine = FareEngine()
+
+@app.route('/api/fares', methods=['POST'])
+def quote_fares():
+    """Quote fares for many journeys: {"quotes": [{"trainId", "from", "to", "class", "quota", "passengerCount"}]}"""
+    load_data()
+    quotes = (request.get_json(silent=True) or {}).get('quotes')
+    if not isinstance(quotes, list) or not quotes:
+        return jsonify({"status": "error", "message": "Missing quotes"}), 400
+    if len(quotes) > FARE_BATCH_MAX:
+        return jsonify({"status": "error", "message": f"At most {FARE_BATCH_MAX} quotes per batch"}), 400
+
+    results = []
+    for query in quotes:
+        if not isinstance(query, dict):
+            results.append({"status": "error", "message": "Each quote must be an object"})
+            continue
+        line = {k: query.get(k) for k in ('trainId', 'from', 'to')}
+        line['class'] = query.get('class', 'sleeper')
+        line['quota'] = query.get('quota', 'general')
+        train = store.index.trains.get(line['trainId'])
+        if train is None:
+            results.append(dict(line, status="error", message="Train not found"))
+            continue
+        try:
+            passengers = int(query.get('passengerCount', 1))
+        except (TypeError, ValueError):
+            passengers = 0
+        if passengers < 1:
+            results.append(dict(line, status="error", message="Invalid passenger count"))
+            continue
+        fare, distance, error = fare_engine.quote(store.index, train, line['from'], line['to'],
+                                                  line['class'], line['quota'])
+        if error:
+            results.append(dict(line, status="error", message=error))
+            continue
+        results.append(dict(line, status="success", passengerCount=passengers, distance=float(distance),
+                            farePerPerson=str(fare), fare=str(fare * passengers)))
+    return jsonify({"status": "success", "fares": results})
+
+# --------------------------
+# Train Search
+# --------------------------
+
+def parse_minutes(timing):
+    """Convert an "HH:MM" timing to minutes since midnight"""
+    hours, minutes = timing.split(':')
+    return int(hours) * 60 + int(minutes)
+
+def rolling_minutes(timings, count):
+    """Minutes from midnight of the departure day for each of ``count`` stops.
+
+    A timing earlier than the one before it means the train ran past
+    midnight. Unreadable timings repeat the previous stop's time; stops
+    past the end of the timings are TIMING_UNKNOWN.
+    """
+    minutes = [TIMING_UNKNOWN] * count
+    day = 0
+    last = None
+    for k, timing in enumerate(timings[:count]):
+        try:
+            value = parse_minutes(timing)
+        except (AttributeError, ValueError):
+            value = last - day * 1440 if last is not None else 0
+        if last is not None and value + day * 1440 < last:
+            day += 1
+        last = minutes[k] = value + day * 1440
+    return minutes
+
+def format_duration(minutes):
+    return f"{minutes // 60}h {minutes % 60}m"
+
+TIMETABLE_MAGIC = b'RAILTT01'
+TIMING_UNKNOWN = -1  # stop_minutes value for stops past the end of a train's timings
+
+class TimetableTrain:
+    """One train's slice of the Timetable columns"""
+
+    __slots__ = ('number', 'id', 'start', 'stop')
+
+    def __init__(self, number, train_id, start, stop):
+        self.number = number
+        self.id = train_id
+        self.start = start  # first flat stop position
+        self.stop = stop  # one past the last
+
+    def __len__(self):
+        return self.stop - self.start
+
+class Timetable:
+    """Train routes and timings as flat, typed columns.
+
+    Station ids are interned to small ints. Stop k of train t sits at
+    flat position ``trains[t].start + k`` of every stop_* column:
+    stop_station, stop_train, stop_minutes (since midnight of the
+    departure day, rolling over past midnight), stop_distance (cumulative
+    track km) and stop_missing (running count of hops without a track).
+    Segment distance, duration and "is every hop on a track" are then
+    subtractions. station_offsets/station_stops list the stops at each
+    station in flat order.
+
+    With NumPy the columns are ndarrays and search() is vectorised;
+    without it they are arrays and search() loops. save()/load() keep a
+    binary snapshot that load() memory-maps instead of parsing.
+    """
+
+    COLUMNS = (
+        ('train_offsets', 'q'),
+        ('stop_station', 'i'),
+        ('stop_train', 'i'),
+        ('stop_minutes', 'i'),
+        ('stop_distance', 'd'),
+        ('stop_missing', 'i'),
+        ('station_offsets', 'q'),
+        ('station_stops', 'q')
+    )
+
+    __slots__ = ('station_ids', 'station_index', 'trains', 'train_index', '_mmap', '_lists') + \
+        tuple(n for n, _ in COLUMNS)
+
+    def __init__(self, station_ids, train_ids, columns, mm=None):
+        self.station_ids = station_ids
+        self.station_index = {s: n for n, s in enumerate(station_ids)}
+        self._mmap = mm
+        self._lists = None
+        for name, typecode in self.COLUMNS:
+            column = columns[name]
+            if np is not None and not isinstance(column, np.ndarray):
+                column = np.frombuffer(column, dtype=typecode) if len(column) else np.zeros(0, dtype=typecode)
+            setattr(self, name, column)
+        offsets = [int(o) for o in self.train_offsets]
+        self.trains = [TimetableTrain(n, train_id, offsets[n], offsets[n + 1])
+                       for n, train_id in enumerate(train_ids)]
+        self.train_index = {t.id: t for t in self.trains}
+
+    @classmethod
+    def build(cls, index):
+        """Parse every train's route and timings once"""
+        station_ids = sorted(index.stations)
+        interned = {s: n for n, s in enumerate(station_ids)}
+        train_ids = []
+        columns = {name: array(typecode) for name, typecode in cls.COLUMNS}
+        train_offsets = columns['train_offsets']
+        train_offsets.append(0)
+        stop_station, stop_train = columns['stop_station'], columns['stop_train']
+        stop_minutes, stop_distance, stop_missing = columns['stop_minutes'], columns['stop_distance'], columns['stop_missing']
+
+        find_track = index.find_track
+        for train in index.trains.values():
+            route = train.get('route', [])
+            timings = train.get('timings', [])
+            number = len(train_ids)
+            train_ids.append(train['id'])
+            for station_id in route:
+                if station_id not in interned:
+                    interned[station_id] = len(station_ids)
+                    station_ids.append(station_id)
+            stop_station.extend([interned[s] for s in route])
+            stop_train.extend([number] * len(route))
+
+            distances = [0.0] * len(route)
+            missing = [0] * len(route)
+            for k in range(1, len(route)):
+                track = find_track(route[k - 1], route[k])
+                distances[k] = distances[k - 1] + (track['distance'] if track else 0.0)
+                missing[k] = missing[k - 1] + (0 if track else 1)
+            stop_distance.extend(distances)
+            stop_missing.extend(missing)
+
+            stop_minutes.extend(rolling_minutes(timings, len(route)))
+            train_offsets.append(len(stop_station))
+
+        # Counting sort of stops by station keeps each station's stops in flat order
+        station_offsets = columns['station_offsets']
+        station_offsets.extend([0] * (len(station_ids) + 1))
+        for station in stop_station:
+            station_offsets[station + 1] += 1
+        for n in range(len(station_ids)):
+            station_offsets[n + 1] += station_offsets[n]
+        fill = array('q', station_offsets[:-1])
+        station_stops = columns['station_stops']
+        station_stops.extend([0] * len(stop_station))
+        for position, station in enumerate(stop_station):
+            station_stops[fill[station]] = position
+            fill[station] += 1
+        return cls(station_ids, train_ids, columns)
+
+    def lists(self):
+        """The columns journey planning scans, as lists (NumPy scalars are slow one at a time)"""
+        if self._lists is None:
+            self._lists = tuple(list(getattr(self, name)) if np is None else getattr(self, name).tolist()
+                                for name in ('stop_station', 'stop_train', 'stop_minutes', 'stop_missing',
+                                             'train_offsets', 'station_offsets', 'station_stops'))
+        return self._lists
+
+    def stops_at(self, station_id):
+        """Flat positions of every stop at a station"""
+        n = self.station_index.get(station_id)
+        if n is None:
+            return self.station_stops[:0]
+        return self.station_stops[self.station_offsets[n]:self.station_offsets[n + 1]]
+
+    def search(self, source, destination):
+        """Return (train number, from position, to position, distance, minutes) for direct trains"""
+        from_stops = self.stops_at(source)
+        to_stops = self.stops_at(destination)
+        if np is not None:
+            return self._search_vectorised(from_stops, to_stops)
+
+        # First stop of each train at either station, as in the route lists
+        first_from = {}
+        for position in from_stops:
+            first_from.setdefault(self.stop_train[position], position)
+        first_to = {}
+        for position in to_stops:
+            first_to.setdefault(self.stop_train[position], position)
+        results = []
+        for number, i in first_from.items():
+            j = first_to.get(number)
+            if j is None or i >= j or self.stop_missing[j] != self.stop_missing[i]:
+                continue
+            duration = self.stop_minutes[j] - self.stop_minutes[i] if self.stop_minutes[j] != TIMING_UNKNOWN else 0
+            start = self.trains[number].start
+            results.append((number, i - start, j - start,
+                            self.stop_distance[j] - self.stop_distance[i], duration))
+        return results
+
+    def _search_vectorised(self, from_stops, to_stops):
+        from_trains, first = np.unique(self.stop_train[from_stops], return_index=True)
+        from_stops = from_stops[first]
+        to_trains, first = np.unique(self.stop_train[to_stops], return_index=True)
+        to_stops = to_stops[first]
+        numbers, a, b = np.intersect1d(from_trains, to_trains, assume_unique=True, return_indices=True)
+        i, j = from_stops[a], to_stops[b]
+        usable = (i < j) & (self.stop_missing[i] == self.stop_missing[j])
+        numbers, i, j = numbers[usable], i[usable], j[usable]
+        distance = self.stop_distance[j] - self.stop_distance[i]
+        arrival = self.stop_minutes[j]
+        duration = np.where(arrival != TIMING_UNKNOWN, arrival - self.stop_minutes[i], 0)
+        start = self.train_offsets[numbers]
+        return list(zip(numbers.tolist(), (i - start).tolist(), (j - start).tolist(),
+                        distance.tolist(), duration.tolist()))
+
+    def save(self, path, fingerprint):
+        """Write a binary snapshot: magic, header length, JSON header, 8-byte aligned columns"""
+        layout = []
+        offset = 0
+        for name, typecode in self.COLUMNS:
+            column = getattr(self, name)
+            size = len(column) * array(typecode).itemsize
+            layout.append([name, typecode, offset, len(column)])
+            offset += (size + 7) // 8 * 8
+        header = json.dumps({
+            'fingerprint': fingerprint,
+            'stations': self.station_ids,
+            'trains': [t.id for t in self.trains],
+            'columns': layout
+        }).encode()
+        header += b' ' * (-(len(TIMETABLE_MAGIC) + 8 + len(header)) % 8)
+        directory = os.path.dirname(path) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.timetable.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(TIMETABLE_MAGIC + len(header).to_bytes(8, 'little') + header)
+                for name, typecode in self.COLUMNS:
+                    data = bytes(getattr(self, name))
+                    f.write(data + b'\0' * (-len(data) % 8))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        """Memory-map a snapshot written by save(); None if missing or for other data"""
+        try:
+            with open(path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if mm[:len(TIMETABLE_MAGIC)] != TIMETABLE_MAGIC:
+            mm.close()
+            return None
+        start = len(TIMETABLE_MAGIC) + 8
+        length = int.from_bytes(mm[len(TIMETABLE_MAGIC):start], 'little')
+        header = json.loads(mm[start:start + length])
+        if header['fingerprint'] != json.loads(json.dumps(fingerprint)):
+            mm.close()
+            return None
+        base = start + length
+        view = memoryview(mm)
+        columns = {}
+        for name, typecode, offset, count in header['columns']:
+            if np is not None:
+                columns[name] = np.frombuffer(mm, dtype=typecode, count=count, offset=base + offset)
+            else:
+                size = array(typecode).itemsize
+                columns[name] = view[base + offset:base + offset + count * size].cast(typecode)
+        return cls(header['stations'], header['trains'], columns, mm)
+
+_timetable = None  # (index version, Timetable, store fingerprint it was built from)
+_timetable_saved = None  # fingerprint of the snapshot this process last loaded or wrote
+_timetable_lock = threading.Lock()
+
+def get_timetable():
+    """Return the Timetable, rebuilding it after train/track/station changes.
+
+    A fresh process whose data matches TIMETABLE_SNAPSHOT maps it instead
+    of rebuilding. Rebuilds stay in memory; the snapshot is only written
+    by save_timetable_snapshot(), so writes never pay for it.
+    """
+    global _timetable, _timetable_saved
+    index = store.index
+    version = (id(index), index.network_version, index.train_version)
+    cached = _timetable
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _timetable_lock:
+        if _timetable is not None and _timetable[0] == version:
+            return _timetable[1]
+        fingerprint = store.fingerprint()
+        timetable = None
+        if _timetable is None and len(index.trains) >= TIMETABLE_SNAPSHOT_MIN_TRAINS:
+            timetable = Timetable.load(TIMETABLE_SNAPSHOT, fingerprint)
+            if timetable is not None:
+                _timetable_saved = fingerprint
+        if timetable is None:
+            timetable = Timetable.build(index)
+        if _timetable is None:
+            atexit.register(save_timetable_at_exit)
+        _timetable = (version, timetable, fingerprint)
+        return timetable
+
+def save_timetable_snapshot():
+    """Write the timetable snapshot if this process holds a large one newer than the file; True if written"""
+    global _timetable_saved
+    with _timetable_lock:
+        if _timetable is None:
+            return False
+        _, timetable, fingerprint = _timetable
+        if len(timetable.trains) < TIMETABLE_SNAPSHOT_MIN_TRAINS or fingerprint == _timetable_saved:
+            return False
+        timetable.save(TIMETABLE_SNAPSHOT, fingerprint)
+        _timetable_saved = fingerprint
+        return True
+
+def save_timetable_at_exit():
+    try:
+        save_timetable_snapshot()
+    except OSError as e:
+        app.logger.warning("Could not write timetable snapshot: %s", e)
+
+@app.route('/api/search', methods=['GET'])
+def search_trains():
+    """Direct trains between two stations with distance, duration and fare"""
+    load_data()
+    source = request.args.get('from')
+    destination = request.args.get('to')
+    date = request.args.get('date')
+    class_type = request.args.get('class', 'sleeper')
+    quota = request.args.get('quota', 'general')
+    sort_by = request.args.get('sort', 'time')
+
+    if not source or not destination:
+        return jsonify({"status": "error", "message": "Please select From and To stations"}), 400
+    if source not in store.index.stations or destination not in store.index.stations:
+        return jsonify({"status": "error", "message": "Invalid station selection"}), 400
+    if date:
+        try:
+            datetime.strptime(date, '%Y-%m-%d')
+        except ValueError:
+            return jsonify({"status": "error", "message": "Invalid travel date"}), 400
+    if class_type not in FARE_CONFIG['baseFarePerKm'] or quota not in FARE_CONFIG['quotaMultipliers']:
+        return jsonify({"status": "error", "message": "Invalid class or quota"}), 400
+
+    stations = store.index.stations
+    results = []
+    timetable = get_timetable()
+    quota_factor = fare_engine.quotas[quota]
+    for number, i, j, distance, duration in timetable.search(source, destination):
+        train = store.index.trains[timetable.trains[number].id]
+        route = train['route'][i:j + 1]
+        timings = train.get('timings', [])
+        results.append({
+            'availableSeats': store.inventory.available(train, date, class_type, i, j) if date else None,
+            'id': train['id'],
+            'name': train.get('name'),
+            'type': train.get('type') or 'Express',
+            'speed': train.get('speed') or 80,
+            'departureTime': timings[i] if i < len(timings) else None,
+            'arrivalTime': timings[j] if j < len(timings) else None,
+            'duration': format_duration(duration),
+            'durationMinutes': duration,
+            'distance': round(distance, 2),
+            'fare': float(fare_engine.table(store.index, train).fare(i, j, class_type, quota_factor)),
+            'route': route,
+            'routeStations': [stations[s]['name'] if s in stations else s for s in route],
+            'timings': timings[i:j + 1]
+        })
+
+    if sort_by == 'fare':
+        results.sort(key=lambda r: r['fare'])
+    else:
+        results.sort(key=lambda r: r['durationMinutes'])
+    return jsonify(results)
+
+@app.route('/api/availability', methods=['GET'])
+def get_availability():
+    """Free seats on a train for one date, class and segment"""
+    load_data()
+    train = store.index.trains.get(request.args.get('trainId'))
+    date = request.args.get('date')
+    class_type = request.args.get('class', 'sleeper')
+    if not train or not date:
+        return jsonify({"status": "error", "message": "Missing or unknown trainId/date"}), 400
+    route = train.get('route', [])
+    source = request.args.get('from', route[0] if route else None)
+    destination = request.args.get('to', route[-1] if route else None)
+    segment = store.inventory.segment(train, source, destination)
+    if segment is None:
+        return jsonify({"status": "error", "message": "Train does not run between these stations"}), 400
+    return jsonify({
+        "trainId": train['id'],
+        "date": date,
+        "class": class_type,
+        "from": source,
+        "to": destination,
+        "capacity": store.inventory.capacity(train, class_type),
+        "available": store.inventory.available(train, date, class_type, *segment)
+    })
+
+# --------------------------
+# Journey Planning
+# --------------------------
+
+MIN_TRANSFER_MINUTES = 15  # default change time; a station's 'minTransferMinutes' overrides it
+JOURNEY_MAX_TRANSFERS = 5
+
+def plan_journeys(timetable, source, target, departure, max_transfers=3, min_transfer=MIN_TRANSFER_MINUTES,
+                  transfer_times=None):
+    """RAPTOR over daily-running trains.
+
+    ``departure`` is in minutes from midnight of the travel date. Round k
+    finds the earliest arrival at every station using k trains; a train
+    can be boarded on any day (stop time + 1440 * day), so overnight
+    services and trains that set off the day before are both caught.
+    Returns the Pareto set of (arrival, trains used) as lists of legs
+    (train number, board position, alight position, departure, arrival).
+    """
+    source_n = timetable.station_index.get(source)
+    target_n = timetable.station_index.get(target)
+    if source_n is None or target_n is None or source_n == target_n:
+        return []
+    stop_station, stop_train, stop_minutes, stop_missing, train_offsets, station_offsets, station_stops = \
+        timetable.lists()
+    transfer_times = transfer_times or {}
+
+    arrival = [{source_n: departure}]  # round -> station -> earliest arrival
+    parents = [{}]  # round -> station -> leg that reached it
+    best = {source_n: departure}
+    marked = {source_n}
+    journeys = []
+    for round_number in range(1, max_transfers + 2):
+        previous = arrival[-1]
+        current = dict(previous)
+        parent = {}
+
+        # Earliest marked stop on each train
+        first_stop = {}
+        for station in marked:
+            for k in range(station_offsets[station], station_offsets[station + 1]):
+                position = station_stops[k]
+                train = stop_train[position]
+                if position < first_stop.get(train, float('inf')):
+                    first_stop[train] = position
+
+        marked = set()
+        for train, start in first_stop.items():
+            end = train_offsets[train + 1]
+            day = None  # running day offset of the trip we are on
+            board = None
+            for position in range(start, end):
+                minutes = stop_minutes[position]
+                if minutes == TIMING_UNKNOWN:
+                    break  # no timings from here on
+                station = stop_station[position]
+                if board is not None and stop_missing[position] != stop_missing[board]:
+                    day = board = None  # a hop without track: this train cannot be ridden through
+                if day is not None:
+                    arrive = minutes + 1440 * day
+                    if arrive < best.get(station, float('inf')) and arrive < best.get(target_n, float('inf')):
+                        current[station] = best[station] = arrive
+                        parent[station] = (train, board, position, stop_minutes[board] + 1440 * day, arrive)
+                        marked.add(station)
+                ready = previous.get(station)
+                if ready is None:
+                    continue
+                if station != source_n:
+                    ready += transfer_times.get(station, min_transfer)
+                catch = -((minutes - ready) // 1440)  # first day whose departure is not before ready
+                if day is None or catch < day:
+                    day = catch
+                    board = position
+
+        arrival.append(current)
+        parents.append(parent)
+        if target_n in parent:
+            journeys.append(journey_legs(parents, round_number, target_n, stop_station))
+        if not marked:
+            break
+    return journeys
+
+def journey_legs(parents, round_number, station, stop_station):
+    """Walk the RAPTOR parent pointers back from ``station`` into legs"""
+    legs = []
+    while round_number > 0:
+        while station not in parents[round_number]:
+            round_number -= 1  # reached earlier and carried over
+        leg = parents[round_number][station]
+        legs.append(leg)
+        station = stop_station[leg[1]]
+        round_number -= 1
+    legs.reverse()
+    return legs
+
+def format_journey_time(date, minutes):
+    """ISO timestamp for minutes after midnight of ``date``"""
+    return (date + timedelta(minutes=minutes)).isoformat(timespec='minutes')
+
+@app.route('/api/journeys', methods=['GET'])
+def find_journeys():
+    """Itineraries with changes between two stations, Pareto-optimal by arrival time and transfers"""
+    load_data()
+    source = request.args.get('from')
+    destination = request.args.get('to')
+    if not source or not destination:
+        return jsonify({"status": "error", "message": "Missing from or to"}), 400
+    stations = store.index.stations
+    if source not in stations or destination not in stations:
+        return jsonify({"status": "error", "message": "Station not found"}), 400
+    try:
+        date = datetime.strptime(request.args.get('date') or datetime.now().strftime('%Y-%m-%d'), '%Y-%m-%d')
+        departure = parse_minutes(request.args.get('time', '00:00'))
+        max_transfers = int(request.args.get('maxTransfers', 3))
+        min_transfer = int(request.args.get('minTransfer', MIN_TRANSFER_MINUTES))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid date, time, maxTransfers or minTransfer"}), 400
+    if not 0 <= max_transfers <= JOURNEY_MAX_TRANSFERS or min_transfer < 0:
+        return jsonify({
+            "status": "error",
+            "message": f"maxTransfers must be between 0 and {JOURNEY_MAX_TRANSFERS} and minTransfer not negative"
+        }), 400
+
+    timetable = get_timetable()
+    transfer_times = {timetable.station_index[s]: int(station['minTransferMinutes'])
+                      for s, station in stations.items()
+                      if 'minTransferMinutes' in station and s in timetable.station_index}
+    stop_station = timetable.lists()[0]
+    journeys = []
+    for legs in plan_journeys(timetable, source, destination, departure, max_transfers, min_transfer,
+                              transfer_times):
+        items = []
+        for number, board, alight, departs, arrives in legs:
+            slot = timetable.trains[number]
+            train = store.index.trains[slot.id]
+            from_id = timetable.station_ids[stop_station[board]]
+            to_id = timetable.station_ids[stop_station[alight]]
+            items.append({
+                "trainId": slot.id,
+                "trainName": train.get('name'),
+                "from": from_id,
+                "fromName": stations[from_id]['name'] if from_id in stations else from_id,
+                "to": to_id,
+                "toName": stations[to_id]['name'] if to_id in stations else to_id,
+                "departure": format_journey_time(date, departs),
+                "arrival": format_journey_time(date, arrives),
+                "stops": alight - board,
+                "durationMinutes": arrives - departs
+            })
+        first_departs, arrives = legs[0][3], legs[-1][4]
+        journeys.append({
+            "departure": format_journey_time(date, first_departs),
+            "arrival": format_journey_time(date, arrives),
+            "durationMinutes": arrives - first_departs,
+            "transfers": len(legs) - 1,
+            "legs": items
+        })
+    return jsonify({"status": "success", "from": source, "to": destination, "journeys": journeys})
+
 # --------------------------
 # Utility Endpoints
 # --------------------------
@@ -593,5 +4853,56 @@ def update_train(train_id):
 def check_login():
     return jsonify({'logged_in': True})
 
+def migrate(json_path=DATA_FILE, sqlite_path=SQLITE_FILE):
+    """One-shot import of the JSON snapshot (and its pending journal) into SQLite"""
+    journal_path = JOURNAL_FILE if json_path == DATA_FILE else json_path + '.journal'
+    source = JsonRepository(json_path, Journal(journal_path, 'none'))
+    data, _ = source.load()
+    target = SqliteRepository(sqlite_path, 'always')
+    try:
+        target.write(data)
+    finally:
+        target.close()
+    return {name: len(data.get(name, [])) for name in RECORD_KEYS}
+
+def main(argv):
+    """Command line entry point.
+
+    Without arguments this runs the development server; ``diff [old] [new]``
+    compares two data files, ``import <file> [type]`` bulk-loads NDJSON or
+    CSV records, ``migrate [json] [db]`` imports the JSON data into SQLite
+    and ``snapshot`` writes the timetable snapshot for the current data.
+    """
+    if argv[:1] == ['import']:
+        if len(argv) < 2:
+            print("usage: python x.py import <file.ndjson|file.csv> [stations|tracks|trains]")
+            return
+        fmt = 'csv' if argv[1].endswith('.csv') else 'ndjson'
+        with store.writing(), open(argv[1], newline='') as f:
+            importer = BulkImport().run(read_bulk_records(f, fmt, argv[2] if len(argv) > 2 else None))
+        json.dump(importer.report(), sys.stdout, indent=2)
+        print()
+        return
+    if argv[:1] == ['migrate']:
+        counts = migrate(*argv[1:3])
+        print(', '.join(f"{count} {name}" for name, count in counts.items()))
+        return
+    if argv[:1] == ['snapshot']:
+        with store.reading():
+            get_timetable()
+            written = save_timetable_snapshot()
+        print(f"Wrote {TIMETABLE_SNAPSHOT}" if written else "Timetable snapshot is up to date or not needed")
+        return
+    if argv[:1] == ['diff']:
+        paths = argv[1:] + ['data/temp.json', DATA_FILE][len(argv) - 1:]
+        with open(paths[0]) as f:
+            old = json.load(f)
+        with open(paths[1]) as f:
+            new = json.load(f)
+        json.dump(diff_data(old, new), sys.stdout, indent=2)
+        print()
+        return
+    app.run(debug=True, port=5000)
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    main(sys.argv[1:])
\ No newline at end of file